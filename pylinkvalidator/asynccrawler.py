@@ -0,0 +1,527 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the asyncio crawling logic.
+
+This module requires Python 3.5+ and is only imported when the async mode is
+selected. It only depends on the standard library: fetches are performed by a
+minimal HTTP/1.1 client built on asyncio streams so thousands of requests can
+be in flight in a single event loop without monkey patching.
+"""
+from __future__ import unicode_literals, absolute_import
+
+import asyncio
+from collections import defaultdict
+from io import BytesIO
+import http.client
+import ssl
+import time
+
+from pylinkvalidator.compat import HTTPError, urlparse, get_content_type
+from pylinkvalidator.connection import MAX_DRAIN_SIZE
+from pylinkvalidator.crawler import (
+    SiteCrawler, PageCrawler, WORK_DONE, HEAD_FALLBACK_STATUSES,
+    RANGE_HEADERS, RANGE_FALLBACK_STATUSES, parse_page)
+from pylinkvalidator.models import WorkerInit, Response
+
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+MAX_REDIRECTS = 10
+
+DEFAULT_PORTS = {
+    "http": 80,
+    "https": 443,
+}
+
+USER_AGENT = "pylinkvalidator"
+
+
+class BufferedContent(object):
+    """File-like response content with the subset of the urlopen response
+    interface used by the PageCrawler."""
+
+    def __init__(self, body, message, url, status):
+        self._body = BytesIO(body)
+        self.message = message
+        self.url = url
+        self.status = status
+
+    def read(self, *args):
+        return self._body.read(*args)
+
+    def info(self):
+        return self.message
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.status
+
+    def close(self):
+        self._body.close()
+
+
+class AsyncConnectionPool(object):
+    """Pool of idle keep-alive connections (StreamReader and StreamWriter)
+    keyed by (scheme, host, port), like ConnectionPool for the asyncio HTTP
+    client.
+
+    The pool is not thread-safe: each worker coroutine has its own pool.
+    """
+
+    def __init__(self, size, idle_timeout, allow_insecure_content=False):
+        self.size = size
+        """Maximum number of idle connections kept per host."""
+
+        self.idle_timeout = idle_timeout
+        """Idle connections older than this (in seconds) are closed."""
+
+        self.allow_insecure_content = allow_insecure_content
+        self.ssl_context = None
+
+        self.idle_connections = defaultdict(list)
+        """Map of (scheme, host, port):[(reader, writer, last used time)]"""
+
+        self.created = 0
+        self.reused = 0
+
+    async def get_connection(self, key):
+        """Returns an idle connection or a new one.
+
+        :rtype: A tuple (reader, writer, reused)
+        """
+        idle = self.idle_connections[key]
+        now = time.time()
+        while idle:
+            (reader, writer, last_used) = idle.pop()
+            if now - last_used > self.idle_timeout or reader.at_eof():
+                writer.close()
+                continue
+            self.reused += 1
+            return (reader, writer, True)
+
+        (scheme, host, port) = key
+        ssl_context = None
+        if scheme == "https":
+            if self.ssl_context is None:
+                self.ssl_context = get_ssl_context(
+                    self.allow_insecure_content)
+            ssl_context = self.ssl_context
+        (reader, writer) = await asyncio.open_connection(
+            host, port, ssl=ssl_context)
+        self.created += 1
+        return (reader, writer, False)
+
+    def release(self, key, reader, writer, reusable):
+        """Gives a connection back to the pool if it can be reused."""
+        idle = self.idle_connections[key]
+        if reusable and len(idle) < self.size:
+            idle.append((reader, writer, time.time()))
+        else:
+            writer.close()
+
+    def close(self):
+        """Closes all idle connections."""
+        for idle in self.idle_connections.values():
+            for (_, writer, _) in idle:
+                writer.close()
+        self.idle_connections.clear()
+
+
+class AsyncSiteCrawler(SiteCrawler):
+    """Site Crawler with asyncio workers running in a single event loop."""
+
+    def __init__(self, *args, **kwargs):
+        self.tasks = []
+        self.loop = asyncio.new_event_loop()
+        # Queues created before Python 3.10 are bound to the current loop.
+        asyncio.set_event_loop(self.loop)
+        super(AsyncSiteCrawler, self).__init__(*args, **kwargs)
+
+    def build_queue(self, config):
+        return asyncio.Queue()
+
+    def dispatch(self):
+        for message in self.get_dispatch_messages():
+            self.input_queue.put_nowait(message)
+
+    def get_workers(self, config, worker_init, worker_count=None):
+        return [AsyncPageCrawler(worker_init)
+                for _ in range(worker_count or config.worker_size)]
+
+    def start_workers(self, workers, input_queue, output_queue):
+        for worker in workers:
+            self.tasks.append(
+                self.loop.create_task(worker.crawl_page_forever()))
+
+    def crawl(self):
+        try:
+            return self.loop.run_until_complete(self._crawl())
+        finally:
+            asyncio.set_event_loop(None)
+            self.loop.close()
+
+    async def _crawl(self):
+        self.worker_init = WorkerInit(
+            self.config.worker_config, self.input_queue,
+            self.output_queue, self.build_logger(), self.config.content_check,
+            self.parse_pool)
+        self.workers = self.get_workers(self.config, self.worker_init)
+
+        self.queue_size = len(self.start_url_splits)
+        for worker_input in self.get_start_worker_inputs():
+            self.frontier.put(worker_input)
+
+        self.start_workers(self.workers, self.input_queue, self.output_queue)
+
+        self.start_progress()
+
+        while True:
+            self.dispatch()
+
+            try:
+                message = await asyncio.wait_for(
+                    self.output_queue.get(), self.get_wait_delay())
+            except asyncio.TimeoutError:
+                # A rate-limited host can be crawled again.
+                continue
+
+            self.process_message(message)
+
+            if self.queue_size <= 0:
+                self.stop_workers(self.workers, self.input_queue,
+                                  self.output_queue)
+                await asyncio.gather(*self.tasks)
+                self.stop_parse_pool()
+                self.stop_progress()
+                self.site.close()
+                return self.site
+
+            self.autoscale()
+
+    def stop_workers(self, workers, input_queue, output_queue):
+        for worker in workers:
+            input_queue.put_nowait(WORK_DONE)
+
+    def retire_workers(self, worker_count):
+        for _ in range(worker_count):
+            self.input_queue.put_nowait(WORK_DONE)
+
+
+class AsyncPageCrawler(PageCrawler):
+    """Worker coroutine that fetches pages with the asyncio HTTP client and
+    reuses the PageCrawler parsing logic."""
+
+    def __init__(self, worker_init):
+        super(AsyncPageCrawler, self).__init__(worker_init)
+        self.async_pool = AsyncConnectionPool(
+            self.worker_config.pool_size or 0,
+            self.worker_config.pool_idle_timeout or 0,
+            self.worker_config.allow_insecure_content)
+
+    async def crawl_page_forever(self):
+        """Starts page crawling loop for this worker."""
+
+        while True:
+            worker_input = await self.input_queue.get()
+
+            if worker_input == WORK_DONE:
+                self.async_pool.close()
+                return
+            elif isinstance(worker_input, list):
+                page_crawls = []
+                for single_input in worker_input:
+                    page_crawls.append(
+                        await self._crawl_page_async(single_input))
+                self.output_queue.put_nowait(page_crawls)
+            else:
+                page_crawl = await self._crawl_page_async(worker_input)
+                self.output_queue.put_nowait(page_crawl)
+
+    async def _crawl_page_async(self, worker_input):
+        try:
+            response = await self._open_page_async(worker_input)
+
+            if response.exception:
+                page_crawl = self.get_error_page_crawl(worker_input, response)
+            else:
+                parse_input = self.get_parse_input(worker_input, response)
+                if self.parse_pool and parse_input.content is not None:
+                    page_crawl = await self._parse_page_in_pool(parse_input)
+                else:
+                    page_crawl = self.parse_page(parse_input)
+        except Exception as exc:
+            page_crawl = self._get_exception_page_crawl(worker_input, exc)
+            self.logger.exception("Exception occurred while crawling a page.")
+
+        return page_crawl
+
+    async def _open_page_async(self, worker_input):
+        """Opens the URL of a WorkerInput like PageCrawler._open_page. Bodies
+        that are not needed are not downloaded."""
+        url = worker_input.url_split.geturl()
+
+        def read_body(message):
+            return self._needs_body(worker_input, get_content_type(message))
+
+        if self._should_use_head(worker_input):
+            response = await self._open_url_async(url, "HEAD")
+            if response.status not in HEAD_FALLBACK_STATUSES:
+                return response
+            # The server may ignore the range and send the whole body.
+            response = await self._open_url_async(
+                url, extra_headers=RANGE_HEADERS, read_body=read_body)
+            if response.status not in RANGE_FALLBACK_STATUSES:
+                return response
+
+        return await self._open_url_async(url, read_body=read_body)
+
+    def _open_url_async(self, url, method="GET", extra_headers=None,
+                        read_body=None):
+        headers = self.worker_config.extra_headers
+        if extra_headers:
+            headers = dict(headers or {})
+            headers.update(extra_headers)
+
+        return async_open_url(
+            url, self.worker_config.timeout, self.auth_header,
+            extra_headers=headers, logger=self.logger, method=method,
+            read_body=read_body, pool=self.async_pool)
+
+    def _parse_page_in_pool(self, parse_input):
+        """Returns a future resolved with the PageCrawl once the page is
+        parsed by the parse pool. Other workers keep fetching meanwhile."""
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self.parse_pool.apply_async(
+            parse_page, (parse_input,),
+            callback=lambda page_crawl: loop.call_soon_threadsafe(
+                future.set_result, page_crawl),
+            error_callback=lambda exc: loop.call_soon_threadsafe(
+                future.set_result, self._get_parse_error_page_crawl(
+                    parse_input.worker_input, exc)))
+        return future
+
+
+async def async_open_url(url, timeout, auth_header=None, extra_headers=None,
+                         logger=None, method="GET", read_body=None,
+                         pool=None):
+    """Opens a URL with the asyncio HTTP client and returns a Response object.
+
+    Redirects are followed. HTTP errors, timeouts and other exceptions are
+    reported in the Response like open_url does.
+
+    :param url: the url to open
+    :param timeout: number of seconds to wait before timing out
+    :param auth_header: authentication header
+    :param extra_headers: dict of {Header: Value}
+    :param logger: logger used to log exceptions
+    :param method: HTTP method
+    :param read_body: function receiving the headers of the final response
+            and returning False if the body must not be downloaded. The body
+            is always downloaded if None.
+    :param pool: the AsyncConnectionPool of the worker. A new connection is
+            opened for each request if None.
+    :rtype: A Response object
+    """
+    if pool is None:
+        pool = AsyncConnectionPool(0, 0)
+
+    headers = {}
+    if auth_header:
+        headers[auth_header[0]] = auth_header[1]
+    if extra_headers:
+        headers.update(extra_headers)
+
+    start = time.time()
+    try:
+        (final_url, status, reason, message, body) = await asyncio.wait_for(
+            _fetch(pool, url, headers, method, read_body), timeout)
+        stop = time.time()
+        if status >= 400:
+            http_error = HTTPError(final_url, status, reason, message, None)
+            response = Response(
+                content=None, status=status, exception=http_error,
+                original_url=url, final_url=None, is_redirect=False,
+                is_timeout=False, response_time=stop-start)
+        else:
+            response = Response(
+                content=BufferedContent(body, message, final_url, status),
+                status=status, exception=None, original_url=url,
+                final_url=final_url, is_redirect=final_url != url,
+                is_timeout=False, response_time=stop-start)
+    except asyncio.TimeoutError as t_exception:
+        response = Response(
+            content=None, status=None, exception=t_exception,
+            original_url=url, final_url=None, is_redirect=False,
+            is_timeout=True, response_time=None)
+    except Exception as exc:
+        if logger:
+            logger.warning("Exception while opening an URL", exc_info=True)
+        response = Response(
+            content=None, status=None, exception=exc,
+            original_url=url, final_url=None, is_redirect=False,
+            is_timeout=False, response_time=None)
+
+    return response
+
+
+async def _fetch(pool, url, headers, method="GET", read_body=None):
+    """Performs a request and follows redirects.
+
+    :rtype: A tuple (final_url, status, reason, message, body)
+    """
+    for _ in range(MAX_REDIRECTS + 1):
+        (status, reason, message, body) = await _request(
+            pool, url, headers, method, read_body)
+        location = message.get("Location")
+        if status in REDIRECT_STATUSES and location:
+            url = urlparse.urljoin(url, location)
+            if status == 303 and method != "HEAD":
+                method = "GET"
+            continue
+        return (url, status, reason, message, body)
+
+    raise http.client.HTTPException(
+        "Too many redirects ({0})".format(MAX_REDIRECTS))
+
+
+async def _request(pool, url, headers, method, read_body=None):
+    """Sends a single HTTP/1.1 request on a connection of the pool. The
+    connection goes back to the pool if the body was read or if it is small
+    enough to be drained. Otherwise, the connection is closed without reading
+    the body of redirects, errors, and responses for which read_body returns
+    False.
+
+    :rtype: A tuple (status, reason, message, body)
+    """
+    url_split = urlparse.urlsplit(url)
+    key = (url_split.scheme, url_split.hostname,
+           url_split.port or DEFAULT_PORTS.get(url_split.scheme))
+
+    path = url_split.path or "/"
+    if url_split.query:
+        path = "{0}?{1}".format(path, url_split.query)
+    host_header = url_split.netloc.rpartition("@")[2]
+
+    lines = [
+        "{0} {1} HTTP/1.1".format(method, path),
+        "Host: {0}".format(host_header),
+        "User-Agent: {0}".format(USER_AGENT),
+        "Accept-Encoding: identity",
+    ]
+    lines.extend(
+        "{0}: {1}".format(header, value)
+        for header, value in headers.items())
+    request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    while True:
+        (reader, writer, reused) = await pool.get_connection(key)
+        try:
+            writer.write(request)
+            (version, status, reason) = _parse_status_line(
+                await reader.readline())
+            break
+        except Exception:
+            writer.close()
+            if not reused:
+                raise
+            # The server closed the idle connection. Try another one.
+        except BaseException:
+            # The request was cancelled, e.g., by a timeout.
+            writer.close()
+            raise
+
+    reusable = False
+    try:
+        header_lines = []
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            header_lines.append(line)
+        message = http.client.parse_headers(
+            BytesIO(b"".join(header_lines) + b"\r\n"))
+
+        if read_body is None or (status < 300 and read_body(message)):
+            body = await _read_body(reader, method, status, message)
+            reusable = _has_delimited_body(method, status, message)
+        else:
+            body = b""
+            reusable = await _drain_body(reader, method, status, message)
+        reusable = reusable and version == "HTTP/1.1" and\
+            "close" not in message.get("Connection", "").lower()
+    finally:
+        pool.release(key, reader, writer, reusable)
+
+    return (status, reason, message, body)
+
+
+def _parse_status_line(line):
+    parts = line.decode("latin-1").strip().split(None, 2)
+    if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+        raise http.client.BadStatusLine(line)
+    reason = parts[2] if len(parts) > 2 else ""
+    return (parts[0], int(parts[1]), reason)
+
+
+def _has_no_body(method, status):
+    return method == "HEAD" or status in (204, 304) or 100 <= status < 200
+
+
+def _has_delimited_body(method, status, message):
+    """Returns True if the end of the body is known without closing the
+    connection."""
+    return _has_no_body(method, status) or\
+        "chunked" in message.get("Transfer-Encoding", "").lower() or\
+        message.get("Content-Length") is not None
+
+
+async def _drain_body(reader, method, status, message):
+    """Reads a body that is not needed if it is small enough. Returns True if
+    the connection can be reused."""
+    if _has_no_body(method, status):
+        return True
+    if "chunked" in message.get("Transfer-Encoding", "").lower():
+        return False
+    content_length = message.get("Content-Length")
+    if content_length is None or int(content_length) > MAX_DRAIN_SIZE:
+        return False
+    await reader.readexactly(int(content_length))
+    return True
+
+
+async def _read_body(reader, method, status, message):
+    if _has_no_body(method, status):
+        return b""
+
+    transfer_encoding = message.get("Transfer-Encoding", "").lower()
+    if "chunked" in transfer_encoding:
+        chunks = []
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b";", 1)[0].strip(), 16)
+            if size == 0:
+                # Skip trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                return b"".join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+
+    content_length = message.get("Content-Length")
+    if content_length is not None:
+        return await reader.readexactly(int(content_length))
+
+    return await reader.read()
+
+
+def get_ssl_context(allow_insecure_content=False):
+    """Returns the SSL context of HTTPS connections. Certificates are not
+    verified with --allow-insecure-content."""
+    ssl_context = ssl.create_default_context()
+    if allow_insecure_content:
+        ssl_context.check_hostname = False
+        ssl_context.verify_mode = ssl.CERT_NONE
+    return ssl_context
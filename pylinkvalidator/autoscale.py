@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the controller that adjusts the number of workers during a crawl.
+"""
+from __future__ import unicode_literals, absolute_import
+
+import time
+
+
+OVERLOAD_STATUSES = (429, 503)
+"""Statuses returned by a server that asks the crawler to slow down."""
+
+ADJUST_INTERVAL = 1.0
+"""Minimum number of seconds between two adjustments."""
+
+MIN_SAMPLES = 5
+"""Minimum number of pages crawled since the last adjustment."""
+
+ERROR_RATE_THRESHOLD = 0.1
+"""Fraction of timeouts, overload statuses and connection errors above which
+the number of workers is halved."""
+
+LATENCY_FACTOR = 2.0
+"""The number of workers is reduced when the average response time exceeds
+the lowest average response time observed multiplied by this factor."""
+
+GROWTH_FACTOR = 0.25
+"""Fraction of the workers added or removed in a single step (at least one
+worker)."""
+
+
+class WorkerAutoscaler(object):
+    """Computes the number of workers from the pages crawled since the last
+    adjustment.
+
+    The number of workers is halved when the server times out or returns
+    overload statuses, is reduced when the response time grows compared to the
+    fastest response time observed, and grows while URLs are waiting in the
+    frontier. It always stays between min_workers and max_workers.
+
+    This class is NOT thread-safe and should only be accessed by the
+    orchestrator.
+    """
+
+    def __init__(self, min_workers, max_workers, workers):
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.workers = workers
+        self.baseline_time = None
+        """Lowest average response time of an adjustment window."""
+
+        self.last_adjust = time.time()
+        self._reset()
+
+    def _reset(self):
+        self.samples = 0
+        self.errors = 0
+        self.response_time_total = 0.0
+        self.response_time_count = 0
+
+    def record(self, page_crawl):
+        """Records a PageCrawl received from a worker."""
+        self.samples += 1
+        if page_crawl.is_timeout or page_crawl.status in OVERLOAD_STATUSES or\
+                (page_crawl.exception and not page_crawl.status):
+            self.errors += 1
+        elif page_crawl.response_time is not None:
+            self.response_time_total += page_crawl.response_time
+            self.response_time_count += 1
+
+    def get_workers(self, frontier_size, now=None):
+        """Returns the number of workers that should be running.
+
+        :param frontier_size: number of URLs waiting to be dispatched.
+        """
+        if now is None:
+            now = time.time()
+        if self.samples < MIN_SAMPLES or\
+                now - self.last_adjust < ADJUST_INTERVAL:
+            return self.workers
+
+        step = max(1, int(self.workers * GROWTH_FACTOR))
+        error_rate = float(self.errors) / self.samples
+        average_time = None
+        if self.response_time_count:
+            average_time = self.response_time_total /\
+                self.response_time_count
+
+        if error_rate > ERROR_RATE_THRESHOLD:
+            workers = self.workers // 2
+        elif average_time is not None and self.baseline_time and\
+                average_time > self.baseline_time * LATENCY_FACTOR:
+            workers = self.workers - step
+        elif frontier_size >= self.workers:
+            workers = self.workers + step
+        else:
+            workers = self.workers
+
+        if average_time is not None and (
+                self.baseline_time is None or
+                average_time < self.baseline_time):
+            self.baseline_time = average_time
+
+        self.workers = max(self.min_workers, min(self.max_workers, workers))
+        self.last_adjust = now
+        self._reset()
+        return self.workers
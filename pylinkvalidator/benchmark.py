@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the HTML parser benchmarks used by --parser=auto and
+--benchmark-parsers.
+"""
+from __future__ import unicode_literals, absolute_import
+
+import os
+import time
+
+from pylinkvalidator.extract import LINK_EXTRACTOR_PARSERS
+from pylinkvalidator.included.bs4 import BeautifulSoup
+from pylinkvalidator.models import (
+    ParseInput, ParserBenchmark, WorkerInput, LINK_EXTRACTOR_SOUP,
+    PARSER_STDLIB, PARSER_LXML, PARSER_HTML5)
+from pylinkvalidator.urlutil import get_clean_url_split
+
+
+PARSERS = [PARSER_STDLIB, PARSER_LXML, PARSER_HTML5]
+"""Parsers in order of preference. html.parser is always available and is the
+reference for the links found by the other parsers."""
+
+BENCHMARK_BASE_URL = "http://localhost/"
+"""URL of the local files used to resolve their relative links."""
+
+
+def get_available_parsers():
+    """Returns the parsers for which BeautifulSoup can load a tree
+    builder."""
+    parsers = []
+    for parser in PARSERS:
+        try:
+            BeautifulSoup("", parser)
+        except Exception:
+            continue
+        parsers.append(parser)
+    return parsers
+
+
+def benchmark_parsers(page_crawler, parse_inputs, parsers=None,
+                      measure_memory=True):
+    """Parses the pages with each parser the way the workers of the
+    PageCrawler would: links are extracted with a link extractor unless a
+    BeautifulSoup tree is needed (--link-extractor=soup or HTML content
+    checks). Parsers without their own link extractor (html5lib) are only
+    used to build BeautifulSoup trees, so they are always benchmarked with
+    BeautifulSoup.
+
+    :param page_crawler: the PageCrawler used to parse the pages
+    :param parse_inputs: sequence of ParseInput with an HTML content
+    :param parsers: the parsers to benchmark (all available by default)
+    :param measure_memory: if True, pages are parsed a second time to measure
+            the peak memory with tracemalloc (Python 3.4+).
+    :rtype: A list of ParserBenchmark
+    """
+    if parsers is None:
+        parsers = get_available_parsers()
+
+    worker_config = page_crawler.worker_config
+    benchmarks = []
+    try:
+        for parser in parsers:
+            parser_config = worker_config._replace(parser=parser)
+            if parser not in LINK_EXTRACTOR_PARSERS:
+                parser_config = parser_config._replace(
+                    link_extractor=LINK_EXTRACTOR_SOUP)
+            page_crawler.worker_config = parser_config
+            start = time.time()
+            links = _parse_pages(page_crawler, parse_inputs)
+            parse_time = time.time() - start
+
+            peak_memory = None
+            if measure_memory:
+                peak_memory = _get_peak_memory(
+                    lambda: _parse_pages(page_crawler, parse_inputs))
+
+            benchmarks.append(
+                ParserBenchmark(parser, parse_time, peak_memory, links))
+    finally:
+        page_crawler.worker_config = worker_config
+    return benchmarks
+
+
+def select_parser(benchmarks):
+    """Returns the fastest parser that finds the same links as the first
+    benchmarked parser. html.parser wins ties."""
+    reference_links = benchmarks[0].links
+    return min(
+        (benchmark for benchmark in benchmarks
+         if benchmark.links == reference_links),
+        key=lambda benchmark: (
+            benchmark.parse_time, benchmark.parser != PARSER_STDLIB)).parser
+
+
+def read_parse_inputs(file_paths):
+    """Returns a ParseInput for each local HTML file."""
+    parse_inputs = []
+    for file_path in file_paths:
+        with open(file_path, "rb") as html_file:
+            content = html_file.read()
+        final_url_split = get_clean_url_split(
+            BENCHMARK_BASE_URL + os.path.basename(file_path))
+        parse_inputs.append(ParseInput(
+            worker_input=WorkerInput(final_url_split, True, 0, None),
+            final_url_split=final_url_split, status=200, is_html=True,
+            content=content))
+    return parse_inputs
+
+
+def _parse_pages(page_crawler, parse_inputs):
+    links = []
+    for parse_input in parse_inputs:
+        # A parser that fails has no links and is never selected.
+        page_crawl = page_crawler.parse_page(parse_input)
+        links.append([
+            (link.type, link.url_split.geturl())
+            for link in page_crawl.links])
+    return links
+
+
+def _get_peak_memory(function):
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
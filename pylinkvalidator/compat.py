@@ -14,6 +14,7 @@ if sys.version_info[0] < 3:
     import SimpleHTTPServer
     import SocketServer
     from urllib2 import HTTPError
+    from HTMLParser import HTMLParser
     import Queue
     unicode = unicode
 
@@ -34,6 +35,7 @@ else:
     import http.server as SimpleHTTPServer
     import socketserver as SocketServer
     from urllib.error import HTTPError
+    from html.parser import HTMLParser
     import queue as Queue
     unicode = str
 
@@ -62,6 +64,25 @@ except ImportError:
         def createLock(self):
             return None
 
+try:
+    from collections import OrderedDict
+except ImportError:
+    # Python 2.6
+    OrderedDict = None
+
+from array import array
+try:
+    array(str("Q"))
+    UINT64_TYPECODE = str("Q")
+except ValueError:
+    # Python 2: unsigned long is 64 bits on 64-bit Unix platforms.
+    UINT64_TYPECODE = str("L")
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 
 def get_url_open():
     # Not automatically imported to allow monkey patching.
@@ -78,3 +99,21 @@ def get_url_request():
     else:
         from urllib.request import Request
     return Request
+
+
+def get_http_client():
+    # Not automatically imported to allow monkey patching.
+    if sys.version_info[0] < 3:
+        import httplib as http_client
+    else:
+        import http.client as http_client
+    return http_client
+
+
+def get_proxies():
+    if sys.version_info[0] < 3:
+        from urllib import getproxies
+    else:
+        from urllib.request import getproxies
+    return getproxies()
+
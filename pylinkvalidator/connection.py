@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the persistent HTTP connection pool used by the workers.
+"""
+from __future__ import unicode_literals, absolute_import
+
+from collections import defaultdict
+import time
+
+from pylinkvalidator.compat import HTTPError, urlparse, get_http_client
+from pylinkvalidator.urlutil import SUPPORTED_SCHEMES, SCHEME_HTTPS
+
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+MAX_REDIRECTS = 10
+
+MAX_DRAIN_SIZE = 64 * 1024
+"""Maximum size of an unread body (e.g., redirect or error page) that will be
+read to keep the connection alive. Larger bodies close the connection."""
+
+USER_AGENT = "pylinkvalidator"
+
+
+class PooledResponse(object):
+    """Response returned by ConnectionPool.urlopen. Implements the subset of
+    the urlopen response interface used by the PageCrawler.
+
+    The connection is given back to the pool when the response is closed if
+    the body was fully read or if there is no body (e.g., HEAD requests).
+    Otherwise, the connection is closed so unread bodies are never
+    downloaded.
+    """
+
+    def __init__(self, pool, key, connection, response, url):
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.url = url
+
+    def read(self, *args):
+        return self.response.read(*args)
+
+    def info(self):
+        return self.response.msg
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.response.status
+
+    def close(self):
+        if self.connection:
+            # Responses without a body (e.g., to HEAD requests) have a
+            # length of 0 and are closed once they are read.
+            self.pool.release(
+                self.key, self.connection, self.response,
+                drain=self.response.length == 0)
+            self.connection = None
+
+
+class ConnectionPool(object):
+    """Pool of persistent HTTP/1.1 connections keyed by (scheme, host, port).
+
+    The pool is not thread-safe: each worker must have its own pool.
+    """
+
+    def __init__(self, size, idle_timeout, timeout_exception):
+        self.size = size
+        """Maximum number of idle connections kept per host."""
+
+        self.idle_timeout = idle_timeout
+        """Idle connections older than this (in seconds) are closed."""
+
+        self.timeout_exception = timeout_exception
+
+        self.http_client = get_http_client()
+
+        self.idle_connections = defaultdict(list)
+        """Map of (scheme, host, port):[(connection, last used time)]"""
+
+        self.created = 0
+        self.reused = 0
+
+    def urlopen(self, request, timeout=None):
+        """Opens a urllib Request and follows redirects like urlopen.
+
+        :rtype: A PooledResponse
+        """
+        url = request.get_full_url()
+        method = request.get_method()
+        headers = dict(request.header_items())
+        if "user-agent" not in (header.lower() for header in headers):
+            headers["User-Agent"] = USER_AGENT
+
+        for _ in range(MAX_REDIRECTS + 1):
+            (key, connection, response) = self._request(
+                method, url, headers, timeout)
+            location = response.getheader("Location")
+            if response.status in REDIRECT_STATUSES and location:
+                self.release(key, connection, response)
+                new_url = urlparse.urljoin(url, location)
+                if urlparse.urlsplit(new_url).scheme not in SUPPORTED_SCHEMES:
+                    raise HTTPError(
+                        new_url, response.status, "Unsupported redirection",
+                        response.msg, None)
+                url = new_url
+                continue
+            elif not 200 <= response.status < 300:
+                self.release(key, connection, response)
+                raise HTTPError(
+                    url, response.status, response.reason, response.msg,
+                    None)
+
+            return PooledResponse(self, key, connection, response, url)
+
+        raise HTTPError(
+            url, response.status, "Too many redirections", response.msg,
+            None)
+
+    def release(self, key, connection, response, drain=True):
+        """Gives a connection back to the pool if it can be reused."""
+        if drain and not response.isclosed() and\
+                response.length is not None and\
+                response.length <= MAX_DRAIN_SIZE:
+            try:
+                response.read()
+            except Exception:
+                pass
+
+        idle = self.idle_connections[key]
+        if response.isclosed() and not response.will_close and\
+                len(idle) < self.size:
+            idle.append((connection, time.time()))
+        else:
+            connection.close()
+
+    def close(self):
+        """Closes all idle connections."""
+        for idle in self.idle_connections.values():
+            for connection, _ in idle:
+                connection.close()
+        self.idle_connections.clear()
+
+    def _request(self, method, url, headers, timeout):
+        url_split = urlparse.urlsplit(url)
+        key = (url_split.scheme, url_split.hostname, url_split.port)
+        selector = url_split.path or "/"
+        if url_split.query:
+            selector = "{0}?{1}".format(selector, url_split.query)
+
+        while True:
+            (connection, reused) = self._get_connection(key, timeout)
+            try:
+                connection.request(method, selector, headers=headers)
+                return (key, connection, connection.getresponse())
+            except self.timeout_exception:
+                connection.close()
+                raise
+            except Exception:
+                connection.close()
+                if not reused:
+                    raise
+                # The server closed the idle connection. Try another one.
+
+    def _get_connection(self, key, timeout):
+        idle = self.idle_connections[key]
+        now = time.time()
+        while idle:
+            (connection, last_used) = idle.pop()
+            if now - last_used > self.idle_timeout:
+                connection.close()
+                continue
+            connection.timeout = timeout
+            if connection.sock:
+                connection.sock.settimeout(timeout)
+            self.reused += 1
+            return (connection, True)
+
+        (scheme, host, port) = key
+        if scheme == SCHEME_HTTPS:
+            # Uses the default https context, which is replaced by
+            # --allow-insecure-content.
+            connection_class = self.http_client.HTTPSConnection
+        else:
+            connection_class = self.http_client.HTTPConnection
+        self.created += 1
+        return (connection_class(host, port, timeout=timeout), False)
@@ -5,31 +5,55 @@ Contains the crawling logic.
 from __future__ import unicode_literals, absolute_import
 
 import base64
+import codecs
 from collections import defaultdict
 import logging
 import sys
 import time
 
-from pylinkvalidator.included.bs4 import BeautifulSoup, UnicodeDammit
+from pylinkvalidator.included.bs4 import (
+    BeautifulSoup, SoupStrainer, UnicodeDammit)
 
 import pylinkvalidator.compat as compat
 from pylinkvalidator.compat import (
     range, HTTPError, get_url_open, unicode,
-    get_content_type, get_url_request, get_charset)
+    get_content_type, get_url_request, get_charset, get_proxies)
+from pylinkvalidator.autoscale import WorkerAutoscaler
+from pylinkvalidator.benchmark import (
+    benchmark_parsers, read_parse_inputs, select_parser)
+from pylinkvalidator.connection import ConnectionPool
+from pylinkvalidator.extract import (
+    STREAM_CHUNK_SIZE, get_compact_source, get_link_extractor,
+    get_start_tag, get_stream_encoding)
+from pylinkvalidator.frontier import Frontier, PRIORITY_FUNCTIONS
 from pylinkvalidator.models import (
-    Config, WorkerInit, Response, PageCrawl,
+    Config, WorkerInit, Response, PageCrawl, ParseInput, LinkBatch,
     ExceptionStr, Link, SitePage, WorkerInput, TYPE_ATTRIBUTES, HTML_MIME_TYPE,
-    MODE_THREAD, MODE_PROCESS, MODE_GREEN, WHEN_ALWAYS, UTF8Class,
-    PageStatus, PageSource, PAGE_QUEUED, PAGE_CRAWLED, VERBOSE_QUIET,
-    VERBOSE_NORMAL, LazyLogParam, PREFIX_ALL)
-from pylinkvalidator.reporter import report
+    MODE_THREAD, MODE_PROCESS, MODE_HYBRID, MODE_GREEN, MODE_ASYNC,
+    LINK_EXTRACTOR_SOUP, PARSER_STDLIB, PARSER_AUTO,
+    WHEN_ALWAYS,
+    UTF8Class, PageSource, PageSources, PAGE_QUEUED, PAGE_CRAWLED,
+    get_url_canonicalizer, is_page_ok, RETENTION_ERRORS,
+    VERBOSE_QUIET, VERBOSE_NORMAL, LazyLogParam, PREFIX_ALL)
+from pylinkvalidator.reporter import report, report_parser_benchmarks
 from pylinkvalidator.urlutil import (
-    get_clean_url_split, get_absolute_url_split,
-    is_link, is_similar_url_split, is_supported_scheme)
+    is_link, is_similar_url_split, is_supported_scheme, URLCache,
+    URLMapping, DEFAULT_URL_CACHE_SIZE)
+from pylinkvalidator.storage import get_storage, MemoryStorage
 
 
 WORK_DONE = '__WORK_DONE__'
 
+DISPATCH_FACTOR = 2
+"""Number of WorkerInputs per worker handed to the input queue at once."""
+
+HEAD_FALLBACK_STATUSES = (405, 501)
+"""Statuses returned by servers that do not support HEAD requests."""
+
+RANGE_HEADERS = {"Range": "bytes=0-0"}
+
+RANGE_FALLBACK_STATUSES = (405, 416, 501)
+
 
 def get_logger(propagate=False):
     """Returns a logger."""
@@ -62,47 +86,225 @@ class SiteCrawler(object):
         self.input_queue = self.build_queue(config)
         self.output_queue = self.build_queue(config)
         self.logger = logger
-        self.site = Site(self.start_url_splits, config, self.logger)
+        if config.worker_config.parser == PARSER_AUTO:
+            config.worker_config = config.worker_config._replace(
+                parser=self.select_parser(config))
+        self.storage = get_storage(config)
+        self.site = Site(
+            self.start_url_splits, config, self.logger, self.storage)
+        self.parse_pool = self.build_parse_pool(config)
+        self.frontier = self.build_frontier(config)
+        self.autoscaler = self.build_autoscaler(config)
+        self.worker_init = None
+        self.worker_count = config.worker_size
+        self.queue_size = 0
+        self.in_flight = 0
+        self.batch_size = config.batch_size
+        self.concurrency = 0
+        self.max_in_flight = 0
+        self.set_concurrency()
 
     def build_logger(self):
         return self.logger
 
     def crawl(self):
-        worker_init = WorkerInit(
+        self.worker_init = WorkerInit(
             self.config.worker_config, self.input_queue,
-            self.output_queue, self.build_logger())
-        self.workers = self.get_workers(self.config, worker_init)
+            self.output_queue, self.build_logger(), self.config.content_check,
+            self.parse_pool)
+        self.workers = self.get_workers(self.config, self.worker_init)
 
-        queue_size = len(self.start_url_splits)
-        for start_url_split in self.start_url_splits:
-            self.input_queue.put(
-                WorkerInput(
-                    start_url_split, True, 0, start_url_split.netloc,
-                    self.config.content_check),
-                False)
+        self.queue_size = len(self.start_url_splits)
+        for worker_input in self.get_start_worker_inputs():
+            self.frontier.put(worker_input)
 
         self.start_workers(self.workers, self.input_queue, self.output_queue)
 
         self.start_progress()
 
         while True:
-            page_crawl = self.output_queue.get()
-            queue_size -= 1
-            new_worker_inputs = self.process_page_crawl(page_crawl)
+            self.dispatch()
 
-            # We only process new pages if we did not exceed configured depth
-            for worker_input in new_worker_inputs:
-                queue_size += 1
-                self.input_queue.put(worker_input, False)
+            try:
+                message = self.output_queue.get(True, self.get_wait_delay())
+            except compat.Queue.Empty:
+                # A rate-limited host can be crawled again.
+                continue
 
-            self.progress(page_crawl, len(self.site.pages), queue_size)
+            self.process_message(message)
 
-            if queue_size <= 0:
+            if self.queue_size <= 0:
                 self.stop_workers(self.workers, self.input_queue,
                                   self.output_queue)
+                self.stop_parse_pool()
                 self.stop_progress()
+                self.site.close()
                 return self.site
 
+            self.autoscale()
+
+    def dispatch(self):
+        """Moves the WorkerInputs that can be crawled from the frontier to
+        the input queue. At most max_in_flight WorkerInputs are given to the
+        workers so the frontier keeps deciding which host is crawled next.
+        """
+        for message in self.get_dispatch_messages():
+            self.input_queue.put(message, False)
+
+    def get_wait_delay(self):
+        """Returns the number of seconds to wait for a message from the
+        workers before dispatching again or None to wait until a message
+        arrives.
+
+        The delay of the rate-limited hosts only matters if dispatch stopped
+        because of a rate limit: when max_in_flight WorkerInputs are already
+        given to the workers, nothing can be dispatched before a worker
+        sends a message.
+        """
+        if self.in_flight >= self.max_in_flight:
+            return None
+        return self.frontier.get_delay()
+
+    def get_dispatch_messages(self):
+        """Pops the WorkerInputs that can be crawled from the frontier and
+        groups them in batches if the batch size is greater than 1."""
+        worker_inputs = []
+        while self.in_flight < self.max_in_flight:
+            worker_input = self.frontier.pop()
+            if not worker_input:
+                break
+            self.in_flight += 1
+            worker_inputs.append(worker_input)
+
+        if self.batch_size <= 1 or not worker_inputs:
+            return worker_inputs
+
+        # Small batches when there is little work so all workers get some.
+        size = min(
+            self.batch_size,
+            -(-len(worker_inputs) // self.concurrency))
+        return [worker_inputs[index:index + size]
+                for index in range(0, len(worker_inputs), size)]
+
+    def process_message(self, message):
+        """Processes a PageCrawl or a batch (list) of PageCrawl received
+        from a worker and adds the new WorkerInputs to the frontier."""
+        if isinstance(message, list):
+            page_crawls = message
+        else:
+            page_crawls = [message]
+
+        for page_crawl in page_crawls:
+            if isinstance(page_crawl, LinkBatch):
+                # Links of a page that is still downloading.
+                self.add_worker_inputs(self.site.process_links(page_crawl))
+                continue
+
+            if self.autoscaler:
+                self.autoscaler.record(page_crawl)
+            self.in_flight -= 1
+            self.frontier.done(page_crawl.original_url_split)
+            self.queue_size -= 1
+            new_worker_inputs = self.process_page_crawl(page_crawl)
+            self.add_worker_inputs(new_worker_inputs)
+
+            self.progress(page_crawl, self.site.page_count, self.queue_size)
+
+    def add_worker_inputs(self, worker_inputs):
+        """Adds the WorkerInputs of the new links to the frontier."""
+        # We only process new pages if we did not exceed configured depth
+        for worker_input in worker_inputs:
+            self.queue_size += 1
+            self.frontier.put(worker_input)
+
+    def select_parser(self, config):
+        """Fetches the start pages and returns the fastest parser that finds
+        the same links as html.parser. The pages are parsed like the workers
+        parse them, with the link extractor or with BeautifulSoup."""
+        page_crawler = PageCrawler(WorkerInit(
+            config.worker_config._replace(
+                parser=PARSER_STDLIB, stream_links=False),
+            None, None, self.logger, config.content_check, None))
+
+        parse_inputs = []
+        for worker_input in self.get_start_worker_inputs():
+            result = page_crawler._fetch_page(worker_input)
+            if isinstance(result, ParseInput) and result.is_html and\
+                    result.content:
+                parse_inputs.append(result)
+        if page_crawler.connection_pool:
+            page_crawler.connection_pool.close()
+
+        if not parse_inputs:
+            return PARSER_STDLIB
+
+        parser = select_parser(benchmark_parsers(
+            page_crawler, parse_inputs, measure_memory=False))
+        self.logger.info("Selected parser: {0}".format(parser))
+        return parser
+
+    def build_autoscaler(self, config):
+        """Returns the controller of the number of workers or None if the
+        number of workers is fixed."""
+        if not config.options.adaptive:
+            return None
+
+        return WorkerAutoscaler(
+            config.min_workers, config.max_workers, config.worker_size)
+
+    def autoscale(self):
+        """Starts or stops workers if the autoscaler changed the number of
+        workers."""
+        if not self.autoscaler:
+            return
+
+        self.join_stopped_workers()
+        worker_count = self.autoscaler.get_workers(len(self.frontier))
+        if worker_count > self.worker_count:
+            workers = self.get_workers(
+                self.config, self.worker_init,
+                worker_count - self.worker_count)
+            self.start_workers(workers, self.input_queue, self.output_queue)
+            self.workers.extend(workers)
+        elif worker_count < self.worker_count:
+            self.retire_workers(self.worker_count - worker_count)
+        else:
+            return
+
+        self.logger.debug("Number of workers changed from {0} to {1}".format(
+            self.worker_count, worker_count))
+        self.worker_count = worker_count
+        self.set_concurrency()
+
+    def set_concurrency(self):
+        """Computes the number of pages that can be crawled at the same time
+        and how many WorkerInputs can be dispatched."""
+        self.concurrency = self.get_concurrency(self.worker_count)
+        self.max_in_flight = self.concurrency * DISPATCH_FACTOR *\
+            max(1, self.batch_size)
+
+    def build_parse_pool(self, config):
+        """Returns a pool of processes that parse the pages downloaded by the
+        workers or None if the workers parse the pages."""
+        if not config.options.parse_workers:
+            return None
+
+        import multiprocessing
+        return multiprocessing.Pool(
+            config.options.parse_workers, init_page_parser,
+            (config.worker_config, config.content_check))
+
+    def stop_parse_pool(self):
+        if self.parse_pool:
+            self.parse_pool.close()
+            self.parse_pool.join()
+
+    def get_start_worker_inputs(self):
+        """Returns the WorkerInput of each start URL."""
+        return [
+            WorkerInput(start_url_split, True, 0, start_url_split.netloc)
+            for start_url_split in self.start_url_splits]
+
     def start_progress(self):
         if self.config.options.progress:
             print("Starting crawl...")
@@ -135,8 +337,26 @@ class SiteCrawler(object):
         """Returns an object implementing the Queue interface."""
         raise NotImplementedError()
 
-    def get_workers(self, config, worker_init):
-        """Returns a sequence of workers of the desired type."""
+    def build_frontier(self, config):
+        """Returns the Frontier keeping the URLs to crawl."""
+        priority_function = PRIORITY_FUNCTIONS.get(
+            config.options.frontier_order)
+        if not priority_function:
+            raise ValueError("This frontier order is not supported: {0}"
+                             .format(config.options.frontier_order))
+
+        return Frontier(
+            config.default_host_limit, config.host_limits, priority_function,
+            self.storage.overflow)
+
+    def get_concurrency(self, worker_count):
+        """Returns the number of pages that can be crawled at the same
+        time by worker_count workers."""
+        return max(1, worker_count)
+
+    def get_workers(self, config, worker_init, worker_count=None):
+        """Returns a sequence of worker_count workers of the desired type
+        (config.worker_size by default)."""
         raise NotImplementedError()
 
     def start_workers(self, workers, input_queue, output_queue):
@@ -148,6 +368,17 @@ class SiteCrawler(object):
         for worker in workers:
             input_queue.put(WORK_DONE)
 
+    def retire_workers(self, worker_count):
+        """Stops worker_count workers once they are done with the work that
+        was already dispatched."""
+        for _ in range(worker_count):
+            self.input_queue.put(WORK_DONE)
+
+    def join_stopped_workers(self):
+        """Releases the resources of the workers that stopped after they
+        were retired."""
+        pass
+
     def process_page_crawl(self, page_crawl):
         """Returns a sequence of SplitResult to crawl."""
         return self.site.add_crawled_page(page_crawl)
@@ -159,10 +390,10 @@ class ThreadSiteCrawler(SiteCrawler):
     def build_queue(self, config):
         return compat.Queue.Queue()
 
-    def get_workers(self, config, worker_init):
+    def get_workers(self, config, worker_init, worker_count=None):
         from threading import Thread
         workers = []
-        for _ in range(config.worker_size):
+        for _ in range(worker_count or config.worker_size):
             workers.append(
                 Thread(target=crawl_page, kwargs={'worker_init': worker_init}))
 
@@ -178,7 +409,9 @@ class ProcessSiteCrawler(SiteCrawler):
 
     def __init__(self, *args, **kwargs):
         import multiprocessing
-        self.manager = multiprocessing.Manager()
+        # Direct queues (pipes) instead of Manager proxies: each put/get
+        # would otherwise go through the manager server process.
+        self.QueueClass = multiprocessing.Queue
         self.ProcessClass = multiprocessing.Process
         super(ProcessSiteCrawler, self).__init__(*args, **kwargs)
 
@@ -187,11 +420,11 @@ class ProcessSiteCrawler(SiteCrawler):
         return None
 
     def build_queue(self, config):
-        return self.manager.Queue()
+        return self.QueueClass()
 
-    def get_workers(self, config, worker_init):
+    def get_workers(self, config, worker_init, worker_count=None):
         workers = []
-        for _ in range(config.worker_size):
+        for _ in range(worker_count or config.worker_size):
             workers.append(self.ProcessClass(
                 target=crawl_page, kwargs={'worker_init': worker_init}))
 
@@ -201,6 +434,46 @@ class ProcessSiteCrawler(SiteCrawler):
         for worker in workers:
             worker.start()
 
+    def join_stopped_workers(self):
+        """Joins the processes that exited after they received WORK_DONE so
+        they do not remain zombies until the end of the crawl."""
+        running_workers = []
+        for worker in self.workers:
+            if worker.is_alive():
+                running_workers.append(worker)
+            else:
+                worker.join()
+        self.workers = running_workers
+
+
+class HybridSiteCrawler(ProcessSiteCrawler):
+    """Site Crawler with process workers each running a pool of thread
+    workers: parsing uses multiple cores and fetching uses cheap threads."""
+
+    def get_concurrency(self, worker_count):
+        return max(1, worker_count) * self.config.threads_per_process
+
+    def get_workers(self, config, worker_init, worker_count=None):
+        workers = []
+        for _ in range(worker_count or config.worker_size):
+            workers.append(self.ProcessClass(
+                target=crawl_page_threads,
+                kwargs={'worker_init': worker_init,
+                        'thread_count': config.threads_per_process}))
+
+        return workers
+
+    def stop_workers(self, workers, input_queue, output_queue):
+        """Stops the thread workers of each process."""
+        for _ in range(self.concurrency):
+            input_queue.put(WORK_DONE)
+
+    def retire_workers(self, worker_count):
+        """Stops all the thread workers of worker_count processes. A process
+        exits once all its threads are stopped."""
+        super(HybridSiteCrawler, self).retire_workers(
+            worker_count * self.config.threads_per_process)
+
 
 class GreenSiteCrawler(SiteCrawler):
     """Site Crawler with green thread workers."""
@@ -217,9 +490,9 @@ class GreenSiteCrawler(SiteCrawler):
     def build_queue(self, config):
         return self.QueueClass()
 
-    def get_workers(self, config, worker_init):
+    def get_workers(self, config, worker_init, worker_count=None):
         workers = []
-        for _ in range(config.worker_size):
+        for _ in range(worker_count or config.worker_size):
             workers.append(self.GreenClass(
                 crawl_page, worker_init=worker_init))
 
@@ -235,8 +508,18 @@ class PageCrawler(object):
 
     def __init__(self, worker_init):
         self.worker_config = worker_init.worker_config
+        self.content_check = worker_init.content_check
         self.input_queue = worker_init.input_queue
         self.output_queue = worker_init.output_queue
+        self.parse_pool = worker_init.parse_pool
+        self.link_strainer = SoupStrainer(
+            ['base'] + list(self.worker_config.types))
+
+        url_cache_size = self.worker_config.url_cache_size
+        if url_cache_size is None:
+            url_cache_size = DEFAULT_URL_CACHE_SIZE
+        self.url_cache = URLCache(url_cache_size)
+        self.url_canonicalizer = get_url_canonicalizer(self.worker_config)
         self.urlopen = get_url_open()
         self.request_class = get_url_request()
         self.logger = worker_init.logger
@@ -248,6 +531,14 @@ class PageCrawler(object):
         import socket
         self.timeout_exception = socket.timeout
 
+        self.connection_pool = None
+        if self.worker_config.pool_size and not get_proxies():
+            # urlopen is still used with proxies because it supports them.
+            self.connection_pool = ConnectionPool(
+                self.worker_config.pool_size,
+                self.worker_config.pool_idle_timeout, self.timeout_exception)
+            self.urlopen = self.connection_pool.urlopen
+
         self.auth_header = None
 
         if self.worker_config.username and self.worker_config.password:
@@ -268,131 +559,413 @@ class PageCrawler(object):
 
             if worker_input == WORK_DONE:
                 # No more work! Pfew!
+                if self.connection_pool:
+                    self.connection_pool.close()
+                self.logger.debug(
+                    "URL cache: %d hits, %d misses", self.url_cache.hits,
+                    self.url_cache.misses)
                 return
+            elif isinstance(worker_input, list):
+                # A batch is answered with a batch.
+                page_crawls = []
+                for single_input in worker_input:
+                    page_crawl = self._crawl_or_send_page(single_input)
+                    if page_crawl:
+                        page_crawls.append(page_crawl)
+                if page_crawls:
+                    self.output_queue.put(page_crawls)
             else:
-                page_crawl = self._crawl_page(worker_input)
-                self.output_queue.put(page_crawl)
+                page_crawl = self._crawl_or_send_page(worker_input)
+                if page_crawl:
+                    self.output_queue.put(page_crawl)
+
+    def _crawl_or_send_page(self, worker_input):
+        """Returns the PageCrawl of a WorkerInput or None if the page was
+        sent to the parse pool, which puts the PageCrawl in the output queue
+        once it is parsed."""
+        result = self._fetch_page(worker_input)
+        if not isinstance(result, ParseInput):
+            return result
+        elif self.parse_pool and result.content is not None:
+            self.parse_pool.apply_async(
+                parse_page, (result,), callback=self.output_queue.put,
+                error_callback=lambda exc: self.output_queue.put(
+                    self._get_parse_error_page_crawl(
+                        result.worker_input, exc)))
+            return None
+        else:
+            return self.parse_page(result)
 
     def _crawl_page(self, worker_input):
-        page_crawl = None
-        erroneous_content = []
-        missing_content = []
-        url_split_to_crawl = worker_input.url_split
+        result = self._fetch_page(worker_input)
+        if isinstance(result, ParseInput):
+            return self.parse_page(result)
+        return result
+
+    def _fetch_page(self, worker_input):
+        """Fetches a page and returns a ParseInput with the downloaded body
+        if it must be parsed or a PageCrawl if an error occurred."""
+        result = None
+        response = None
 
         try:
-            response = open_url(
-                self.urlopen, self.request_class,
-                url_split_to_crawl.geturl(), self.worker_config.timeout,
-                self.timeout_exception, self.auth_header,
-                extra_headers=self.worker_config.extra_headers,
-                logger=self.logger)
+            response = self._open_page(worker_input)
 
             if response.exception:
-                if response.status:
-                    # This is a http error. Good.
-                    page_crawl = PageCrawl(
-                        original_url_split=url_split_to_crawl,
-                        final_url_split=None, status=response.status,
-                        is_timeout=False, is_redirect=False, links=[],
-                        exception=None, is_html=False,
-                        depth=worker_input.depth,
-                        response_time=response.response_time,
-                        process_time=None,
-                        site_origin=worker_input.site_origin)
-                elif response.is_timeout:
-                    # This is a timeout. No need to wrap the exception
-                    page_crawl = PageCrawl(
-                        original_url_split=url_split_to_crawl,
-                        final_url_split=None, status=None,
-                        is_timeout=True, is_redirect=False, links=[],
-                        exception=None, is_html=False,
-                        depth=worker_input.depth,
-                        response_time=response.response_time,
-                        process_time=0,
-                        site_origin=worker_input.site_origin)
-                else:
-                    # Something bad happened when opening the url
-                    exception = ExceptionStr(
-                        unicode(type(response.exception)),
-                        unicode(response.exception))
-                    page_crawl = PageCrawl(
-                        original_url_split=url_split_to_crawl,
-                        final_url_split=None, status=None,
-                        is_timeout=False, is_redirect=False, links=[],
-                        exception=exception, is_html=False,
-                        depth=worker_input.depth,
-                        response_time=response.response_time,
-                        process_time=0,
-                        site_origin=worker_input.site_origin)
+                result = self.get_error_page_crawl(worker_input, response)
+            elif self._should_stream(worker_input, response):
+                result = self.stream_page(worker_input, response)
             else:
-                final_url_split = get_clean_url_split(response.final_url)
+                result = self.get_parse_input(worker_input, response)
+        except Exception as exc:
+            result = self._get_exception_page_crawl(worker_input, exc)
+            self.logger.exception("Exception occurred while crawling a page.")
+        finally:
+            if response and response.content:
+                # Gives the connection back to the pool. Unread bodies are
+                # not downloaded.
+                response.content.close()
+
+        return result
+
+    def _open_page(self, worker_input):
+        """Opens the URL of a WorkerInput. If --use-head is set, URLs that
+        are neither crawled nor checked are validated with a HEAD request.
+        If the server does not support HEAD, a GET request for the first byte
+        is sent, and then a normal GET request."""
+        url = worker_input.url_split.geturl()
+
+        if self._should_use_head(worker_input):
+            response = self._open_url(url, "HEAD")
+            if response.status not in HEAD_FALLBACK_STATUSES:
+                return response
+            response = self._open_url(url, extra_headers=RANGE_HEADERS)
+            if response.status not in RANGE_FALLBACK_STATUSES:
+                return response
+
+        return self._open_url(url)
+
+    def _open_url(self, url, method=None, extra_headers=None):
+        headers = self.worker_config.extra_headers
+        if extra_headers:
+            headers = dict(headers or {})
+            headers.update(extra_headers)
+
+        return open_url(
+            self.urlopen, self.request_class, url,
+            self.worker_config.timeout, self.timeout_exception,
+            self.auth_header, extra_headers=headers, logger=self.logger,
+            method=method)
+
+    def _should_use_head(self, worker_input):
+        return self.worker_config.use_head and\
+            not worker_input.should_crawl and\
+            not self._content_check_applies(worker_input.url_split)
+
+    def _needs_body(self, worker_input, mime_type):
+        """Returns True if the body of a response must be downloaded to
+        extract links or to check its content."""
+        return (mime_type == HTML_MIME_TYPE and worker_input.should_crawl) or\
+            self._has_content_to_check()
+
+    def _should_stream(self, worker_input, response):
+        return self.worker_config.stream_links and\
+            worker_input.should_crawl and\
+            not self._has_content_to_check() and\
+            get_content_type(response.content.info()) == HTML_MIME_TYPE
+
+    def stream_page(self, worker_input, response):
+        """Extracts the links of an HTML page while it is downloading. The
+        links found after each chunk are sent to the orchestrator in a
+        LinkBatch and the remaining links are returned in the PageCrawl."""
+        final_url_split = self.url_cache.get_clean_url_split(
+            response.final_url)
+        extractor = get_link_extractor(
+            self.worker_config.types, self.worker_config.parser,
+            self.worker_config.show_source)
+        decoder = None
+        process_time = 0.0
 
-                message = response.content.info()
-                mime_type = get_content_type(message)
-                if self.worker_config.prefer_server_encoding:
-                    charset = get_charset(message)
-                else:
-                    charset = None
-                links = []
-
-                is_html = mime_type == HTML_MIME_TYPE
-                process_time = None
-
-                if is_html and worker_input.should_crawl:
-                    start = time.time()
-                    html_soup = BeautifulSoup(
-                        response.content, self.worker_config.parser,
-                        from_encoding=charset)
-                    links = self.get_links(html_soup, final_url_split)
-                    if self._has_content_to_check(worker_input):
-                        (missing_content, erroneous_content) =\
-                            self.check_content(
-                                unicode(html_soup), html_soup,
-                                url_split_to_crawl,
-                                final_url_split, worker_input.content_check)
-                    process_time = time.time() - start
-                else:
-                    self.logger.debug(
-                        "Won't crawl %s. MIME Type: %s. Should crawl: %s",
-                        final_url_split, mime_type,
-                        worker_input.should_crawl)
-                    if self._has_content_to_check(worker_input):
-                        text_content = self.get_text_content(
-                            response.content.read(), charset)
-                        (missing_content, erroneous_content) =\
-                            self.check_content(
-                                text_content, None, url_split_to_crawl,
-                                final_url_split, worker_input.content_check)
-
-                page_crawl = PageCrawl(
-                    original_url_split=url_split_to_crawl,
-                    final_url_split=final_url_split, status=response.status,
-                    is_timeout=False, is_redirect=response.is_redirect,
-                    links=links, exception=None, is_html=is_html,
+        while True:
+            chunk = response.content.read(STREAM_CHUNK_SIZE)
+            start = time.time()
+            if not chunk:
+                if decoder:
+                    extractor.feed(decoder.decode(b"", True))
+                extractor.close()
+                links = self._get_extracted_links(extractor, final_url_split)
+                process_time += time.time() - start
+                break
+
+            if not decoder:
+                encoding = get_stream_encoding(
+                    get_charset(response.content.info()), chunk)
+                decoder = codecs.getincrementaldecoder(encoding)("replace")
+            extractor.feed(decoder.decode(chunk))
+            links = self._get_extracted_links(extractor, final_url_split)
+            process_time += time.time() - start
+            if links:
+                self.output_queue.put(LinkBatch(
+                    original_url_split=worker_input.url_split,
+                    final_url_split=final_url_split, links=links,
                     depth=worker_input.depth,
-                    response_time=response.response_time,
-                    process_time=process_time,
-                    site_origin=worker_input.site_origin,
-                    missing_content=missing_content,
-                    erroneous_content=erroneous_content)
-        except Exception as exc:
-            exception = ExceptionStr(unicode(type(exc)), unicode(exc))
+                    site_origin=worker_input.site_origin))
+
+        return PageCrawl(
+            original_url_split=worker_input.url_split,
+            final_url_split=final_url_split, status=response.status,
+            is_timeout=False, is_redirect=response.is_redirect,
+            links=links, exception=None, is_html=True,
+            depth=worker_input.depth,
+            response_time=response.response_time,
+            process_time=process_time,
+            site_origin=worker_input.site_origin)
+
+    def extract_links(self, text_content, original_url_split):
+        """Gets links for desired types with a link extractor, which does not
+        build a tree. Links are grouped by type like get_links.
+
+        :param text_content: The unicode content of the page
+        :param original_url_split: The URL of the page used to resolve relative
+                links.
+        :rtype: A sequence of Link objects
+        """
+        extractor = get_link_extractor(
+            self.worker_config.types, self.worker_config.parser,
+            self.worker_config.show_source)
+        extractor.feed(text_content)
+        extractor.close()
+        links = self._get_extracted_links(extractor, original_url_split)
+
+        type_order = dict(
+            (element_type, index)
+            for index, element_type in enumerate(self.worker_config.types))
+        links.sort(key=lambda link: type_order[link.type])
+        return links
+
+    def _get_extracted_links(self, extractor, original_url_split):
+        base_url_split = original_url_split
+        if extractor.base_url is not None:
+            base_url_split = self.url_cache.get_clean_url_split(
+                extractor.base_url)
+
+        links = []
+        for element_type, url, source_str in extractor.pop_links():
+            link = self._get_link(
+                element_type, url, source_str, base_url_split,
+                original_url_split)
+            if link:
+                links.append(link)
+        return links
+
+    def get_error_page_crawl(self, worker_input, response):
+        """Builds a PageCrawl from a Response with an exception (HTTP error,
+        timeout or other exception)."""
+        url_split_to_crawl = worker_input.url_split
+
+        if response.status:
+            # This is a http error. Good.
+            page_crawl = PageCrawl(
+                original_url_split=url_split_to_crawl,
+                final_url_split=None, status=response.status,
+                is_timeout=False, is_redirect=False, links=[],
+                exception=None, is_html=False,
+                depth=worker_input.depth,
+                response_time=response.response_time,
+                process_time=None,
+                site_origin=worker_input.site_origin)
+        elif response.is_timeout:
+            # This is a timeout. No need to wrap the exception
+            page_crawl = PageCrawl(
+                original_url_split=url_split_to_crawl,
+                final_url_split=None, status=None,
+                is_timeout=True, is_redirect=False, links=[],
+                exception=None, is_html=False,
+                depth=worker_input.depth,
+                response_time=response.response_time,
+                process_time=0,
+                site_origin=worker_input.site_origin)
+        else:
+            # Something bad happened when opening the url
+            exception = ExceptionStr(
+                unicode(type(response.exception)),
+                unicode(response.exception))
             page_crawl = PageCrawl(
                 original_url_split=url_split_to_crawl,
                 final_url_split=None, status=None,
                 is_timeout=False, is_redirect=False, links=[],
                 exception=exception, is_html=False,
                 depth=worker_input.depth,
-                response_time=None,
-                process_time=None,
+                response_time=response.response_time,
+                process_time=0,
                 site_origin=worker_input.site_origin)
-            self.logger.exception("Exception occurred while crawling a page.")
 
         return page_crawl
 
-    def _has_content_to_check(self, worker_input):
-        return worker_input.content_check and\
-            worker_input.content_check.has_something_to_check
+    def get_parse_input(self, worker_input, response):
+        """Builds a ParseInput from a successful Response. The body is only
+        downloaded if it must be parsed or checked."""
+        final_url_split = self.url_cache.get_clean_url_split(
+            response.final_url)
+
+        message = response.content.info()
+        mime_type = get_content_type(message)
+        if self.worker_config.prefer_server_encoding:
+            charset = get_charset(message)
+        else:
+            charset = None
+
+        is_html = mime_type == HTML_MIME_TYPE
+
+        content = None
+        if self._needs_body(worker_input, mime_type):
+            content = response.content.read()
+
+        return ParseInput(
+            worker_input=worker_input, final_url_split=final_url_split,
+            status=response.status, is_redirect=response.is_redirect,
+            response_time=response.response_time, mime_type=mime_type,
+            charset=charset, is_html=is_html, content=content)
+
+    def parse_page(self, parse_input):
+        """Builds a PageCrawl from a ParseInput: extracts links and checks
+        content if necessary."""
+        try:
+            return self._parse_page(parse_input)
+        except Exception as exc:
+            self.logger.exception("Exception occurred while parsing a page.")
+            return self._get_exception_page_crawl(
+                parse_input.worker_input, exc)
+
+    def _parse_page(self, parse_input):
+        erroneous_content = []
+        missing_content = []
+        worker_input = parse_input.worker_input
+        url_split_to_crawl = worker_input.url_split
+        final_url_split = parse_input.final_url_split
+        charset = parse_input.charset
+        links = []
+        process_time = None
+
+        if parse_input.is_html and worker_input.should_crawl and\
+                self._should_use_soup(url_split_to_crawl, final_url_split):
+            start = time.time()
+            if self._html_checks_apply(url_split_to_crawl, final_url_split):
+                parse_only = None
+            else:
+                # The tree only holds the elements inspected by get_links.
+                parse_only = self.link_strainer
+            html_soup = BeautifulSoup(
+                parse_input.content, self.worker_config.parser,
+                parse_only=parse_only, from_encoding=charset)
+            links = self.get_links(html_soup, final_url_split)
+            if self._has_content_to_check() and parse_only:
+                (missing_content, erroneous_content) =\
+                    self.check_content(
+                        self.get_text_content(parse_input.content, charset),
+                        None, url_split_to_crawl, final_url_split,
+                        self.content_check)
+            elif self._has_content_to_check():
+                (missing_content, erroneous_content) =\
+                    self.check_content(
+                        unicode(html_soup), html_soup,
+                        url_split_to_crawl,
+                        final_url_split, self.content_check)
+            process_time = time.time() - start
+        elif parse_input.is_html and worker_input.should_crawl:
+            start = time.time()
+            text_content = self.get_text_content(parse_input.content, charset)
+            links = self.extract_links(text_content, final_url_split)
+            if self._has_content_to_check():
+                (missing_content, erroneous_content) =\
+                    self.check_content(
+                        text_content, None, url_split_to_crawl,
+                        final_url_split, self.content_check)
+            process_time = time.time() - start
+        else:
+            self.logger.debug(
+                "Won't crawl %s. MIME Type: %s. Should crawl: %s",
+                final_url_split, parse_input.mime_type,
+                worker_input.should_crawl)
+            if self._has_content_to_check():
+                text_content = self.get_text_content(
+                    parse_input.content, charset)
+                (missing_content, erroneous_content) =\
+                    self.check_content(
+                        text_content, None, url_split_to_crawl,
+                        final_url_split, self.content_check)
+
+        return PageCrawl(
+            original_url_split=url_split_to_crawl,
+            final_url_split=final_url_split, status=parse_input.status,
+            is_timeout=False, is_redirect=parse_input.is_redirect,
+            links=links, exception=None, is_html=parse_input.is_html,
+            depth=worker_input.depth,
+            response_time=parse_input.response_time,
+            process_time=process_time,
+            site_origin=worker_input.site_origin,
+            missing_content=missing_content,
+            erroneous_content=erroneous_content)
+
+    def _get_parse_error_page_crawl(self, worker_input, exc):
+        """Returns the PageCrawl of a page that the parse pool failed to
+        parse, e.g., because the page could not be pickled."""
+        self.logger.error(
+            "Exception occurred while parsing a page in the parse pool: "
+            "{0}".format(exc))
+        return self._get_exception_page_crawl(worker_input, exc)
+
+    def _get_exception_page_crawl(self, worker_input, exc):
+        exception = ExceptionStr(unicode(type(exc)), unicode(exc))
+        return PageCrawl(
+            original_url_split=worker_input.url_split,
+            final_url_split=None, status=None,
+            is_timeout=False, is_redirect=False, links=[],
+            exception=exception, is_html=False,
+            depth=worker_input.depth,
+            response_time=None,
+            process_time=None,
+            site_origin=worker_input.site_origin)
+
+    def _has_content_to_check(self):
+        return self.content_check and\
+            self.content_check.has_something_to_check
+
+    def _content_check_applies(self, url_split):
+        """Returns True if the content of the url split must be checked."""
+        if not self._has_content_to_check():
+            return False
+
+        return self._checks_apply(
+            (self.content_check.html_presence,
+             self.content_check.html_absence,
+             self.content_check.text_presence,
+             self.content_check.text_absence), (url_split,))
+
+    def _should_use_soup(self, original_url_split, final_url_split):
+        """Returns True if a BeautifulSoup tree is needed to extract links
+        and check the HTML content of a page."""
+        return self.worker_config.link_extractor == LINK_EXTRACTOR_SOUP or\
+            self._html_checks_apply(original_url_split, final_url_split)
+
+    def _html_checks_apply(self, original_url_split, final_url_split):
+        if not self._has_content_to_check():
+            return False
+
+        return self._checks_apply(
+            (self.content_check.html_presence,
+             self.content_check.html_absence),
+            (original_url_split, final_url_split))
+
+    def _checks_apply(self, check_maps, url_splits):
+        for checks in check_maps:
+            for key in checks:
+                if key == PREFIX_ALL:
+                    return True
+                for url_split in url_splits:
+                    if is_similar_url_split(key, url_split):
+                        return True
+        return False
 
     def get_text_content(self, binary_blob, charset):
         """Retrieves unicode content from response binary blob.
@@ -499,24 +1072,34 @@ class PageCrawler(object):
         :rtype: A sequence of Link objects
         """
 
+        for element_type in self.worker_config.types:
+            if element_type not in TYPE_ATTRIBUTES:
+                raise Exception(
+                    "Unknown element type: {0}".format(element_type))
+
+        # Walks the tree once and groups the elements by type.
+        base = None
+        elements_by_type = dict(
+            (element_type, []) for element_type in self.worker_config.types)
+        for element in html_soup.find_all(
+                ['base'] + list(self.worker_config.types)):
+            if element.name == 'base':
+                if base is None:
+                    base = element
+            else:
+                elements_by_type[element.name].append(element)
+
         # This is a weird html tag that defines the base URL of a page.
         base_url_split = original_url_split
-
-        bases = html_soup.find_all('base')
-        if bases:
-            base = bases[0]
-            if 'href' in base.attrs:
-                base_url_split = get_clean_url_split(base['href'])
+        if base is not None and 'href' in base.attrs:
+            base_url_split = self.url_cache.get_clean_url_split(
+                base['href'] or "")
 
         links = []
         for element_type in self.worker_config.types:
-            if element_type not in TYPE_ATTRIBUTES:
-                raise Exception(
-                    "Unknown element type: {0}".format(element_type))
-            attribute = TYPE_ATTRIBUTES[element_type]
-            element_links = html_soup.find_all(element_type)
             links.extend(self._get_links(
-                element_links, attribute, base_url_split, original_url_split))
+                elements_by_type[element_type], TYPE_ATTRIBUTES[element_type],
+                base_url_split, original_url_split))
         return links
 
     def _get_links(self, elements, attribute, base_url_split,
@@ -524,27 +1107,52 @@ class PageCrawler(object):
         links = []
         for element in elements:
             if attribute in element.attrs:
-                url = element[attribute]
-
-                if not self.worker_config.strict_mode:
-                    url = url.strip()
-
-                if not is_link(url):
-                    continue
-                abs_url_split = get_absolute_url_split(url, base_url_split)
-
-                if not is_supported_scheme(
-                        abs_url_split, self.worker_config.ignore_bad_tel_urls):
-                    continue
-
-                link = Link(
-                    type=unicode(element.name), url_split=abs_url_split,
-                    original_url_split=original_url_split,
-                    source_str=unicode(element))
-                links.append(link)
+                # An attribute without a value is None with some versions
+                # of BeautifulSoup.
+                link = self._get_link(
+                    element.name, element[attribute] or "",
+                    self._get_source_str(element), base_url_split,
+                    original_url_split)
+                if link:
+                    links.append(link)
 
         return links
 
+    def _get_source_str(self, element):
+        """Returns the start tag of an element, which is only reported with
+        --show-source."""
+        if not self.worker_config.show_source:
+            return None
+        return get_compact_source(
+            get_start_tag(element.name, element.attrs.items()))
+
+    def _get_link(self, element_type, url, source_str, base_url_split,
+                  original_url_split):
+        """Returns a Link or None if the URL is not a link that can be
+        checked."""
+        if not self.worker_config.strict_mode:
+            url = url.strip()
+
+        if not is_link(url):
+            return None
+        abs_url_split = self.url_cache.get_absolute_url_split(
+            url, base_url_split)
+
+        if not is_supported_scheme(
+                abs_url_split, self.worker_config.ignore_bad_tel_urls):
+            return None
+
+        href = None
+        canonical_url_split = self.url_canonicalizer.canonicalize(
+            abs_url_split)
+        if canonical_url_split is not abs_url_split:
+            href = abs_url_split.geturl()
+
+        return Link(
+            type=unicode(element_type), url_split=canonical_url_split,
+            original_url_split=original_url_split, source_str=source_str,
+            href=href)
+
 
 class Site(UTF8Class):
     """Contains all the visited and visiting pages of a site.
@@ -553,31 +1161,57 @@ class Site(UTF8Class):
     a time!
     """
 
-    def __init__(self, start_url_splits, config, logger=None):
+    def __init__(self, start_url_splits, config, logger=None, storage=None):
         self.start_url_splits = start_url_splits
 
-        self.pages = {}
+        if storage is None:
+            storage = MemoryStorage()
+        self.storage = storage
+
+        self.urls = storage.urls
+        """IDs of all the URLs found during the crawl"""
+
+        self.pages_by_id = {}
+        """Map of url ID:SitePage"""
+
+        self.pages = URLMapping(self.urls, self.pages_by_id)
         """Map of url:SitePage"""
 
         self.multi_pages = defaultdict(dict)
         """Map of netloc:map(url:SitePage). Only used in multi sites mode."""
 
-        self.error_pages = {}
+        self.error_pages_by_id = {}
+        """Map of url ID:SitePage with is_ok=False"""
+
+        self.error_pages = URLMapping(self.urls, self.error_pages_by_id)
         """Map of url:SitePage with is_ok=False"""
 
         self.multi_error_pages = defaultdict(dict)
         """Map of netloc:map(url:SitePage). Only used in multi sites
         mode."""
 
-        self.page_statuses = {}
-        """Map of url:PageStatus (PAGE_QUEUED, PAGE_CRAWLED)"""
+        self.page_statuses = storage.page_statuses
+        """Status (PAGE_QUEUED, PAGE_CRAWLED) of each url ID and sources of
+        the queued URLs. The origins of the sources are url IDs."""
+
+        self.page_count = 0
+        """Number of pages crawled, including the pages that are not kept"""
+
+        self.response_time_sum = 0
+        self.response_time_count = 0
+        self.process_time_sum = 0
+        self.process_time_count = 0
 
         self.config = config
 
+        self.errors_only = config.options.retention == RETENTION_ERRORS
+        """If True, only the pages with errors are kept in pages. The pages
+        that are ok are only counted."""
+
         self.logger = logger
 
         for start_url_split in self.start_url_splits:
-            self.page_statuses[start_url_split] = PageStatus(PAGE_QUEUED, [])
+            self.page_statuses.add_queued(self.urls.get_id(start_url_split))
 
     def collect_multi_sites(self):
         """Collects page results and maps them to their respective domain in
@@ -589,6 +1223,24 @@ class Site(UTF8Class):
         for url, page in self.error_pages.items():
             self.multi_error_pages[page.site_origin][url] = page
 
+    def close(self):
+        """Closes the storage at the end of the crawl. The URLs of the pages
+        that are kept and of their sources can still be read."""
+        pages = list(self.pages_by_id.values())
+        pages.extend(self.error_pages_by_id.values())
+        url_ids = set()
+        for page in pages:
+            url_ids.update(page.get_url_ids())
+
+        urls = self.storage.get_closed_urls(url_ids)
+        if urls is not self.urls:
+            self.urls = urls
+            self.pages.url_table = urls
+            self.error_pages.url_table = urls
+            for page in pages:
+                page.url_table = urls
+        self.storage.close()
+
     @property
     def is_ok(self):
         """Returns True if there is no error page."""
@@ -596,17 +1248,16 @@ class Site(UTF8Class):
 
     def add_crawled_page(self, page_crawl):
         """Adds a crawled page. Returns a list of url split to crawl"""
-        if page_crawl.original_url_split not in self.page_statuses:
+        original_url_id = self.urls.find_id(page_crawl.original_url_split)
+        if original_url_id is None or\
+                self.page_statuses.get_status(original_url_id) is None:
             self.logger.warning("Original URL not seen before!")
             return []
 
-        status = self.page_statuses[page_crawl.original_url_split]
-
         # Mark it as crawled
-        self.page_statuses[page_crawl.original_url_split] = PageStatus(
-            PAGE_CRAWLED, None)
+        sources = self.page_statuses.set_crawled(original_url_id)
 
-        if page_crawl.original_url_split in self.pages:
+        if original_url_id in self.pages_by_id:
             self.logger.warning(
                 "Original URL already crawled! Concurrency issue!")
             return []
@@ -615,14 +1266,29 @@ class Site(UTF8Class):
         if not final_url_split:
             # Happens on 404/500/timeout/error
             final_url_split = page_crawl.original_url_split
+        final_url_id = self.urls.get_id(final_url_split)
 
-        if final_url_split in self.pages:
+        if self.errors_only:
+            is_new_page = self._mark_final_url(
+                original_url_id, final_url_id, sources)
+        else:
+            is_new_page = final_url_id not in self.pages_by_id
+
+        if not is_new_page:
             # This means that we already processed this final page.
             # It's a redirect. Just add a source
-            site_page = self.pages[final_url_split]
-            site_page.add_sources(status.sources)
+            site_page = self.pages_by_id.get(final_url_id)
+            if site_page:
+                site_page.add_sources(sources)
         else:
             # We never crawled this page before
+            self._add_page_stats(page_crawl)
+            is_ok = is_page_ok(
+                page_crawl.status, page_crawl.missing_content,
+                page_crawl.erroneous_content)
+            if is_ok and self.errors_only:
+                return self.process_links(page_crawl)
+
             is_local = self.config.is_local(final_url_split)
             site_page = SitePage(
                 final_url_split, page_crawl.status,
@@ -632,21 +1298,57 @@ class Site(UTF8Class):
                 process_time=page_crawl.process_time,
                 site_origin=page_crawl.site_origin,
                 missing_content=page_crawl.missing_content,
-                erroneous_content=page_crawl.erroneous_content)
-            site_page.add_sources(status.sources)
-            self.pages[final_url_split] = site_page
+                erroneous_content=page_crawl.erroneous_content,
+                url_table=self.urls, sources=self.build_sources())
+            site_page.add_sources(sources)
+            self.pages_by_id[final_url_id] = site_page
 
-            if not site_page.is_ok:
-                self.error_pages[final_url_split] = site_page
+            if not is_ok:
+                self.error_pages_by_id[final_url_id] = site_page
 
         return self.process_links(page_crawl)
 
+    def _mark_final_url(self, original_url_id, final_url_id, sources):
+        """Marks the final URL of a redirect as crawled in errors only mode,
+        where pages that are ok are not kept. Returns True if the final URL
+        was never crawled before."""
+        if final_url_id == original_url_id:
+            return True
+
+        final_status = self.page_statuses.get_status(final_url_id)
+        if final_status is None:
+            self.page_statuses.add_queued(final_url_id)
+            self.page_statuses.set_crawled(final_url_id)
+            return True
+        elif final_status == PAGE_QUEUED:
+            # The final URL will be crawled: it gets the sources.
+            self.page_statuses.add_sources(final_url_id, sources)
+        return False
+
+    def build_sources(self):
+        """Returns the PageSources keeping the sources of a page according
+        to --sources."""
+        return PageSources(
+            self.config.options.sources, self.config.options.max_sources)
+
+    def _add_page_stats(self, page_crawl):
+        self.page_count += 1
+        if page_crawl.response_time is not None:
+            self.response_time_sum += page_crawl.response_time
+            self.response_time_count += 1
+        if page_crawl.process_time is not None:
+            self.process_time_sum += page_crawl.process_time
+            self.process_time_count += 1
+
     def process_links(self, page_crawl):
         links_to_process = []
 
         source_url_split = page_crawl.original_url_split
         if page_crawl.final_url_split:
             source_url_split = page_crawl.final_url_split
+        # The URL of the origin is only kept if one of its sources is kept.
+        source_url_id = self.urls.get_id(source_url_split)
+        is_origin_kept = False
 
         for link in page_crawl.links:
             url_split = link.url_split
@@ -657,44 +1359,53 @@ class Site(UTF8Class):
                     LazyLogParam(lambda: self.config.is_local(url_split)))
                 continue
 
-            page_status = self.page_statuses.get(url_split, None)
-            page_source = PageSource(source_url_split, link.source_str)
+            url_id = self.urls.get_id(url_split)
+            page_status = self.page_statuses.get_status(url_id)
+            page_source = PageSource(
+                source_url_id, link.source_str, link.href)
 
+            is_source_kept = False
             if not page_status:
                 # We never encountered this url before
-                self.page_statuses[url_split] = PageStatus(
-                    PAGE_QUEUED, [page_source])
+                page_sources = self.build_sources()
+                is_source_kept = page_sources.append(page_source)
+                self.page_statuses.add_queued(url_id, page_sources)
                 should_crawl = self.config.should_crawl(
                     url_split, page_crawl.depth)
                 links_to_process.append(WorkerInput(
                     url_split, should_crawl, page_crawl.depth + 1,
-                    page_crawl.site_origin, self.config.content_check))
-            elif page_status.status == PAGE_CRAWLED:
+                    page_crawl.site_origin))
+            elif page_status == PAGE_CRAWLED:
                 # Already crawled. Add source
-                if url_split in self.pages:
-                    self.pages[url_split].add_sources([page_source])
+                if url_id in self.pages_by_id:
+                    is_source_kept = self.pages_by_id[url_id].add_source(
+                        page_source)
                 else:
                     # TODO the final url is different. need a way to link it...
                     pass
-            elif page_status.status == PAGE_QUEUED:
+            elif page_status == PAGE_QUEUED:
                 # Already queued for crawling. Add source.
-                page_status.sources.append(page_source)
+                is_source_kept = self.page_statuses.add_source(
+                    url_id, page_source)
+
+            if is_source_kept and not is_origin_kept:
+                self.urls.add(source_url_split)
+                is_origin_kept = True
 
         return links_to_process
 
+    def get_seen_error_rate(self):
+        """Returns the probability that a new URL was wrongly considered
+        already seen and was not checked or None if the storage is exact."""
+        return self.storage.get_error_rate()
+
     def get_average_response_time(self):
         """Computes the average response time of pages that returned an HTTP
         code (good or bad). Exceptions such as timeout are ignored.
         """
-        response_time_sum = 0
-        total = 0
-        for page in self.pages.values():
-            if page.response_time is not None:
-                response_time_sum += page.response_time
-                total += 1
-
-        if total > 0:
-            return float(response_time_sum) / float(total)
+        if self.response_time_count > 0:
+            return float(self.response_time_sum) /\
+                float(self.response_time_count)
         else:
             return 0
 
@@ -702,15 +1413,9 @@ class Site(UTF8Class):
         """Computes the average process (parse) time of pages that returned an HTTP
         code (good or bad). Exceptions are ignored.
         """
-        process_time_sum = 0
-        total = 0
-        for page in self.pages.values():
-            if page.process_time is not None:
-                process_time_sum += page.process_time
-                total += 1
-
-        if total > 0:
-            return float(process_time_sum) / float(total)
+        if self.process_time_count > 0:
+            return float(self.process_time_sum) /\
+                float(self.process_time_count)
         else:
             return 0
 
@@ -724,8 +1429,41 @@ def crawl_page(worker_init):
     page_crawler.crawl_page_forever()
 
 
+# Page crawler of a parse pool process. Only used to parse pages.
+page_parser = None
+
+
+def init_page_parser(worker_config, content_check):
+    """Initializes a parse pool process."""
+    global page_parser
+    page_parser = PageCrawler(WorkerInit(
+        worker_config=worker_config, content_check=content_check))
+
+
+def parse_page(parse_input):
+    """Parses a page in a parse pool process and returns a PageCrawl."""
+    return page_parser.parse_page(parse_input)
+
+
+def crawl_page_threads(worker_init, thread_count):
+    """Runs thread_count page crawlers in the current process and waits for
+    them to finish."""
+    from threading import Thread
+
+    # One logger per process: get_logger adds a handler at each call.
+    worker_init = worker_init._replace(logger=get_logger())
+    threads = [Thread(target=crawl_page, kwargs={'worker_init': worker_init})
+               for _ in range(thread_count)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+
 def open_url(open_func, request_class, url, timeout, timeout_exception,
-             auth_header=None, extra_headers=None, logger=None):
+             auth_header=None, extra_headers=None, logger=None, method=None):
     """Opens a URL and returns a Response object.
 
     All parameters are required to be able to use a patched version of the
@@ -740,11 +1478,16 @@ def open_url(open_func, request_class, url, timeout, timeout_exception,
     :param auth_header: authentication header
     :param extra_headers: dict of {Header: Value}
     :param logger: logger used to log exceptions
+    :param method: HTTP method (GET by default)
     :rtype: A Response object
     """
     try:
         request = request_class(url)
 
+        if method:
+            # Python 2 Request does not accept a method parameter.
+            request.get_method = lambda: method
+
         if auth_header:
             request.add_header(auth_header[0], auth_header[1])
 
@@ -795,6 +1538,10 @@ def execute_from_command_line():
         config.parse_cli_config()
 
         logger = configure_logger(config)
+        if config.options.benchmark_parsers:
+            execute_parser_benchmarks(config, logger)
+            return
+
         crawler = execute_from_config(config, logger)
 
         stop = time.time()
@@ -809,6 +1556,21 @@ def execute_from_command_line():
         sys.exit(1)
 
 
+def execute_parser_benchmarks(config, logger):
+    """Benchmarks the available parsers on the files of --benchmark-parsers
+    and reports the results."""
+    worker_config = config.worker_config
+    if worker_config.parser == PARSER_AUTO:
+        worker_config = worker_config._replace(parser=PARSER_STDLIB)
+    page_crawler = PageCrawler(WorkerInit(
+        worker_config, None, None, logger, config.content_check, None))
+
+    parse_inputs = read_parse_inputs(config.options.benchmark_parsers)
+    benchmarks = benchmark_parsers(page_crawler, parse_inputs)
+    report_parser_benchmarks(benchmarks, len(parse_inputs))
+    return benchmarks
+
+
 def configure_logger(config):
     """Configures a logger based on the configuration."""
     if config.options.verbose == VERBOSE_QUIET:
@@ -844,8 +1606,14 @@ def execute_from_config(config, logger):
         crawler = ThreadSiteCrawler(config, logger)
     elif config.options.mode == MODE_PROCESS:
         crawler = ProcessSiteCrawler(config, logger)
+    elif config.options.mode == MODE_HYBRID:
+        crawler = HybridSiteCrawler(config, logger)
     elif config.options.mode == MODE_GREEN:
         crawler = GreenSiteCrawler(config, logger)
+    elif config.options.mode == MODE_ASYNC:
+        # Not imported at the top: requires Python 3.5+.
+        from pylinkvalidator.asynccrawler import AsyncSiteCrawler
+        crawler = AsyncSiteCrawler(config, logger)
 
     if not crawler:
         raise Exception("Invalid crawling mode supplied.")
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the link extractors used to find links without building a
+BeautifulSoup tree.
+"""
+from __future__ import unicode_literals, absolute_import
+
+import codecs
+import re
+
+from pylinkvalidator.compat import HTMLParser
+from pylinkvalidator.models import (
+    TYPE_ATTRIBUTES, PARSER_STDLIB, PARSER_LXML)
+
+
+STREAM_CHUNK_SIZE = 64 * 1024
+"""Number of bytes read from the response before the links found so far are
+sent to the orchestrator."""
+
+DEFAULT_ENCODING = "utf-8"
+
+MAX_SOURCE_LENGTH = 128
+"""Sources of links are truncated to this length: reports only show their
+beginning."""
+
+META_CHARSET_RE = re.compile(
+    br"""<\s*meta[^>]+charset\s*=\s*["']?([^>]*?)[ /;'">]""", re.I)
+
+
+def get_stream_encoding(charset, first_chunk):
+    """Returns the encoding used to decode a page from the charset sent by
+    the server, the charset declared in the first chunk of the page, or
+    utf-8."""
+    candidates = [charset]
+    match = META_CHARSET_RE.search(first_chunk)
+    if match:
+        candidates.append(match.group(1).decode("ascii", "ignore"))
+
+    for candidate in candidates:
+        if not candidate:
+            continue
+        try:
+            return codecs.lookup(candidate).name
+        except LookupError:
+            pass
+    return DEFAULT_ENCODING
+
+
+def get_start_tag(tag, attrs):
+    """Returns the start tag of an element built from its attributes.
+    Multi-valued attributes (e.g., class in BeautifulSoup) are joined."""
+    return "<{0}{1}>".format(tag, "".join(
+        ' {0}="{1}"'.format(name, _escape_attribute(value))
+        for name, value in attrs))
+
+
+def get_compact_source(source):
+    """Returns the source of a link truncated to MAX_SOURCE_LENGTH."""
+    return source[:MAX_SOURCE_LENGTH]
+
+
+def _escape_attribute(value):
+    if isinstance(value, (list, tuple)):
+        value = " ".join(value)
+    return (value or "").replace("&", "&amp;").replace('"', "&quot;")
+
+
+LINK_EXTRACTOR_PARSERS = (PARSER_STDLIB, PARSER_LXML)
+"""Parsers with their own link extractor. The other parsers (html5lib) use
+the html.parser link extractor."""
+
+
+def get_link_extractor(types, parser, show_source=True):
+    """Returns a link extractor that finds the elements of the given types.
+    The lxml parser is used if it was selected with --parser. The source of
+    the links is None if show_source is False."""
+    if parser == PARSER_LXML:
+        return LxmlLinkExtractor(types, show_source)
+    return LinkExtractor(types, show_source)
+
+
+class BaseLinkExtractor(object):
+    """Collects the link elements of a page without building a tree.
+
+    Chunks of the page are given to feed and the links found so far are
+    returned by pop_links as tuples (element type, attribute value, source).
+    Links are only returned once the base URL of the page is known, i.e.,
+    after the first base element, the end of the head, the start of the body,
+    or the end of the page.
+
+    Attributes are read like BeautifulSoup reads them: the last value of a
+    duplicate attribute wins and an attribute without a value is "". The
+    first base element of the page is used even if it comes after the body,
+    as long as no link was returned before it.
+    """
+
+    def __init__(self, types, show_source=True):
+        self.show_source = show_source
+        self.attributes = dict(
+            (element_type, TYPE_ATTRIBUTES[element_type])
+            for element_type in types)
+        self.links = []
+
+        self.base_url = None
+        """The href of the first base element"""
+
+        self.base_known = False
+
+        self.base_found = False
+        """True once the first base element was read"""
+
+        self.links_popped = False
+        """True once links were resolved by the caller: a later base element
+        cannot change their URL"""
+
+    def start_element(self, tag, attrs):
+        if tag == "base":
+            if not self.base_found and not self.links_popped:
+                self.base_url = _get_attribute(attrs, "href")
+                self.base_found = True
+            self.base_known = True
+        elif tag == "body":
+            self.base_known = True
+
+        attribute = self.attributes.get(tag)
+        if attribute:
+            value = _get_attribute(attrs, attribute)
+            if value is not None:
+                source = None
+                if self.show_source:
+                    source = get_compact_source(
+                        self.get_source(tag, _get_unique_attributes(attrs)))
+                self.links.append((tag, value, source))
+
+    def end_element(self, tag):
+        if tag == "head":
+            self.base_known = True
+
+    def get_source(self, tag, attrs):
+        """Returns the source of the element that is currently parsed: its
+        start tag rebuilt from its attributes, like the source of the links
+        found in a BeautifulSoup tree."""
+        return get_start_tag(tag, attrs)
+
+    def pop_links(self):
+        """Returns the links found since the last call if the base URL is
+        known or an empty list."""
+        if not self.base_known:
+            return []
+        links = self.links
+        self.links = []
+        if links:
+            self.links_popped = True
+        return links
+
+
+def _get_attribute(attrs, name):
+    """Returns the last value of the attribute, "" if it has no value, or
+    None if the element does not have it."""
+    value = None
+    for attribute_name, attribute_value in attrs:
+        if attribute_name == name:
+            value = attribute_value or ""
+    return value
+
+
+def _get_unique_attributes(attrs):
+    """Returns the attributes with the last value of duplicate attributes at
+    the position of their first occurrence."""
+    names = [name for name, _ in attrs]
+    if len(set(names)) == len(names):
+        return attrs
+    values = dict(attrs)
+    unique_attrs = []
+    for name in names:
+        if name in values:
+            unique_attrs.append((name, values.pop(name)))
+    return unique_attrs
+
+
+class LinkExtractor(BaseLinkExtractor, HTMLParser):
+    """Link extractor based on the tokenizer of the standard library."""
+
+    def __init__(self, types, show_source=True):
+        BaseLinkExtractor.__init__(self, types, show_source)
+        HTMLParser.__init__(self)
+
+    def handle_starttag(self, tag, attrs):
+        self.start_element(tag, attrs)
+
+    def handle_endtag(self, tag):
+        self.end_element(tag)
+
+    def close(self):
+        HTMLParser.close(self)
+        self.base_known = True
+
+
+class LxmlLinkExtractor(BaseLinkExtractor):
+    """Link extractor based on the lxml HTML parser."""
+
+    def __init__(self, types, show_source=True):
+        from lxml import etree
+        BaseLinkExtractor.__init__(self, types, show_source)
+        self.parser = etree.HTMLParser(target=_LxmlTarget(self))
+
+    def feed(self, data):
+        self.parser.feed(data)
+
+    def close(self):
+        self.parser.close()
+        self.base_known = True
+
+
+class _LxmlTarget(object):
+    """Parser target forwarding the lxml parser events to an extractor."""
+
+    def __init__(self, extractor):
+        self.extractor = extractor
+
+    def start(self, tag, attrib):
+        self.extractor.start_element(tag, list(attrib.items()))
+
+    def end(self, tag):
+        self.extractor.end_element(tag)
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        return None
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the crawl frontier: the URLs waiting to be handed to the workers.
+"""
+from __future__ import unicode_literals, absolute_import
+
+from collections import deque
+import heapq
+import itertools
+import time
+
+from pylinkvalidator.models import (
+    FRONTIER_FIFO, FRONTIER_DEPTH, FRONTIER_CRAWL_FIRST)
+
+
+def fifo_priority(worker_input):
+    """URLs are crawled in the order they were found."""
+    return 0
+
+
+def depth_priority(worker_input):
+    """Breadth-first: URLs closer to the start URLs are crawled first."""
+    return worker_input.depth
+
+
+def crawl_first_priority(worker_input):
+    """Pages that will be crawled (and can grow the frontier) are fetched
+    before resources that are only checked, breadth-first."""
+    return (not worker_input.should_crawl, worker_input.depth)
+
+
+MIN_DELAY = 0.001
+"""Minimum number of seconds returned by Frontier.get_delay so the
+orchestrator never polls its output queue with a zero timeout."""
+
+
+MEMORY_SIZE = 10000
+"""Maximum number of WorkerInputs kept in memory when the frontier has an
+overflow queue."""
+
+
+PRIORITY_FUNCTIONS = {
+    FRONTIER_FIFO: fifo_priority,
+    FRONTIER_DEPTH: depth_priority,
+    FRONTIER_CRAWL_FIRST: crawl_first_priority,
+}
+"""Map of --frontier-order value:priority function. A priority function
+returns a sortable key for a WorkerInput: lower keys are crawled first.
+Functions can be added to this map before the configuration is parsed."""
+
+
+class TokenBucket(object):
+    """Token bucket refilled at rate tokens per second.
+
+    The capacity is one second worth of tokens (at least one token) and the
+    bucket starts with a single token to prevent an initial burst.
+    """
+
+    def __init__(self, rate):
+        self.rate = float(rate)
+        self.capacity = max(1.0, self.rate)
+        self.tokens = 1.0
+        self.last_update = time.time()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self.last_update)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.last_update = now
+
+    def consume(self, now):
+        """Returns True and consumes a token if one is available."""
+        self._refill(now)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def get_delay(self, now):
+        """Returns the number of seconds before a token is available."""
+        self._refill(now)
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+
+class HostQueue(object):
+    """Pending WorkerInputs of a single host with its politeness state."""
+
+    def __init__(self, host_limit):
+        self.pending = []
+        """Heap of (priority, sequence number, WorkerInput)"""
+
+        self.in_flight = 0
+        self.concurrency = host_limit.concurrency
+        self.bucket = None
+        if host_limit.rate:
+            self.bucket = TokenBucket(host_limit.rate)
+
+    def is_full(self):
+        return bool(self.concurrency) and self.in_flight >= self.concurrency
+
+    def is_busy(self):
+        return bool(self.pending) or self.in_flight > 0
+
+
+class Frontier(object):
+    """Keeps one priority queue per host and hands out work round-robin
+    across hosts.
+
+    A host is skipped while it has reached its maximum number of in-flight
+    requests or while its token bucket is empty, so a slow host cannot block
+    the others. Among the hosts that can be crawled, the WorkerInput with
+    the lowest priority key is handed out first and ties are broken
+    round-robin.
+
+    The queue of a host is removed when the host has no pending or
+    in-flight work so crawls with many hosts do not accumulate them.
+
+    If an overflow queue is given (e.g., stored on disk), at most
+    memory_size WorkerInputs are kept in memory. The others are put in the
+    overflow queue in the order they were found and are moved back to the
+    host queues when half of the memory size is available.
+
+    This class is NOT thread-safe and should only be accessed by the
+    orchestrator.
+    """
+
+    def __init__(self, default_host_limit, host_limits=None,
+                 priority_function=fifo_priority, overflow=None,
+                 memory_size=MEMORY_SIZE):
+        self.overflow = overflow
+        self.memory_size = memory_size
+        self.default_host_limit = default_host_limit
+        self.host_limits = host_limits or {}
+        self.priority_function = priority_function
+        self.counter = itertools.count()
+
+        self.hosts = {}
+        """Map of netloc:HostQueue"""
+
+        self.rotation = deque()
+        """Netlocs with pending WorkerInputs, in round-robin order."""
+
+        self.idle_hosts = set()
+        """Netlocs without pending or in-flight WorkerInputs. Their HostQueue
+        is removed once their token bucket has a token again so a new
+        HostQueue cannot crawl them sooner than their rate limit."""
+
+        self.size = 0
+        """Number of WorkerInputs in the host queues"""
+
+    def __len__(self):
+        if self.overflow is not None:
+            return self.size + len(self.overflow)
+        return self.size
+
+    def put(self, worker_input):
+        """Adds a WorkerInput to the queue of its host or to the overflow
+        queue if the memory size is reached."""
+        if self.overflow is not None and (
+                self.size >= self.memory_size or len(self.overflow)):
+            # WorkerInputs already in the overflow queue are older.
+            self.overflow.put(worker_input)
+            return
+        self._put(worker_input)
+
+    def _put(self, worker_input):
+        host = worker_input.url_split.netloc
+        host_queue = self._get_host_queue(host)
+        if not host_queue.pending:
+            self.rotation.append(host)
+        heapq.heappush(
+            host_queue.pending,
+            (self.priority_function(worker_input), next(self.counter),
+             worker_input))
+        self.size += 1
+
+    def pop(self):
+        """Returns the next WorkerInput that can be crawled right now or None
+        if all hosts with pending work are at their limits."""
+        if self.overflow is not None and len(self.overflow) and\
+                self.size <= self.memory_size // 2:
+            for worker_input in self.overflow.pop_many(
+                    self.memory_size - self.size):
+                self._put(worker_input)
+
+        now = time.time()
+        self._remove_idle_hosts(now)
+        best_index = None
+        best_priority = None
+        for index, host in enumerate(self.rotation):
+            host_queue = self.hosts[host]
+            if host_queue.is_full():
+                continue
+            if host_queue.bucket and host_queue.bucket.get_delay(now) > 0:
+                continue
+            priority = host_queue.pending[0][0]
+            if best_index is None or priority < best_priority:
+                best_index = index
+                best_priority = priority
+            if self.priority_function is fifo_priority:
+                # All priorities are equal: plain round-robin.
+                break
+
+        if best_index is None:
+            return None
+
+        host = self.rotation[best_index]
+        del self.rotation[best_index]
+        host_queue = self.hosts[host]
+        if host_queue.bucket:
+            host_queue.bucket.consume(now)
+
+        worker_input = heapq.heappop(host_queue.pending)[2]
+        if host_queue.pending:
+            # Next turn for this host is after the other hosts.
+            self.rotation.append(host)
+        host_queue.in_flight += 1
+        self.size -= 1
+        return worker_input
+
+    def done(self, url_split):
+        """Marks a WorkerInput returned by pop as crawled."""
+        host_queue = self.hosts.get(url_split.netloc)
+        if host_queue:
+            host_queue.in_flight -= 1
+            if not host_queue.is_busy():
+                self.idle_hosts.add(url_split.netloc)
+                self._remove_idle_hosts(time.time())
+
+    def get_delay(self):
+        """Returns the number of seconds before a rate-limited host can be
+        crawled again or None if no host is waiting for its rate limit."""
+        now = time.time()
+        delay = None
+        for host in self.rotation:
+            host_queue = self.hosts[host]
+            if host_queue.bucket and not host_queue.is_full():
+                host_delay = host_queue.bucket.get_delay(now)
+                if delay is None or host_delay < delay:
+                    delay = host_delay
+        if delay is None:
+            return None
+        return max(MIN_DELAY, delay)
+
+    def _remove_idle_hosts(self, now):
+        for host in list(self.idle_hosts):
+            host_queue = self.hosts[host]
+            if host_queue.is_busy():
+                self.idle_hosts.remove(host)
+            elif not host_queue.bucket or\
+                    host_queue.bucket.get_delay(now) == 0:
+                self.idle_hosts.remove(host)
+                del self.hosts[host]
+
+    def _get_host_queue(self, host):
+        host_queue = self.hosts.get(host)
+        if not host_queue:
+            host_limit = self.host_limits.get(host, self.default_host_limit)
+            host_queue = HostQueue(host_limit)
+            self.hosts[host] = host_queue
+        return host_queue
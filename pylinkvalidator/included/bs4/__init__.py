@@ -37,6 +37,7 @@ try:
 
         # Necessary for direct import in pylinkvalidator
         UnicodeDammit = bs4.UnicodeDammit
+        SoupStrainer = bs4.SoupStrainer
         use_system_version = True
         # Make sure we copy over the version. See #17071
         __version__ = bs4.__version__
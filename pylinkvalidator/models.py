@@ -11,11 +11,13 @@ from __future__ import unicode_literals, absolute_import
 from collections import namedtuple, Mapping, defaultdict
 from optparse import OptionParser, OptionGroup
 import re
+import sys
 
 from pylinkvalidator.included.bs4 import BeautifulSoup
 from pylinkvalidator.compat import get_safe_str
 from pylinkvalidator.urlutil import (
-    get_clean_url_split, get_absolute_url_split)
+    get_clean_url_split, get_absolute_url_split, DEFAULT_URL_CACHE_SIZE,
+    PrefixMatcher, HostMatcher, URLCanonicalizer)
 
 
 PREFIX_ALL = "*"
@@ -57,21 +59,88 @@ TYPE_ATTRIBUTES = {
 DEFAULT_TIMEOUT = 10
 
 
+DEFAULT_POOL_SIZE = 1
+"""Idle keep-alive connections kept per host by each worker."""
+
+DEFAULT_POOL_IDLE_TIMEOUT = 5
+
+
 MODE_THREAD = "thread"
 MODE_PROCESS = "process"
+MODE_HYBRID = "hybrid"
 MODE_GREEN = "green"
+MODE_ASYNC = "async"
 
 
 DEFAULT_WORKERS = {
     MODE_THREAD: 1,
     MODE_PROCESS: 1,
+    MODE_HYBRID: 1,
     MODE_GREEN: 1000,
+    MODE_ASYNC: 1000,
 }
 
 
+DEFAULT_MAX_WORKERS = {
+    MODE_THREAD: 50,
+    MODE_PROCESS: 8,
+    MODE_HYBRID: 8,
+    MODE_GREEN: 5000,
+    MODE_ASYNC: 5000,
+}
+"""Maximum number of workers in adaptive mode."""
+
+
+DEFAULT_THREADS_PER_PROCESS = 10
+
+
+DEFAULT_BATCH_SIZES = {
+    MODE_THREAD: 1,
+    MODE_PROCESS: 10,
+    MODE_HYBRID: 1,
+    MODE_GREEN: 1,
+    MODE_ASYNC: 1,
+}
+"""Maximum number of WorkerInputs sent to a worker in one message."""
+
+
+FRONTIER_FIFO = "fifo"
+FRONTIER_DEPTH = "depth"
+FRONTIER_CRAWL_FIRST = "crawl-first"
+
+
+LINK_EXTRACTOR_AUTO = "auto"
+LINK_EXTRACTOR_SOUP = "soup"
+
+
 PARSER_STDLIB = "html.parser"
 PARSER_LXML = "lxml"
 PARSER_HTML5 = "html5lib"
+PARSER_AUTO = "auto"
+
+
+STORAGE_MEMORY = "memory"
+STORAGE_SQLITE = "sqlite"
+STORAGE_FINGERPRINT = "fingerprint"
+STORAGE_BLOOM = "bloom"
+
+
+RETENTION_ALL = "all"
+RETENTION_ERRORS = "errors"
+
+
+SOURCES_ALL = "all"
+SOURCES_FIRST = "first"
+SOURCES_UNIQUE = "unique"
+SOURCES_COUNT = "count"
+
+
+DEFAULT_MAX_SOURCES = 10
+
+
+DEFAULT_BLOOM_CAPACITY = 1000000
+
+DEFAULT_BLOOM_ERROR_RATE = 0.001
 
 # TODO Add support for gumbo. Will require some refactoring of the parsing
 # logic.
@@ -108,19 +177,25 @@ PAGE_CRAWLED = '__PAGE_CRAWLED__'
 
 WorkerInit = namedtuple_with_defaults(
     "WorkerInit",
-    ["worker_config", "input_queue", "output_queue", "logger"])
+    ["worker_config", "input_queue", "output_queue", "logger",
+     "content_check", "parse_pool"])
+"""The content check is sent once to each worker instead of with each
+WorkerInput. The parse pool is only used in thread and async modes."""
 
 
 WorkerConfig = namedtuple_with_defaults(
     "WorkerConfig",
     ["username", "password", "types", "timeout", "parser", "strict_mode",
      "prefer_server_encoding", "extra_headers", "ignore_bad_tel_urls",
-     "allow_insecure_content"])
+     "allow_insecure_content", "pool_size", "pool_idle_timeout",
+     "use_head", "stream_links", "link_extractor", "show_source",
+     "url_cache_size", "keep_fragments", "sort_query",
+     "ignored_query_params"])
 
 
 WorkerInput = namedtuple_with_defaults(
     "WorkerInput",
-    ["url_split", "should_crawl", "depth", "site_origin", "content_check"])
+    ["url_split", "should_crawl", "depth", "site_origin"])
 
 
 Response = namedtuple_with_defaults(
@@ -128,13 +203,37 @@ Response = namedtuple_with_defaults(
                  "final_url", "is_redirect", "is_timeout", "response_time"])
 
 
+ParseInput = namedtuple_with_defaults(
+    "ParseInput",
+    ["worker_input", "final_url_split", "status", "is_redirect",
+     "response_time", "mime_type", "charset", "is_html", "content"])
+"""A downloaded page that can be parsed by another worker. content is None
+if the body was not downloaded."""
+
+
+LinkBatch = namedtuple_with_defaults(
+    "LinkBatch",
+    ["original_url_split", "final_url_split", "links", "depth",
+     "site_origin"])
+"""Links found in a page that is still downloading. The links found after are
+sent in the PageCrawl of the page."""
+
+
+ParserBenchmark = namedtuple_with_defaults(
+    "ParserBenchmark", ["parser", "parse_time", "peak_memory", "links"])
+"""Time and peak memory (None if it cannot be measured) used by a parser to
+parse pages and extract their links."""
+
+
 ExceptionStr = namedtuple_with_defaults(
     "ExceptionStr", ["type_name", "message"])
 
 
 Link = namedtuple_with_defaults(
     "Link",
-    ["type", "url_split", "original_url_split", "source_str"])
+    ["type", "url_split", "original_url_split", "source_str", "href"])
+"""href is the absolute URL found in the page if it was canonicalized to
+url_split (e.g., without its fragment) or None."""
 
 
 PageCrawl = namedtuple_with_defaults(
@@ -150,7 +249,7 @@ PageStatus = namedtuple_with_defaults(
 
 
 PageSource = namedtuple_with_defaults(
-    "PageSource", ["origin", "origin_str"])
+    "PageSource", ["origin", "origin_str", "href"])
 
 
 ContentCheck = namedtuple_with_defaults(
@@ -161,6 +260,23 @@ ContentCheck = namedtuple_with_defaults(
 HTMLCheck = namedtuple_with_defaults(
     "HTMLCheck", ["tag", "attrs", "content"])
 
+HostLimit = namedtuple_with_defaults(
+    "HostLimit", ["concurrency", "rate"], [0, 0])
+
+
+def is_page_ok(status, missing_content=None, erroneous_content=None):
+    """Returns True if a page returned a successful status and has no
+    missing or erroneous content."""
+    return bool(status and status < 400 and not missing_content and
+                not erroneous_content)
+
+
+def get_url_canonicalizer(worker_config):
+    """Returns the URLCanonicalizer configured by a WorkerConfig."""
+    return URLCanonicalizer(
+        worker_config.keep_fragments, worker_config.sort_query,
+        worker_config.ignored_query_params)
+
 
 class UTF8Class(object):
     """Handles unicode string from __unicode__() in: __str__() and __repr__()
@@ -195,14 +311,23 @@ class Config(UTF8Class):
         self.start_url_splits = []
         self.worker_config = None
 
-        self.accepted_hosts = []
-        """Set of accepted hosts. Dictionary of accepted hosts if in multi
-        mode: key: start url host, value: set of accepted hosts."""
+        self.accepted_hosts = HostMatcher()
+        """HostMatcher of accepted hosts. Dictionary of accepted hosts if in
+        multi mode: key: start url host, value: HostMatcher of accepted
+        hosts."""
 
-        self.ignored_prefixes = []
+        self.ignored_prefixes = PrefixMatcher()
         self.worker_size = 0
+        self.min_workers = 1
+        self.max_workers = 0
+        self.threads_per_process = DEFAULT_THREADS_PER_PROCESS
+        self.batch_size = 1
         self.content_check = None
 
+        self.default_host_limit = HostLimit()
+        self.host_limits = {}
+        """Map of netloc:HostLimit overriding the default host limit."""
+
     def should_crawl(self, url_split, depth):
         """Returns True if url split is local AND depth is acceptable"""
         return (self.options.depth < 0 or depth < self.options.depth) and\
@@ -227,11 +352,9 @@ class Config(UTF8Class):
         if not self.options.test_outside and not local:
             return False
 
-        url = url_split.geturl()
-
-        for ignored_prefix in self.ignored_prefixes:
-            if url.startswith(ignored_prefix):
-                return False
+        if self.ignored_prefixes and\
+                self.ignored_prefixes.match(url_split.geturl()):
+            return False
 
         return True
 
@@ -262,27 +385,87 @@ class Config(UTF8Class):
     def _parse_config(self):
         if self.options.url_file_path:
             self.start_urls = self._read_start_urls(self.options.url_file_path)
-        self._process_start_urls()
-
         self.worker_config = self._build_worker_config(self.options)
+        self._process_start_urls()
         self.accepted_hosts = self._build_accepted_hosts(
             self.options, self.start_urls)
 
         if self.options.ignored_prefixes:
-            self.ignored_prefixes = self.options.ignored_prefixes.split(',')
+            self.ignored_prefixes = PrefixMatcher(
+                self.options.ignored_prefixes.split(','))
 
         if self.options.workers:
             self.worker_size = self.options.workers
         else:
             self.worker_size = DEFAULT_WORKERS[self.options.mode]
 
+        if self.options.adaptive:
+            self._build_adaptive_workers(self.options)
+
+        if self.options.parse_workers and\
+                self.options.mode not in (MODE_THREAD, MODE_ASYNC):
+            raise ValueError(
+                "Parse workers are only supported in thread and async modes")
+        if self.options.parse_workers and sys.version_info[0] < 3:
+            # Python 2 pools do not report the pages they fail to parse.
+            raise ValueError("Parse workers require Python 3")
+
+        if self.options.storage_path:
+            self.options.storage = STORAGE_SQLITE
+
+        if self.options.retention == RETENTION_ERRORS and\
+                self.options.report_type == REPORT_TYPE_ALL:
+            raise ValueError(
+                "All pages cannot be reported if only errors are kept")
+
+        if not 0 < self.options.bloom_error_rate < 1 or\
+                self.options.bloom_capacity < 1:
+            raise ValueError(
+                "The Bloom filter error rate must be between 0 and 1 and its "
+                "capacity must be positive")
+
+        if self.options.stream_links and (
+                self.options.parse_workers or
+                self.options.mode == MODE_ASYNC):
+            raise ValueError(
+                "Streaming link extraction is not supported in async mode "
+                "or with parse workers")
+
+        if self.options.threads_per_process:
+            self.threads_per_process = self.options.threads_per_process
+
+        if self.options.batch_size:
+            self.batch_size = self.options.batch_size
+        else:
+            self.batch_size = DEFAULT_BATCH_SIZES[self.options.mode]
+
         if self.options.run_once:
             self.options.depth = 0
 
+        self.default_host_limit = self._check_host_limit(HostLimit(
+            self.options.host_concurrency, self.options.host_rate))
+        self.host_limits = self._build_host_limits(self.options)
+
         self.content_check = self._compute_content_check(self.options)
 
         self._add_content_check_urls(self.start_url_splits, self.content_check)
 
+    def _build_adaptive_workers(self, options):
+        if options.min_workers:
+            self.min_workers = options.min_workers
+        if options.max_workers:
+            self.max_workers = options.max_workers
+        else:
+            self.max_workers = max(
+                self.min_workers, DEFAULT_MAX_WORKERS[options.mode])
+
+        if self.min_workers > self.max_workers:
+            raise ValueError(
+                "The minimum number of workers is greater than the maximum")
+
+        self.worker_size = max(
+            self.min_workers, min(self.max_workers, self.worker_size))
+
     def _read_start_urls(self, url_file_path):
         urls = []
         with open(url_file_path, "r") as url_file:
@@ -290,8 +473,10 @@ class Config(UTF8Class):
         return urls
 
     def _process_start_urls(self):
+        canonicalizer = get_url_canonicalizer(self.worker_config)
         for start_url in self.start_urls:
-            self.start_url_splits.append(get_clean_url_split(start_url))
+            self.start_url_splits.append(canonicalizer.canonicalize(
+                get_clean_url_split(start_url)))
 
     def _build_worker_config(self, options):
         types = options.types.split(',')
@@ -300,6 +485,10 @@ class Config(UTF8Class):
                 raise ValueError("This type is not supported: {0}"
                                  .format(element_type))
 
+        ignored_query_params = None
+        if options.ignored_query_params:
+            ignored_query_params = options.ignored_query_params.split(',')
+
         headers = {}
         if options.headers:
             for item in options.headers:
@@ -311,7 +500,11 @@ class Config(UTF8Class):
             options.username, options.password, types, options.timeout,
             options.parser, options.strict_mode,
             options.prefer_server_encoding, headers,
-            options.ignore_bad_tel_urls)
+            options.ignore_bad_tel_urls, options.allow_insecure_content,
+            options.pool_size, options.pool_idle_timeout, options.use_head,
+            options.stream_links, options.link_extractor, options.show_source,
+            options.url_cache_size, options.keep_fragments,
+            options.sort_query, ignored_query_params)
 
     def _build_accepted_hosts(self, options, start_urls):
         if options.multi:
@@ -331,12 +524,12 @@ class Config(UTF8Class):
         for start_url in start_urls:
             split_result = get_clean_url_split(start_url)
             host = split_result.netloc
-            hosts[host] = extra_hosts.union(host)
+            hosts[host] = HostMatcher(extra_hosts.union([host]))
 
         return hosts
 
     def _build_single_hosts(self, options, start_urls):
-        hosts = set()
+        hosts = HostMatcher()
         urls = []
 
         if options.accepted_hosts:
@@ -349,6 +542,27 @@ class Config(UTF8Class):
 
         return hosts
 
+    def _build_host_limits(self, options):
+        host_limits = {}
+        if not options.host_limits:
+            return host_limits
+
+        for host_limit in options.host_limits:
+            split = host_limit.split(",")
+            if len(split) != 3:
+                raise ValueError("Invalid host limit: {0}".format(host_limit))
+            netloc = get_clean_url_split(split[0].strip()).netloc
+            host_limits[netloc] = self._check_host_limit(
+                HostLimit(int(split[1]), float(split[2])))
+
+        return host_limits
+
+    def _check_host_limit(self, host_limit):
+        if host_limit.concurrency < 0 or host_limit.rate < 0:
+            raise ValueError(
+                "The host concurrency and rate must not be negative")
+        return host_limit
+
     def _compute_content_check(self, options):
         html_presence = defaultdict(list)
         html_absence = defaultdict(list)
@@ -460,12 +674,27 @@ class Config(UTF8Class):
             "-H", "--accepted-hosts",
             dest="accepted_hosts",  action="store", default=None,
             help="comma-separated list of additional hosts to crawl (e.g., "
-            "example.com,subdomain.another.com)")
+            "example.com,subdomain.another.com,*.example.org)")
         crawler_group.add_option(
             "-i", "--ignore", dest="ignored_prefixes",
             action="store", default=None,
             help="comma-separated list of host/path prefixes to ignore "
             "(e.g., www.example.com/ignore_this_and_after/)")
+        crawler_group.add_option(
+            "--keep-fragments", dest="keep_fragments",
+            action="store_true", default=False,
+            help="keep the fragments (#...) of URLs: URLs that only differ "
+            "by their fragment are fetched once each")
+        crawler_group.add_option(
+            "--sort-query", dest="sort_query",
+            action="store_true", default=False,
+            help="sort query parameters so URLs that only differ by the "
+            "order of their parameters are fetched once")
+        crawler_group.add_option(
+            "--ignore-query-params", dest="ignored_query_params",
+            action="store", default=None,
+            help="comma-separated list of query parameters to remove from "
+            "URLs, wildcards are accepted (e.g., utm_*,fbclid)")
         crawler_group.add_option(
             "-b", "--ignore-bad-tel-urls", dest="ignore_bad_tel_urls",
             action="store_true", default=False,
@@ -570,14 +799,162 @@ class Config(UTF8Class):
             help="Number of workers to spawn")
         perf_group.add_option(
             "-m", "--mode", dest="mode", action="store",
-            help="Types of workers: thread (default), process, or green",
+            help="Types of workers: thread (default), process, hybrid "
+            "(processes running threads), green, or async (Python 3.5+)",
             default=MODE_THREAD, choices=[MODE_THREAD, MODE_PROCESS,
-                                          MODE_GREEN])
+                                          MODE_HYBRID, MODE_GREEN,
+                                          MODE_ASYNC])
+        perf_group.add_option(
+            "--adaptive", dest="adaptive", action="store_true",
+            default=False,
+            help="Adjusts the number of workers during the crawl based on "
+            "response times, errors, and the number of URLs to crawl. "
+            "--workers is the initial number of workers")
+        perf_group.add_option(
+            "--min-workers", dest="min_workers", action="store",
+            default=None, type="int",
+            help="Minimum number of workers in adaptive mode (default = 1)")
+        perf_group.add_option(
+            "--max-workers", dest="max_workers", action="store",
+            default=None, type="int",
+            help="Maximum number of workers in adaptive mode (default = 50 "
+            "threads, 8 processes, or 5000 green threads or coroutines)")
+        perf_group.add_option(
+            "--threads-per-process", dest="threads_per_process",
+            action="store", default=None, type="int",
+            help="Number of thread workers run by each process in hybrid "
+            "mode (default = 10)")
+        perf_group.add_option(
+            "--parse-workers", dest="parse_workers", action="store",
+            default=0, type="int",
+            help="Number of processes that parse the pages downloaded by the "
+            "workers (thread and async modes, Python 3). 0 means that "
+            "workers parse the pages they download (default)")
+        perf_group.add_option(
+            "--batch-size", dest="batch_size", action="store",
+            default=None, type="int",
+            help="Maximum number of URLs sent to a worker in one message. "
+            "Larger batches reduce inter-process communication in process "
+            "mode (default = 10 in process mode, 1 otherwise)")
         perf_group.add_option(
             "-R", "--parser", dest="parser", action="store",
-            help="Types of HTML parse: html.parser (default), lxml, html5lib",
+            help="Types of HTML parse: html.parser (default), lxml, "
+            "html5lib, or auto (fastest parser on the start pages that finds "
+            "the same links as html.parser)",
             default=PARSER_STDLIB, choices=[PARSER_STDLIB, PARSER_LXML,
-                                            PARSER_HTML5])
+                                            PARSER_HTML5, PARSER_AUTO])
+        perf_group.add_option(
+            "--benchmark-parsers", dest="benchmark_parsers",
+            action="append", metavar="FILE",
+            help="Reports the time and memory used by each available parser "
+            "on a local HTML file instead of crawling (repeat for multiple "
+            "files)")
+        perf_group.add_option(
+            "--link-extractor", dest="link_extractor", action="store",
+            default=LINK_EXTRACTOR_AUTO,
+            choices=[LINK_EXTRACTOR_AUTO, LINK_EXTRACTOR_SOUP],
+            help="How links are extracted: auto (default) uses a tokenizer "
+            "that does not build a tree unless HTML content checks apply to "
+            "the page, soup always uses BeautifulSoup")
+        perf_group.add_option(
+            "--frontier-order", dest="frontier_order", action="store",
+            default=FRONTIER_FIFO,
+            help="Order in which URLs are crawled: fifo (default), depth "
+            "(breadth-first), or crawl-first (pages to crawl before "
+            "resources that are only checked, breadth-first)")
+        perf_group.add_option(
+            "--host-concurrency", dest="host_concurrency", action="store",
+            default=0, type="int",
+            help="Maximum number of concurrent requests per host. "
+            "0 means no limit (default)")
+        perf_group.add_option(
+            "--host-rate", dest="host_rate", action="store",
+            default=0, type="float",
+            help="Maximum number of requests per second per host. "
+            "0 means no limit (default)")
+        perf_group.add_option(
+            "--host-limit", dest="host_limits", action="append",
+            metavar="HOST,CONCURRENCY,RATE",
+            help="Maximum concurrent requests and requests per second for "
+            "one host, e.g., example.com,2,0.5. 0 means no limit "
+            "(repeat for multiple hosts)")
+        perf_group.add_option(
+            "--pool-size", dest="pool_size", action="store",
+            default=DEFAULT_POOL_SIZE, type="int",
+            help="Number of idle keep-alive connections kept per host by "
+            "each worker. 0 opens a new connection for each request")
+        perf_group.add_option(
+            "--pool-idle-timeout", dest="pool_idle_timeout", action="store",
+            default=DEFAULT_POOL_IDLE_TIMEOUT, type="float",
+            help="Seconds after which an idle keep-alive connection is "
+            "closed")
+        perf_group.add_option(
+            "--retention", dest="retention", action="store",
+            default=RETENTION_ALL, choices=[RETENTION_ALL, RETENTION_ERRORS],
+            help="Pages kept after they are crawled: all or errors. With "
+            "errors, pages that are ok are only counted and their sources "
+            "are discarded. Not supported with --report-type=all "
+            "(default = all)")
+        perf_group.add_option(
+            "--sources", dest="sources", action="store",
+            default=SOURCES_ALL,
+            choices=[SOURCES_ALL, SOURCES_FIRST, SOURCES_UNIQUE,
+                     SOURCES_COUNT],
+            help="Sources kept for each page: all, first (the first "
+            "--max-sources sources), unique (one source per linking page) or "
+            "count (sources are only counted). The report states the number "
+            "of sources that were not kept (default = all)")
+        perf_group.add_option(
+            "--max-sources", dest="max_sources", action="store",
+            default=DEFAULT_MAX_SOURCES, type="int",
+            help="Number of sources kept for each page with --sources=first "
+            "(default = 10)")
+        perf_group.add_option(
+            "--storage", dest="storage", action="store",
+            default=STORAGE_MEMORY,
+            choices=[STORAGE_MEMORY, STORAGE_SQLITE, STORAGE_FINGERPRINT,
+                     STORAGE_BLOOM],
+            help="Where the seen URLs and the URLs waiting to be crawled are "
+            "kept: memory, sqlite, fingerprint or bloom. With sqlite, memory "
+            "stays flat regardless of the size of the site. fingerprint and "
+            "bloom only keep a 64-bit fingerprint of the URLs seen (or a "
+            "Bloom filter of these fingerprints): a new URL may be wrongly "
+            "considered seen and the error rate is reported "
+            "(default = memory)")
+        perf_group.add_option(
+            "--storage-path", dest="storage_path", action="store",
+            default=None, metavar="FILE",
+            help="SQLite database used by --storage=sqlite. It must be new "
+            "or created by a previous crawl. A temporary database is used "
+            "by default. Implies --storage=sqlite")
+        perf_group.add_option(
+            "--bloom-capacity", dest="bloom_capacity", action="store",
+            default=DEFAULT_BLOOM_CAPACITY, type="int",
+            help="Number of URLs expected with --storage=bloom "
+            "(default = 1000000)")
+        perf_group.add_option(
+            "--bloom-error-rate", dest="bloom_error_rate", action="store",
+            default=DEFAULT_BLOOM_ERROR_RATE, type="float",
+            help="False positive rate of the Bloom filter when it contains "
+            "--bloom-capacity URLs (default = 0.001)")
+        perf_group.add_option(
+            "--stream-links", dest="stream_links", action="store_true",
+            default=False,
+            help="Extracts links while pages are downloading so they are "
+            "crawled before the end of large pages. Not supported in async "
+            "mode or with parse workers. Pages are parsed after they are "
+            "downloaded if there are content checks")
+        perf_group.add_option(
+            "--url-cache-size", dest="url_cache_size", action="store",
+            default=DEFAULT_URL_CACHE_SIZE, type="int",
+            help="Number of normalized URLs cached by each worker. 0 disables "
+            "the cache (default = 10000)")
+        perf_group.add_option(
+            "--use-head", dest="use_head", action="store_true",
+            default=False,
+            help="Checks URLs that are not crawled (e.g., external pages) "
+            "with HEAD requests. Falls back to GET requests if the server "
+            "does not support HEAD")
 
         parser.add_option_group(perf_group)
 
@@ -664,6 +1041,67 @@ class Config(UTF8Class):
             self.start_urls, self.options)
 
 
+class PageSources(object):
+    """Sources of a page kept according to the --sources mode: all sources,
+    the first max_sources sources, one source per origin, or none. All the
+    sources added are counted.
+    """
+
+    __slots__ = ("mode", "max_sources", "sources", "count", "origins")
+
+    def __init__(self, mode=SOURCES_ALL, max_sources=DEFAULT_MAX_SOURCES):
+        self.mode = mode
+        self.max_sources = max_sources
+        self.sources = []
+        self.count = 0
+        self.origins = None
+        if mode == SOURCES_UNIQUE:
+            self.origins = set()
+
+    def __iter__(self):
+        return iter(self.sources)
+
+    def __len__(self):
+        return len(self.sources)
+
+    @property
+    def dropped_count(self):
+        """Number of sources that were added but not kept."""
+        return self.count - len(self.sources)
+
+    def append(self, page_source):
+        """Adds a PageSource and returns True if it is kept."""
+        self.count += 1
+        if not self.keeps(page_source):
+            return False
+        if self.origins is not None:
+            self.origins.add(page_source.origin)
+        self.sources.append(page_source)
+        return True
+
+    def keeps(self, page_source):
+        """Returns True if the PageSource would be kept by append."""
+        if self.mode == SOURCES_ALL:
+            return True
+        elif self.mode == SOURCES_FIRST:
+            return len(self.sources) < self.max_sources
+        elif self.mode == SOURCES_UNIQUE:
+            return page_source.origin not in self.origins
+        return False
+
+    def extend(self, page_sources):
+        """Adds a sequence of PageSource. The sources dropped by another
+        PageSources are counted."""
+        for page_source in page_sources:
+            self.append(page_source)
+        if isinstance(page_sources, PageSources):
+            self.add_dropped(page_sources.dropped_count)
+
+    def add_dropped(self, dropped_count):
+        """Counts sources that were dropped before they could be added."""
+        self.count += dropped_count
+
+
 class SitePage(UTF8Class):
     """Contains the crawling result for a page.
 
@@ -674,11 +1112,23 @@ class SitePage(UTF8Class):
     def __init__(self, url_split, status=200, is_timeout=False, exception=None,
                  is_html=True, is_local=True, response_time=None,
                  process_time=None, site_origin=None, missing_content=None,
-                 erroneous_content=None):
-        self.url_split = url_split
+                 erroneous_content=None, url_table=None, sources=None):
+        self.url_table = url_table
+        """If a URLTable is given, the URL of the page and the origins of
+        its sources are stored as IDs of the table."""
+
+        if url_table is None:
+            self.url_id = None
+            self._url_split = url_split
+        else:
+            self.url_id = url_table.add(url_split)
+            self._url_split = None
 
         self.original_source = None
-        self.sources = []
+        if sources is None:
+            sources = PageSources()
+        self._sources = sources
+        """PageSources that may drop some sources"""
 
         self.type = type
         self.status = status
@@ -686,8 +1136,7 @@ class SitePage(UTF8Class):
         self.exception = exception
         self.is_html = is_html
         self.is_local = is_local
-        self.is_ok = status and status < 400 and not missing_content and\
-            not erroneous_content
+        self.is_ok = is_page_ok(status, missing_content, erroneous_content)
         self.response_time = response_time
         self.process_time = process_time
         self.site_origin = site_origin
@@ -702,8 +1151,50 @@ class SitePage(UTF8Class):
         else:
             self.erroneous_content = []
 
+    @property
+    def url_split(self):
+        if self.url_table is None:
+            return self._url_split
+        return self.url_table.get_url_split(self.url_id)
+
+    @property
+    def sources(self):
+        """List of PageSource linking to this page."""
+        if self.url_table is None:
+            return list(self._sources)
+        return [
+            source._replace(
+                origin=self.url_table.get_url_split(source.origin))
+            for source in self._sources]
+
+    def add_source(self, page_source):
+        """Adds a PageSource and returns True if it is kept. Its origin is a
+        URL ID if the page has a URLTable."""
+        return self._sources.append(page_source)
+
     def add_sources(self, page_sources):
-        self.sources.extend(page_sources)
+        """Adds PageSources. Their origin is a URL ID if the page has a
+        URLTable."""
+        self._sources.extend(page_sources)
+
+    @property
+    def source_count(self):
+        """Number of sources linking to this page, including the sources
+        that were not kept."""
+        return self._sources.count
+
+    @property
+    def dropped_source_count(self):
+        return self._sources.dropped_count
+
+    def get_url_ids(self):
+        """Returns the IDs of the URL of the page and of the origins of its
+        sources or an empty list if the page has no URLTable."""
+        if self.url_table is None:
+            return []
+        url_ids = [self.url_id]
+        url_ids.extend(source.origin for source in self._sources)
+        return url_ids
 
     def get_status_message(self):
         if self.status:
@@ -73,7 +73,7 @@ def _write_plain_text_report(site, config, output_files, total_time):
 
 
 def _write_plain_text_report_multi(site, config, output_files, total_time):
-    total_urls = len(site.pages)
+    total_urls = site.page_count
     total_errors = len(site.error_pages)
 
     if not site.is_ok:
@@ -100,6 +100,8 @@ def _write_plain_text_report_multi(site, config, output_files, total_time):
         oprint("  average process time: {0:.2f} seconds".format(
             avg_process_time), files=output_files)
 
+        _print_seen_error_rate(site, output_files)
+
         pages = {}
 
         if config.options.report_type == REPORT_TYPE_ERRORS:
@@ -123,7 +125,7 @@ def _write_plain_text_report_single(site, config, output_files, total_time):
     start_urls = ",".join((start_url_split.geturl() for start_url_split in
                            site.start_url_splits))
 
-    total_urls = len(site.pages)
+    total_urls = site.page_count
     total_errors = len(site.error_pages)
 
     if not site.is_ok:
@@ -147,6 +149,8 @@ def _write_plain_text_report_single(site, config, output_files, total_time):
         oprint("  average process time: {0:.2f} seconds".format(
             avg_process_time), files=output_files)
 
+        _print_seen_error_rate(site, output_files)
+
     except Exception:
         from traceback import print_exc
         print_exc()
@@ -163,6 +167,35 @@ def _write_plain_text_report_single(site, config, output_files, total_time):
         _print_details(pages.values(), output_files, config)
 
 
+def report_parser_benchmarks(benchmarks, page_count):
+    """Prints the time and memory used by each parser to the console."""
+    output_files = [sys.stdout]
+    oprint("Parsed {0} page(s) with {1} parser(s)".format(
+        page_count, len(benchmarks)), files=output_files)
+
+    reference_links = benchmarks[0].links
+    for benchmark in benchmarks:
+        if benchmark.peak_memory is None:
+            memory = "unknown"
+        else:
+            memory = "{0:.0f} KB".format(benchmark.peak_memory / 1024.0)
+        if benchmark.links == reference_links:
+            links = ""
+        else:
+            links = " (links differ from {0})".format(
+                benchmarks[0].parser)
+        oprint("  {0}: {1:.3f} seconds, peak memory: {2}{3}".format(
+            benchmark.parser, benchmark.parse_time, memory, links),
+            files=output_files)
+
+
+def _print_seen_error_rate(site, output_files):
+    error_rate = site.get_seen_error_rate()
+    if error_rate is not None:
+        oprint("  seen URLs error rate: {0:.2g}".format(error_rate),
+               files=output_files)
+
+
 def _print_details(page_iterator, output_files, config, indent=2):
     initial_indent = " " * indent
     for page in page_iterator:
@@ -176,10 +209,17 @@ def _print_details(page_iterator, output_files, config, indent=2):
         for source in page.sources:
             oprint("{1}  from {0}".format(
                 source.origin.geturl(), initial_indent), files=output_files)
-            if config.options.show_source:
+            if config.options.show_source and source.href:
+                oprint("{1}    as {0}".format(
+                    source.href, initial_indent), files=output_files)
+            if config.options.show_source and source.origin_str:
                 oprint("{1}    {0}".format(
                     truncate(source.origin_str), initial_indent),
                        files=output_files)
+        if page.dropped_source_count:
+            oprint("{1}  and {0} other source(s)".format(
+                page.dropped_source_count, initial_indent),
+                files=output_files)
 
 
 def oprint(message, files):
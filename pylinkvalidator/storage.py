@@ -0,0 +1,593 @@
+# -*- coding: utf-8 -*-
+"""
+Contains the storage of the URLs seen during a crawl: the URL table, the
+status of each URL, and the WorkerInputs that do not fit in the frontier.
+"""
+from __future__ import unicode_literals, absolute_import
+
+import atexit
+import math
+import os
+import shutil
+import tempfile
+
+from pylinkvalidator.compat import (
+    urlparse, OrderedDict, array, UINT64_TYPECODE)
+from pylinkvalidator.models import (
+    WorkerInput, PageStatus, PageSource, PageSources, PAGE_QUEUED,
+    PAGE_CRAWLED, SOURCES_ALL, SOURCES_FIRST, SOURCES_UNIQUE,
+    DEFAULT_MAX_SOURCES, STORAGE_SQLITE, STORAGE_FINGERPRINT, STORAGE_BLOOM)
+from pylinkvalidator.urlutil import (
+    URLTable, FingerprintURLTable, FrozenURLTable)
+
+
+DEFAULT_CACHE_SIZE = 10000
+"""Number of URL IDs kept in memory by the SQLite URL table."""
+
+COMMIT_INTERVAL = 1000
+"""Number of writes after which the SQLite transaction is committed."""
+
+SQLITE_MARKER_TABLE = "pylinkvalidator_crawl"
+"""Table created in the SQLite databases of pylinkvalidator. Databases with
+other tables and without this one are not used."""
+
+SQLITE_TABLES = (
+    "pylinkvalidator_urls", "pylinkvalidator_statuses",
+    "pylinkvalidator_sources", "pylinkvalidator_queue")
+"""Tables of a crawl, dropped when a new crawl starts."""
+
+SQLITE_IN_SIZE = 500
+"""Maximum number of parameters of an IN clause."""
+
+
+FINGERPRINT_SET_SIZE = 1024
+"""Initial number of slots of a FingerprintSet."""
+
+
+def get_storage(config):
+    """Returns the storage selected by --storage."""
+    if config.options.storage == STORAGE_SQLITE:
+        return SQLiteStorage(
+            config.options.storage_path, sources=config.options.sources,
+            max_sources=config.options.max_sources)
+    elif config.options.storage == STORAGE_FINGERPRINT:
+        return FingerprintStorage(FingerprintSet())
+    elif config.options.storage == STORAGE_BLOOM:
+        return FingerprintStorage(BloomFilter(
+            config.options.bloom_capacity, config.options.bloom_error_rate))
+    return MemoryStorage()
+
+
+class PageStatusTable(object):
+    """Status (PAGE_QUEUED, PAGE_CRAWLED) of each URL ID and the sources of
+    the URLs that are queued.
+
+    This class is NOT thread-safe and should only be accessed by the
+    orchestrator.
+    """
+
+    def __init__(self):
+        self.statuses = {}
+        """Map of url ID:PageStatus"""
+
+    def __len__(self):
+        return len(self.statuses)
+
+    def get_status(self, url_id):
+        """Returns the status of the URL or None if it was never seen."""
+        page_status = self.statuses.get(url_id)
+        if page_status is None:
+            return None
+        return page_status.status
+
+    def add_queued(self, url_id, page_sources=None):
+        """Adds a queued URL. page_sources is a PageSources that will be
+        returned by set_crawled."""
+        if page_sources is None:
+            page_sources = PageSources()
+        self.statuses[url_id] = PageStatus(PAGE_QUEUED, page_sources)
+
+    def add_source(self, url_id, page_source):
+        """Adds a source to a queued URL and returns True if it is kept."""
+        return self.statuses[url_id].sources.append(page_source)
+
+    def add_sources(self, url_id, page_sources):
+        """Adds the sources of a PageSources to a queued URL, including the
+        number of sources it dropped."""
+        self.statuses[url_id].sources.extend(page_sources)
+
+    def set_crawled(self, url_id):
+        """Marks a queued URL as crawled and returns its sources."""
+        page_status = self.statuses[url_id]
+        self.statuses[url_id] = PageStatus(PAGE_CRAWLED, None)
+        return page_status.sources
+
+
+class SeenSetStatusTable(object):
+    """Page status table that only keeps the sources of the queued URLs. The
+    IDs of all the URLs seen are kept in a seen set (FingerprintSet or
+    BloomFilter): a URL that is not queued and is in the seen set is
+    considered crawled.
+
+    This class is NOT thread-safe and should only be accessed by the
+    orchestrator.
+    """
+
+    def __init__(self, seen):
+        self.seen = seen
+
+        self.queued = {}
+        """Map of url ID:PageSources"""
+
+    def __len__(self):
+        return len(self.seen)
+
+    def get_status(self, url_id):
+        if url_id in self.queued:
+            return PAGE_QUEUED
+        elif url_id in self.seen:
+            return PAGE_CRAWLED
+        return None
+
+    def add_queued(self, url_id, page_sources=None):
+        if page_sources is None:
+            page_sources = PageSources()
+        self.seen.add(url_id)
+        self.queued[url_id] = page_sources
+
+    def add_source(self, url_id, page_source):
+        return self.queued[url_id].append(page_source)
+
+    def add_sources(self, url_id, page_sources):
+        self.queued[url_id].extend(page_sources)
+
+    def set_crawled(self, url_id):
+        return self.queued.pop(url_id)
+
+
+class FingerprintSet(object):
+    """Hash set of 64-bit fingerprints stored in an array with open
+    addressing and linear probing. The array is at most half full, so each
+    fingerprint uses 8 to 16 bytes. 0 is not a valid fingerprint."""
+
+    def __init__(self, size=FINGERPRINT_SET_SIZE):
+        self.slots = array(UINT64_TYPECODE, [0]) * size
+        self.mask = (1 << (8 * self.slots.itemsize)) - 1
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, fingerprint):
+        fingerprint = fingerprint & self.mask or 1
+        return self.slots[self._find_slot(self.slots, fingerprint)] != 0
+
+    def add(self, fingerprint):
+        fingerprint = fingerprint & self.mask or 1
+        index = self._find_slot(self.slots, fingerprint)
+        if self.slots[index]:
+            return
+        self.slots[index] = fingerprint
+        self.size += 1
+        if self.size * 2 > len(self.slots):
+            self._grow()
+
+    def get_error_rate(self):
+        """Returns the probability that a new URL has the fingerprint of a
+        URL already seen."""
+        return float(self.size) / (self.mask + 1)
+
+    def _find_slot(self, slots, fingerprint):
+        """Returns the index of the fingerprint or of the empty slot where it
+        should be added."""
+        index_mask = len(slots) - 1
+        index = fingerprint & index_mask
+        while slots[index] and slots[index] != fingerprint:
+            index = (index + 1) & index_mask
+        return index
+
+    def _grow(self):
+        slots = array(UINT64_TYPECODE, [0]) * (len(self.slots) * 2)
+        for fingerprint in self.slots:
+            if fingerprint:
+                slots[self._find_slot(slots, fingerprint)] = fingerprint
+        self.slots = slots
+
+
+class BloomFilter(object):
+    """Bloom filter of 64-bit fingerprints sized for capacity fingerprints
+    with the given false positive rate. The bit positions are derived from
+    the two halves of the fingerprint (double hashing)."""
+
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.bit_count = max(8, int(math.ceil(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hash_count = max(1, int(round(
+            float(self.bit_count) / capacity * math.log(2))))
+        self.bits = bytearray((self.bit_count + 7) // 8)
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, fingerprint):
+        bits = self.bits
+        for position in self._get_positions(fingerprint):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def add(self, fingerprint):
+        bits = self.bits
+        for position in self._get_positions(fingerprint):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.size += 1
+
+    def get_error_rate(self):
+        """Returns the estimated false positive rate with the fingerprints
+        added so far. It exceeds the configured error rate once more than
+        capacity fingerprints are added."""
+        return (1 - math.exp(
+            -float(self.hash_count) * self.size / self.bit_count)) **\
+            self.hash_count
+
+    def _get_positions(self, fingerprint):
+        low = fingerprint & 0xFFFFFFFF
+        high = (fingerprint >> 32) | 1
+        return [(low + index * high) % self.bit_count
+                for index in range(self.hash_count)]
+
+
+class MemoryStorage(object):
+    """Keeps the URLs and their status in memory. WorkerInputs are all kept
+    in the frontier."""
+
+    def __init__(self):
+        self.urls = URLTable()
+        self.page_statuses = PageStatusTable()
+        self.overflow = None
+
+    def get_error_rate(self):
+        """Returns the probability that a new URL is considered already seen
+        or None if the storage has no error."""
+        return None
+
+    def get_closed_urls(self, url_ids):
+        """Returns a URL table that can still be used when the storage is
+        closed with at least the URLs of url_ids."""
+        return self.urls
+
+    def close(self):
+        pass
+
+
+class FingerprintStorage(object):
+    """Keeps the fingerprints of the URLs seen in a FingerprintSet or a
+    BloomFilter. Full URLs are only kept for the pages that are reported and
+    the origins of the sources that are kept. A new URL that is wrongly considered seen
+    is never checked."""
+
+    def __init__(self, seen):
+        self.urls = FingerprintURLTable()
+        self.page_statuses = SeenSetStatusTable(seen)
+        self.overflow = None
+
+    def get_error_rate(self):
+        return self.page_statuses.seen.get_error_rate()
+
+    def get_closed_urls(self, url_ids):
+        return self.urls
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage(object):
+    """Keeps the URLs, their status and the sources of queued URLs in a
+    SQLite database in WAL mode. WorkerInputs that do not fit in the frontier
+    are kept in the database until the frontier has room for them.
+
+    The tables are prefixed with pylinkvalidator_. A database that already
+    has other tables is only used if it was created by pylinkvalidator, in
+    which case the tables of the previous crawl are dropped.
+
+    If no path is given, the database is created in a temporary directory
+    that is deleted when the storage is closed or when the interpreter
+    exits.
+
+    Sources are kept according to the sources mode (--sources) when they are
+    written.
+    """
+
+    def __init__(self, path=None, cache_size=DEFAULT_CACHE_SIZE,
+                 sources=SOURCES_ALL, max_sources=DEFAULT_MAX_SOURCES):
+        # Not imported at the module level: Python may be built without it.
+        import sqlite3
+
+        self.temp_dir = None
+        if not path:
+            self.temp_dir = tempfile.mkdtemp(prefix="pylinkvalidator")
+            path = os.path.join(self.temp_dir, "crawl.db")
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        tables = set(
+            row[0] for row in self.connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND "
+                "name NOT LIKE 'sqlite_%'"))
+        if tables and SQLITE_MARKER_TABLE not in tables:
+            self.connection.close()
+            raise ValueError(
+                "{0} is not a database created by pylinkvalidator".format(
+                    path))
+
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        # The database is a scratch space: no need to survive a crash.
+        self.connection.execute("PRAGMA synchronous=OFF")
+        self.writes = 0
+        for table in SQLITE_TABLES:
+            # Tables of a previous crawl
+            self.connection.execute("DROP TABLE IF EXISTS {0}".format(table))
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS {0} (version INTEGER)".format(
+                SQLITE_MARKER_TABLE))
+
+        self.urls = SQLiteURLTable(self, cache_size)
+        self.page_statuses = SQLitePageStatusTable(
+            self, sources, max_sources)
+        self.overflow = SQLiteQueue(self)
+        self.connection.commit()
+
+        atexit.register(self.close)
+
+    def get_error_rate(self):
+        return None
+
+    def get_closed_urls(self, url_ids):
+        """Reads the URLs of url_ids in a FrozenURLTable."""
+        url_ids = list(url_ids)
+        urls = {}
+        for index in range(0, len(url_ids), SQLITE_IN_SIZE):
+            chunk = url_ids[index:index + SQLITE_IN_SIZE]
+            urls.update(self.execute(
+                "SELECT id, url FROM pylinkvalidator_urls "
+                "WHERE id IN ({0})".format(", ".join("?" * len(chunk))),
+                chunk))
+        return FrozenURLTable(urls)
+
+    def execute(self, sql, parameters=()):
+        return self.connection.execute(sql, parameters)
+
+    def write(self, sql, parameters=()):
+        """Executes a statement that modifies the database and commits the
+        transaction every COMMIT_INTERVAL writes."""
+        cursor = self.connection.execute(sql, parameters)
+        self.writes += 1
+        if self.writes % COMMIT_INTERVAL == 0:
+            self.connection.commit()
+        return cursor
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.commit()
+            self.connection.close()
+            self.connection = None
+        if self.temp_dir:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+
+
+class SQLiteURLTable(object):
+    """URL table with the same interface as URLTable stored in SQLite. The
+    IDs of the most recently used URLs are cached in memory."""
+
+    def __init__(self, storage, cache_size=DEFAULT_CACHE_SIZE):
+        self.storage = storage
+        self.cache_size = cache_size
+        self.cache = None
+        if cache_size > 0 and OrderedDict is not None:
+            self.cache = OrderedDict()
+        self.size = 0
+        storage.execute(
+            "CREATE TABLE pylinkvalidator_urls "
+            "(id INTEGER PRIMARY KEY, url TEXT UNIQUE NOT NULL)")
+
+    def __len__(self):
+        return self.size
+
+    def get_id(self, url_split):
+        url = url_split.geturl()
+        url_id = self._find_id(url)
+        if url_id is None:
+            url_id = self.storage.write(
+                "INSERT INTO pylinkvalidator_urls (url) VALUES (?)",
+                (url,)).lastrowid
+            self.size += 1
+            self._cache(url, url_id)
+        return url_id
+
+    def find_id(self, url_split):
+        return self._find_id(url_split.geturl())
+
+    def add(self, url_split):
+        return self.get_id(url_split)
+
+    def get_url_split(self, url_id):
+        row = self.storage.execute(
+            "SELECT url FROM pylinkvalidator_urls WHERE id = ?",
+            (url_id,)).fetchone()
+        return urlparse.urlsplit(row[0])
+
+    def _find_id(self, url):
+        if self.cache is not None:
+            url_id = self.cache.pop(url, None)
+            if url_id is not None:
+                # Reinserted to become the most recently used URL.
+                self.cache[url] = url_id
+                return url_id
+
+        row = self.storage.execute(
+            "SELECT id FROM pylinkvalidator_urls WHERE url = ?",
+            (url,)).fetchone()
+        if row is None:
+            return None
+        self._cache(url, row[0])
+        return row[0]
+
+    def _cache(self, url, url_id):
+        if self.cache is None:
+            return
+        if len(self.cache) >= self.cache_size:
+            self.cache.popitem(last=False)
+        self.cache[url] = url_id
+
+
+class SQLitePageStatusTable(object):
+    """Page status table with the same interface as PageStatusTable stored
+    in SQLite. The sources of a queued URL are stored according to the
+    sources mode, like a PageSources would keep them: the other sources are
+    only counted."""
+
+    def __init__(self, storage, mode=SOURCES_ALL,
+                 max_sources=DEFAULT_MAX_SOURCES):
+        self.storage = storage
+        self.mode = mode
+        self.max_sources = max_sources
+        self.size = 0
+        storage.execute(
+            "CREATE TABLE pylinkvalidator_statuses "
+            "(id INTEGER PRIMARY KEY, crawled INTEGER NOT NULL, "
+            "kept INTEGER NOT NULL, dropped INTEGER NOT NULL)")
+        storage.execute(
+            "CREATE TABLE pylinkvalidator_sources "
+            "(url_id INTEGER NOT NULL, origin INTEGER NOT NULL, "
+            "origin_str TEXT, href TEXT)")
+        storage.execute(
+            "CREATE INDEX pylinkvalidator_sources_url_id "
+            "ON pylinkvalidator_sources (url_id)")
+
+    def __len__(self):
+        return self.size
+
+    def get_status(self, url_id):
+        row = self.storage.execute(
+            "SELECT crawled FROM pylinkvalidator_statuses WHERE id = ?",
+            (url_id,)).fetchone()
+        if row is None:
+            return None
+        return PAGE_CRAWLED if row[0] else PAGE_QUEUED
+
+    def add_queued(self, url_id, page_sources=()):
+        self.storage.write(
+            "INSERT INTO pylinkvalidator_statuses "
+            "(id, crawled, kept, dropped) VALUES (?, 0, 0, ?)",
+            (url_id, _get_dropped_count(page_sources)))
+        self.size += 1
+        for page_source in page_sources:
+            self.add_source(url_id, page_source)
+
+    def add_source(self, url_id, page_source):
+        if not self._keeps(url_id, page_source):
+            self.storage.write(
+                "UPDATE pylinkvalidator_statuses SET dropped = dropped + 1 "
+                "WHERE id = ?", (url_id,))
+            return False
+
+        self.storage.write(
+            "INSERT INTO pylinkvalidator_sources "
+            "(url_id, origin, origin_str, href) VALUES (?, ?, ?, ?)",
+            (url_id, page_source.origin, page_source.origin_str,
+             page_source.href))
+        if self.mode == SOURCES_FIRST:
+            self.storage.write(
+                "UPDATE pylinkvalidator_statuses SET kept = kept + 1 "
+                "WHERE id = ?", (url_id,))
+        return True
+
+    def _keeps(self, url_id, page_source):
+        if self.mode == SOURCES_ALL:
+            return True
+        elif self.mode == SOURCES_FIRST:
+            return self.storage.execute(
+                "SELECT kept FROM pylinkvalidator_statuses WHERE id = ?",
+                (url_id,)).fetchone()[0] < self.max_sources
+        elif self.mode == SOURCES_UNIQUE:
+            return self.storage.execute(
+                "SELECT 1 FROM pylinkvalidator_sources "
+                "WHERE url_id = ? AND origin = ? LIMIT 1",
+                (url_id, page_source.origin)).fetchone() is None
+        return False
+
+    def add_sources(self, url_id, page_sources):
+        for page_source in page_sources:
+            self.add_source(url_id, page_source)
+        dropped_count = _get_dropped_count(page_sources)
+        if dropped_count:
+            self.storage.write(
+                "UPDATE pylinkvalidator_statuses SET dropped = dropped + ? "
+                "WHERE id = ?", (dropped_count, url_id))
+
+    def set_crawled(self, url_id):
+        page_sources = PageSources()
+        page_sources.extend(
+            PageSource(*row) for row in self.storage.execute(
+                "SELECT origin, origin_str, href FROM pylinkvalidator_sources "
+                "WHERE url_id = ? ORDER BY rowid", (url_id,)))
+        page_sources.add_dropped(self.storage.execute(
+            "SELECT dropped FROM pylinkvalidator_statuses WHERE id = ?",
+            (url_id,)).fetchone()[0])
+        self.storage.write(
+            "DELETE FROM pylinkvalidator_sources WHERE url_id = ?", (url_id,))
+        self.storage.write(
+            "UPDATE pylinkvalidator_statuses SET crawled = 1 WHERE id = ?",
+            (url_id,))
+        return page_sources
+
+
+def _get_dropped_count(page_sources):
+    if isinstance(page_sources, PageSources):
+        return page_sources.dropped_count
+    return 0
+
+
+class SQLiteQueue(object):
+    """FIFO queue of WorkerInputs stored in SQLite."""
+
+    def __init__(self, storage):
+        self.storage = storage
+        self.size = 0
+        storage.execute(
+            "CREATE TABLE pylinkvalidator_queue "
+            "(seq INTEGER PRIMARY KEY AUTOINCREMENT, url TEXT NOT NULL, "
+            "should_crawl INTEGER NOT NULL, depth INTEGER NOT NULL, "
+            "site_origin TEXT)")
+
+    def __len__(self):
+        return self.size
+
+    def put(self, worker_input):
+        self.storage.write(
+            "INSERT INTO pylinkvalidator_queue "
+            "(url, should_crawl, depth, site_origin) VALUES (?, ?, ?, ?)",
+            (worker_input.url_split.geturl(), worker_input.should_crawl,
+             worker_input.depth, worker_input.site_origin))
+        self.size += 1
+
+    def pop_many(self, count):
+        """Removes and returns the count oldest WorkerInputs."""
+        rows = self.storage.execute(
+            "SELECT seq, url, should_crawl, depth, site_origin "
+            "FROM pylinkvalidator_queue ORDER BY seq LIMIT ?",
+            (count,)).fetchall()
+        if not rows:
+            return []
+
+        self.storage.write(
+            "DELETE FROM pylinkvalidator_queue WHERE seq <= ?",
+            (rows[-1][0],))
+        self.size -= len(rows)
+        return [
+            WorkerInput(
+                urlparse.urlsplit(url), bool(should_crawl), depth,
+                site_origin)
+            for (_, url, should_crawl, depth, site_origin) in rows]
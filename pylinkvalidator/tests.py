@@ -6,22 +6,37 @@ from __future__ import unicode_literals, absolute_import
 
 import os
 import logging
+import re
 import sys
+import shutil
+import tempfile
 from tempfile import mkstemp
 import time
 import threading
 import unittest
 
-from pylinkvalidator import api
+from pylinkvalidator import api, autoscale, benchmark
 import pylinkvalidator.compat as compat
+import pylinkvalidator.crawler as crawler_module
 from pylinkvalidator.compat import (
     SocketServer, SimpleHTTPServer, get_url_open, get_url_request)
+from pylinkvalidator.connection import ConnectionPool
 from pylinkvalidator.crawler import (
     open_url, PageCrawler, WORK_DONE, ThreadSiteCrawler, ProcessSiteCrawler,
-    get_logger)
+    HybridSiteCrawler, get_logger)
+from pylinkvalidator.frontier import Frontier, crawl_first_priority
+from pylinkvalidator.included.bs4 import BeautifulSoup
 from pylinkvalidator.models import (
-    Config, WorkerInit, WorkerConfig, WorkerInput, PARSER_STDLIB)
-from pylinkvalidator.urlutil import get_clean_url_split, get_absolute_url_split
+    Config, WorkerInit, WorkerConfig, WorkerInput, HostLimit, PageCrawl,
+    ParserBenchmark, PageSource, PageSources, PARSER_STDLIB, PARSER_HTML5,
+    PAGE_QUEUED, PAGE_CRAWLED, SOURCES_FIRST, SOURCES_UNIQUE, SOURCES_COUNT,
+    LINK_EXTRACTOR_AUTO, LINK_EXTRACTOR_SOUP)
+from pylinkvalidator.storage import (
+    SQLiteStorage, FingerprintStorage, FingerprintSet, BloomFilter)
+from pylinkvalidator.urlutil import (
+    get_clean_url_split, get_absolute_url_split, convert_iri_to_uri,
+    URLCache, URLCanonicalizer, URLTable, URLMapping, FrozenURLTable,
+    get_url_fingerprint)
 
 
 TEST_FILES_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)),
@@ -37,11 +52,27 @@ class ThreadedTCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
     pass
 
 
-def start_http_server():
+class KeepAliveHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+
+class NoHeadHTTPRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """Rejects HEAD requests and records the requests it receives."""
+    requests = []
+
+    def do_HEAD(self):
+        self.requests.append(("HEAD", None))
+        self.send_error(405)
+
+    def do_GET(self):
+        self.requests.append(("GET", self.headers.get("Range")))
+        SimpleHTTPServer.SimpleHTTPRequestHandler.do_GET(self)
+
+
+def start_http_server(handler=SimpleHTTPServer.SimpleHTTPRequestHandler):
     """Starts a simple http server for the test files"""
     # For the http handler
     os.chdir(TEST_FILES_DIR)
-    handler = SimpleHTTPServer.SimpleHTTPRequestHandler
     handler.extensions_map['.html'] = 'text/html; charset=UTF-8'
     httpd = ThreadedTCPServer(("localhost", 0), handler)
     ip, port = httpd.server_address
@@ -77,6 +108,30 @@ def has_gevent():
     return has_gevent
 
 
+def has_lxml():
+    has_lxml = False
+
+    try:
+        import lxml  # noqa
+        has_lxml = True
+    except Exception:
+        pass
+
+    return has_lxml
+
+
+def has_asyncio():
+    # async/await syntax is required by the async mode.
+    return sys.version_info[:2] >= (3, 5)
+
+
+def get_source_attributes(link):
+    """Returns the tag and sorted attributes of the source of a link.
+    BeautifulSoup does not keep the order of the attributes on Python 2."""
+    tag = link.source_str.split(" ", 1)[0]
+    return (tag, sorted(re.findall(r' ([^ =]+)="([^"]*)"', link.source_str)))
+
+
 # UNIT AND INTEGRATION TESTS ###
 
 
@@ -105,6 +160,459 @@ class ConfigTest(unittest.TestCase):
         self.assertTrue('foo.com' in config.accepted_hosts)
         self.assertTrue('baz.com' in config.accepted_hosts)
 
+    def test_negative_host_limit(self):
+        sys.argv = ['pylinkvalidator', '--host-rate=-1', 'http://example.com/']
+        config = Config()
+        self.assertRaises(ValueError, config.parse_cli_config)
+
+        sys.argv = ['pylinkvalidator', '--host-limit', 'example.com,1,-1',
+                    'http://example.com/']
+        config = Config()
+        self.assertRaises(ValueError, config.parse_cli_config)
+
+    def test_errors_only_report_all(self):
+        sys.argv = ['pylinkvalidator', '--retention=errors', '-E', 'all',
+                    'http://example.com/']
+        config = Config()
+        self.assertRaises(ValueError, config.parse_cli_config)
+
+    def test_parse_workers_python_2(self):
+        sys.argv = ['pylinkvalidator', '--parse-workers=2',
+                    'http://example.com/']
+        config = Config()
+        if sys.version_info[0] < 3:
+            self.assertRaises(ValueError, config.parse_cli_config)
+        else:
+            config.parse_cli_config()
+            self.assertEqual(2, config.options.parse_workers)
+
+    def test_accepted_hosts_wildcard(self):
+        sys.argv = ['pylinkvalidator', '-H', '*.example.com',
+                    'http://example.com/']
+        config = Config()
+        config.parse_cli_config()
+
+        self.assertTrue('example.com' in config.accepted_hosts)
+        self.assertTrue('www.example.com' in config.accepted_hosts)
+        self.assertTrue('a.b.example.com' in config.accepted_hosts)
+        self.assertTrue('Sub.Example.com' in config.accepted_hosts)
+        self.assertTrue('www.example.com:8080' in config.accepted_hosts)
+        self.assertFalse('badexample.com' in config.accepted_hosts)
+        self.assertFalse('example.org' in config.accepted_hosts)
+
+    def test_multi_accepted_hosts(self):
+        sys.argv = ['pylinkvalidator', '--multi', '-H', 'foo.com',
+                    'http://example.com/', 'http://www.example.org/']
+        config = Config()
+        config.parse_cli_config()
+
+        example_hosts = config.accepted_hosts['example.com']
+        self.assertTrue('example.com' in example_hosts)
+        self.assertTrue('foo.com' in example_hosts)
+        self.assertFalse('www.example.org' in example_hosts)
+        self.assertFalse('e' in example_hosts)
+        self.assertTrue(config.is_local(
+            get_clean_url_split('http://foo.com/'), 'www.example.org'))
+
+    def test_ignored_prefixes(self):
+        sys.argv = ['pylinkvalidator', '-O', '-i',
+                    'http://example.com/ignore/,http://other.com',
+                    'http://example.com/']
+        config = Config()
+        config.parse_cli_config()
+
+        self.assertFalse(config.should_download(
+            get_clean_url_split('http://example.com/ignore/a.html')))
+        self.assertFalse(config.should_download(
+            get_clean_url_split('http://other.com/')))
+        self.assertTrue(config.should_download(
+            get_clean_url_split('http://example.com/ignor')))
+        self.assertTrue(config.should_download(
+            get_clean_url_split('http://example.com/')))
+
+
+class FrontierTest(unittest.TestCase):
+
+    def get_worker_input(self, url):
+        return WorkerInput(get_clean_url_split(url), True, 0, None)
+
+    def test_round_robin(self):
+        frontier = Frontier(HostLimit())
+        for url in ["a.com/1", "a.com/2", "a.com/3", "b.com/1", "c.com/1"]:
+            frontier.put(self.get_worker_input(url))
+
+        urls = []
+        while len(frontier):
+            urls.append(frontier.pop().url_split.geturl())
+
+        self.assertEqual(
+            ["http://a.com/1", "http://b.com/1", "http://c.com/1",
+             "http://a.com/2", "http://a.com/3"], urls)
+
+    def test_priority(self):
+        frontier = Frontier(
+            HostLimit(), priority_function=crawl_first_priority)
+        frontier.put(WorkerInput(get_clean_url_split("a.com/1"), False, 1))
+        frontier.put(WorkerInput(get_clean_url_split("a.com/2"), True, 2))
+        frontier.put(WorkerInput(get_clean_url_split("a.com/3"), True, 1))
+        frontier.put(WorkerInput(get_clean_url_split("b.com/1"), False, 0))
+
+        urls = []
+        while len(frontier):
+            urls.append(frontier.pop().url_split.geturl())
+
+        self.assertEqual(
+            ["http://a.com/3", "http://a.com/2", "http://b.com/1",
+             "http://a.com/1"], urls)
+
+    def test_host_limits(self):
+        frontier = Frontier(
+            HostLimit(concurrency=1), {"b.com": HostLimit(rate=0.01)})
+        for url in ["a.com/1", "a.com/2", "b.com/1", "b.com/2"]:
+            frontier.put(self.get_worker_input(url))
+
+        first = frontier.pop()
+        self.assertEqual("a.com", first.url_split.netloc)
+        self.assertEqual("b.com", frontier.pop().url_split.netloc)
+        # a.com is crawling and b.com is waiting for a token
+        self.assertTrue(frontier.pop() is None)
+        self.assertTrue(frontier.get_delay() > 0)
+
+        frontier.done(first.url_split)
+        self.assertEqual("http://a.com/2", frontier.pop().url_split.geturl())
+        self.assertEqual(1, len(frontier))
+
+    def test_remove_idle_hosts(self):
+        frontier = Frontier(HostLimit(), {"b.com": HostLimit(rate=0.01)})
+        for url in ["a.com/1", "a.com/2", "b.com/1"]:
+            frontier.put(self.get_worker_input(url))
+
+        first = frontier.pop()
+        frontier.done(first.url_split)
+        self.assertTrue("a.com" in frontier.hosts)
+
+        for _ in range(2):
+            frontier.done(frontier.pop().url_split)
+        self.assertFalse("a.com" in frontier.hosts)
+        # b.com is kept until its token bucket is refilled
+        self.assertTrue("b.com" in frontier.hosts)
+
+        frontier.hosts["b.com"].bucket.tokens = 1.0
+        self.assertTrue(frontier.pop() is None)
+        self.assertEqual({}, frontier.hosts)
+        self.assertEqual(set(), frontier.idle_hosts)
+
+    def test_overflow(self):
+        storage = SQLiteStorage()
+        try:
+            frontier = Frontier(
+                HostLimit(), overflow=storage.overflow, memory_size=2)
+            urls = ["a.com/{0}".format(index) for index in range(5)]
+            for url in urls:
+                frontier.put(self.get_worker_input(url))
+            self.assertEqual(2, frontier.size)
+            self.assertEqual(5, len(frontier))
+
+            popped_urls = []
+            while len(frontier):
+                popped_urls.append(frontier.pop().url_split.geturl())
+            self.assertEqual(
+                ["http://" + url for url in urls], popped_urls)
+        finally:
+            storage.close()
+
+
+class PageSourcesTest(unittest.TestCase):
+
+    def test_page_sources(self):
+        page_sources = [PageSource(1), PageSource(1), PageSource(2)]
+
+        sources = PageSources(SOURCES_FIRST, 2)
+        sources.extend(page_sources)
+        self.assertEqual(page_sources[:2], list(sources))
+        self.assertEqual(1, sources.dropped_count)
+
+        unique_sources = PageSources(SOURCES_UNIQUE)
+        unique_sources.extend(page_sources)
+        self.assertEqual([PageSource(1), PageSource(2)], list(unique_sources))
+
+        count_sources = PageSources(SOURCES_COUNT)
+        count_sources.extend(page_sources)
+        count_sources.extend(sources)
+        self.assertEqual(0, len(count_sources))
+        self.assertEqual(6, count_sources.count)
+
+        all_sources = PageSources()
+        all_sources.extend(unique_sources)
+        self.assertEqual(2, len(all_sources))
+        self.assertEqual(3, all_sources.count)
+
+
+class StorageTest(unittest.TestCase):
+
+    def test_sqlite_storage(self):
+        storage = SQLiteStorage()
+        try:
+            url_split = get_clean_url_split("http://www.example.com/a?b=c")
+            url_id = storage.urls.get_id(url_split)
+            self.assertEqual(url_id, storage.urls.get_id(url_split))
+            self.assertEqual(url_split, storage.urls.get_url_split(url_id))
+            self.assertEqual(None, storage.urls.find_id(
+                get_clean_url_split("http://www.example.org/")))
+            self.assertEqual(1, len(storage.urls))
+
+            page_statuses = storage.page_statuses
+            self.assertEqual(None, page_statuses.get_status(url_id))
+            page_sources = PageSources(SOURCES_FIRST, 1)
+            page_sources.extend(
+                [PageSource(1, "<a>", None), PageSource(3, None, None)])
+            page_statuses.add_queued(url_id, page_sources)
+            page_statuses.add_source(url_id, PageSource(2, None, "b"))
+            self.assertEqual(PAGE_QUEUED, page_statuses.get_status(url_id))
+            page_sources = page_statuses.set_crawled(url_id)
+            self.assertEqual(
+                [PageSource(1, "<a>", None), PageSource(2, None, "b")],
+                list(page_sources))
+            # The source dropped before the URL was queued is counted.
+            self.assertEqual(3, page_sources.count)
+            self.assertEqual(PAGE_CRAWLED, page_statuses.get_status(url_id))
+
+            urls = storage.get_closed_urls([url_id])
+            temp_dir = storage.temp_dir
+            storage.close()
+            self.assertFalse(os.path.exists(temp_dir))
+            self.assertEqual(url_split, urls.get_url_split(url_id))
+            self.assertEqual(url_id, urls.find_id(url_split))
+        finally:
+            storage.close()
+
+    def test_sqlite_storage_sources(self):
+        page_sources = [
+            PageSource(1, "<a>", None), PageSource(1, None, None),
+            PageSource(2, None, "b")]
+        for (mode, expected_sources) in [
+                (SOURCES_FIRST, page_sources[:2]),
+                (SOURCES_UNIQUE, [page_sources[0], page_sources[2]]),
+                (SOURCES_COUNT, [])]:
+            storage = SQLiteStorage(sources=mode, max_sources=2)
+            try:
+                page_statuses = storage.page_statuses
+                page_statuses.add_queued(1)
+                for page_source in page_sources:
+                    page_statuses.add_source(1, page_source)
+
+                # The sources that are dropped are never written.
+                self.assertEqual(
+                    len(expected_sources),
+                    storage.execute(
+                        "SELECT COUNT(*) FROM pylinkvalidator_sources"
+                    ).fetchone()[0])
+                sources = page_statuses.set_crawled(1)
+                self.assertEqual(expected_sources, list(sources))
+                self.assertEqual(3, sources.count)
+            finally:
+                storage.close()
+
+    def test_sqlite_storage_path(self):
+        import sqlite3
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, "crawl.db")
+            storage = SQLiteStorage(path)
+            storage.urls.get_id(get_clean_url_split("http://www.example.com/"))
+            storage.close()
+
+            # The tables of the previous crawl are dropped.
+            storage = SQLiteStorage(path)
+            self.assertEqual(0, len(storage.urls))
+            self.assertEqual(None, storage.urls.find_id(
+                get_clean_url_split("http://www.example.com/")))
+            storage.close()
+
+            other_path = os.path.join(temp_dir, "other.db")
+            connection = sqlite3.connect(other_path)
+            connection.execute("CREATE TABLE urls (id INTEGER)")
+            connection.commit()
+            connection.close()
+            self.assertRaises(ValueError, SQLiteStorage, other_path)
+
+            connection = sqlite3.connect(other_path)
+            self.assertEqual(
+                [("urls",)],
+                connection.execute(
+                    "SELECT name FROM sqlite_master").fetchall())
+            connection.close()
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_fingerprint_set(self):
+        fingerprints = FingerprintSet(4)
+        for fingerprint in range(1, 100):
+            fingerprints.add(fingerprint * 7)
+        fingerprints.add(7)
+        self.assertEqual(99, len(fingerprints))
+        self.assertTrue(len(fingerprints.slots) >= 198)
+        for fingerprint in range(1, 100):
+            self.assertTrue(fingerprint * 7 in fingerprints)
+            self.assertFalse(fingerprint * 7 + 1 in fingerprints)
+        self.assertTrue(fingerprints.get_error_rate() < 1e-15)
+
+    def test_bloom_filter(self):
+        bloom_filter = BloomFilter(1000, 0.01)
+        fingerprints = [
+            get_url_fingerprint("http://www.example.com/{0}".format(index))
+            for index in range(2000)]
+        for fingerprint in fingerprints[:1000]:
+            bloom_filter.add(fingerprint)
+        for fingerprint in fingerprints[:1000]:
+            self.assertTrue(fingerprint in bloom_filter)
+        false_positives = sum(
+            1 for fingerprint in fingerprints[1000:]
+            if fingerprint in bloom_filter)
+        self.assertTrue(false_positives < 50)
+        self.assertTrue(0.005 < bloom_filter.get_error_rate() < 0.02)
+
+    def test_fingerprint_storage(self):
+        storage = FingerprintStorage(FingerprintSet())
+        url_split = get_clean_url_split("http://www.example.com/")
+        url_id = storage.urls.get_id(url_split)
+        self.assertEqual(0, len(storage.urls))
+        self.assertEqual(None, storage.page_statuses.get_status(url_id))
+
+        storage.page_statuses.add_queued(url_id)
+        self.assertEqual(PAGE_QUEUED, storage.page_statuses.get_status(url_id))
+        self.assertEqual(
+            [], list(storage.page_statuses.set_crawled(url_id)))
+        self.assertEqual(
+            PAGE_CRAWLED, storage.page_statuses.get_status(url_id))
+
+        self.assertEqual(url_id, storage.urls.add(url_split))
+        self.assertEqual(url_split, storage.urls.get_url_split(url_id))
+
+
+class AutoscaleTest(unittest.TestCase):
+
+    def record(self, autoscaler, count, **kwargs):
+        for _ in range(count):
+            autoscaler.record(PageCrawl(**kwargs))
+
+    def test_grow_and_shrink(self):
+        autoscaler = autoscale.WorkerAutoscaler(1, 10, 4)
+        now = autoscaler.last_adjust
+
+        # Not enough time elapsed
+        self.record(autoscaler, 10, status=200, response_time=0.1)
+        self.assertEqual(4, autoscaler.get_workers(100, now))
+
+        # URLs are waiting: grow
+        now += autoscale.ADJUST_INTERVAL
+        self.assertEqual(5, autoscaler.get_workers(100, now))
+
+        # Slower responses: shrink
+        now += autoscale.ADJUST_INTERVAL
+        self.record(autoscaler, 10, status=200, response_time=1.0)
+        self.assertEqual(4, autoscaler.get_workers(100, now))
+
+        # Overloaded server: halve, never below the minimum
+        for _ in range(3):
+            now += autoscale.ADJUST_INTERVAL
+            self.record(autoscaler, 10, status=503, is_timeout=False)
+            autoscaler.get_workers(100, now)
+        self.assertEqual(1, autoscaler.workers)
+
+    def test_max_workers(self):
+        autoscaler = autoscale.WorkerAutoscaler(1, 3, 3)
+        now = autoscaler.last_adjust + autoscale.ADJUST_INTERVAL
+        self.record(autoscaler, 10, status=200, response_time=0.1)
+        self.assertEqual(3, autoscaler.get_workers(100, now))
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def test_select_parser(self):
+        benchmarks = [
+            ParserBenchmark("html.parser", 2.0, None, [["a"]]),
+            ParserBenchmark("lxml", 0.5, None, [["b"]]),
+            ParserBenchmark("html5lib", 1.0, None, [["a"]]),
+        ]
+        self.assertEqual("html5lib", benchmark.select_parser(benchmarks))
+
+        benchmarks = [
+            ParserBenchmark("lxml", 1.0, None, [["a"]]),
+            ParserBenchmark("html.parser", 1.0, None, [["a"]]),
+        ]
+        self.assertEqual("html.parser", benchmark.select_parser(benchmarks))
+
+    def test_benchmark_parsers(self):
+        worker_config = WorkerConfig(
+            types=['a', 'img', 'link', 'script'], parser=PARSER_STDLIB)
+        page_crawler = PageCrawler(WorkerInit(
+            worker_config=worker_config, logger=get_logger()))
+        parse_inputs = benchmark.read_parse_inputs(
+            [os.path.join(TEST_FILES_DIR, "index.html"),
+             os.path.join(TEST_FILES_DIR, "alone.html")])
+
+        benchmarks = benchmark.benchmark_parsers(page_crawler, parse_inputs)
+        self.assertEqual(PARSER_STDLIB, benchmarks[0].parser)
+        self.assertEqual(2, len(benchmarks[0].links))
+        self.assertEqual(8, len(benchmarks[0].links[0]))
+        self.assertEqual(
+            "http://www.example.com/test.html", benchmarks[0].links[1][0][1])
+
+    def test_benchmark_link_extractor(self):
+        parse_inputs = benchmark.read_parse_inputs(
+            [os.path.join(TEST_FILES_DIR, "index.html")])
+
+        for (link_extractor, method) in [
+                (LINK_EXTRACTOR_AUTO, "extract_links"),
+                (LINK_EXTRACTOR_SOUP, "get_links")]:
+            worker_config = WorkerConfig(
+                types=['a', 'img', 'link', 'script'], parser=PARSER_STDLIB,
+                link_extractor=link_extractor)
+            page_crawler = PageCrawler(WorkerInit(
+                worker_config=worker_config, logger=get_logger()))
+            calls = []
+            original_method = getattr(page_crawler, method)
+
+            def record(*args):
+                calls.append(args)
+                return original_method(*args)
+            setattr(page_crawler, method, record)
+
+            benchmarks = benchmark.benchmark_parsers(
+                page_crawler, parse_inputs, [PARSER_STDLIB],
+                measure_memory=False)
+            # The benchmark parses the page like the workers.
+            self.assertEqual(1, len(calls))
+            self.assertEqual(8, len(benchmarks[0].links[0]))
+
+    def test_benchmark_html5lib(self):
+        parse_inputs = benchmark.read_parse_inputs(
+            [os.path.join(TEST_FILES_DIR, "index.html")])
+        worker_config = WorkerConfig(
+            types=['a', 'img', 'link', 'script'], parser=PARSER_STDLIB,
+            link_extractor=LINK_EXTRACTOR_AUTO)
+        page_crawler = PageCrawler(WorkerInit(
+            worker_config=worker_config, logger=get_logger()))
+        calls = []
+        original_parse_page = page_crawler.parse_page
+
+        def record(*args):
+            calls.append((page_crawler.worker_config.parser,
+                          page_crawler.worker_config.link_extractor))
+            return original_parse_page(*args)
+        page_crawler.parse_page = record
+
+        # html5lib has no link extractor: it is timed with BeautifulSoup.
+        benchmark.benchmark_parsers(
+            page_crawler, parse_inputs, [PARSER_STDLIB, PARSER_HTML5],
+            measure_memory=False)
+        self.assertEqual(
+            [(PARSER_STDLIB, LINK_EXTRACTOR_AUTO),
+             (PARSER_HTML5, LINK_EXTRACTOR_SOUP)], calls)
+        self.assertEqual(LINK_EXTRACTOR_AUTO,
+                         page_crawler.worker_config.link_extractor)
+
 
 class URLUtilTest(unittest.TestCase):
 
@@ -129,6 +637,86 @@ class URLUtilTest(unittest.TestCase):
             "http://www.example.com/",
             get_clean_url_split("http://www.example.com/").geturl())
 
+    def test_convert_iri_to_uri(self):
+        url_split = get_clean_url_split("http://www.example.com/a?b=c#d")
+        self.assertTrue(convert_iri_to_uri(url_split) is url_split)
+
+        self.assertEqual(
+            "http://xn--bcher-kva.example/%C3%A9t%C3%A9?q=%C3%A9",
+            get_clean_url_split(
+                "http://b\u00fccher.example/\u00e9t\u00e9?q=\u00e9")
+            .geturl())
+
+    def test_url_cache(self):
+        url_cache = URLCache(2)
+        base_url_split = get_clean_url_split("http://www.example.com/a/")
+        for _ in range(3):
+            self.assertEqual(
+                "http://www.example.com/a/b.html",
+                url_cache.get_absolute_url_split(
+                    "b.html", base_url_split).geturl())
+        self.assertEqual(
+            "http://www.example.com",
+            url_cache.get_clean_url_split("www.example.com").geturl())
+        if url_cache.cache is not None:
+            self.assertEqual(2, url_cache.misses)
+            self.assertEqual(2, url_cache.hits)
+
+            # Least recently used URL is evicted.
+            url_cache.get_clean_url_split("www.example.org")
+            url_cache.get_absolute_url_split("b.html", base_url_split)
+            self.assertEqual(4, url_cache.misses)
+
+    def test_url_canonicalizer(self):
+        url_split = get_clean_url_split("http://www.example.com/a?b=2&a=1#c")
+        self.assertEqual(
+            "http://www.example.com/a?b=2&a=1",
+            URLCanonicalizer().canonicalize(url_split).geturl())
+        self.assertTrue(
+            URLCanonicalizer(keep_fragments=True).canonicalize(url_split) is
+            url_split)
+        self.assertEqual(
+            "http://www.example.com/a?a=1&b=2#c",
+            URLCanonicalizer(True, True).canonicalize(url_split).geturl())
+
+        # Repeated parameters keep their order.
+        url_split = get_clean_url_split(
+            "http://www.example.com/a?id=2&id=1&a=1")
+        self.assertEqual(
+            "http://www.example.com/a?a=1&id=2&id=1",
+            URLCanonicalizer(sort_query=True).canonicalize(url_split).geturl())
+
+        url_split = get_clean_url_split(
+            "http://www.example.com/a?utm_source=x&b=2&utm_medium=y&fbclid=z")
+        self.assertEqual(
+            "http://www.example.com/a?b=2",
+            URLCanonicalizer(ignored_params=["utm_*", "fbclid"])
+            .canonicalize(url_split).geturl())
+        self.assertEqual(
+            "http://www.example.com/a",
+            URLCanonicalizer(ignored_params=["*"])
+            .canonicalize(url_split).geturl())
+
+    def test_url_table(self):
+        url_table = URLTable()
+        url_split = get_clean_url_split("http://www.example.com/a?b=c")
+        self.assertEqual(0, url_table.get_id(url_split))
+        self.assertEqual(
+            0, url_table.get_id(get_clean_url_split("www.example.com/a?b=c")))
+        self.assertEqual(
+            1, url_table.get_id(get_clean_url_split("www.example.com/")))
+        self.assertEqual(None, url_table.find_id(
+            get_clean_url_split("www.example.org")))
+        self.assertEqual(url_split, url_table.get_url_split(0))
+
+        url_mapping = URLMapping(url_table, {1: "b"})
+        self.assertEqual(1, len(url_mapping))
+        self.assertEqual(
+            "b", url_mapping[get_clean_url_split("www.example.com/")])
+        self.assertFalse(url_split in url_mapping)
+        self.assertEqual(
+            [get_clean_url_split("www.example.com/")], list(url_mapping))
+
     def test_get_absolute_url(self):
         base_url_split = get_clean_url_split(
             "https://www.example.com/hello/index.html")
@@ -183,7 +771,7 @@ class CrawlerTest(unittest.TestCase):
     def get_url(self, test_url):
         return "http://{0}:{1}{2}".format(self.ip, self.port, test_url)
 
-    def get_page_crawler(self, url):
+    def get_page_crawler(self, url, **worker_options):
         url = self.get_url(url)
         url_split = get_clean_url_split(url)
         input_queue = compat.Queue.Queue()
@@ -193,7 +781,7 @@ class CrawlerTest(unittest.TestCase):
             username=None, password=None, types=['a', 'img', 'link', 'script'],
             timeout=5, parser=PARSER_STDLIB,
             strict_mode=False, prefer_server_encoding=False,
-            extra_headers=[])
+            extra_headers=[], **worker_options)
 
         worker_init = WorkerInit(
             worker_config=worker_config,
@@ -232,6 +820,146 @@ class CrawlerTest(unittest.TestCase):
         self.assertEqual(200, response.status)
         self.assertTrue(response.is_redirect)
 
+    def test_connection_pool(self):
+        import socket
+        (ip, port, httpd, _) = start_http_server(KeepAliveHTTPRequestHandler)
+        try:
+            pool = ConnectionPool(1, 5, socket.timeout)
+            url = "http://{0}:{1}/index.html".format(ip, port)
+            for _ in range(3):
+                response = open_url(
+                    pool.urlopen, get_url_request(), url, 5, socket.timeout)
+                self.assertEqual(200, response.status)
+                self.assertTrue(response.content.read())
+                response.content.close()
+
+            response = open_url(
+                pool.urlopen, get_url_request(),
+                url.replace("index", "does_not_exist"), 5, socket.timeout)
+            self.assertEqual(404, response.status)
+            pool.close()
+
+            self.assertEqual(1, pool.created)
+            self.assertEqual(3, pool.reused)
+        finally:
+            httpd.shutdown()
+
+    def test_connection_pool_head(self):
+        import socket
+        (ip, port, httpd, _) = start_http_server(KeepAliveHTTPRequestHandler)
+        try:
+            pool = ConnectionPool(1, 5, socket.timeout)
+            url = "http://{0}:{1}/index.html".format(ip, port)
+            for _ in range(3):
+                # The body of HEAD responses is never read.
+                response = open_url(
+                    pool.urlopen, get_url_request(), url, 5, socket.timeout,
+                    method="HEAD")
+                self.assertEqual(200, response.status)
+                response.content.close()
+            pool.close()
+
+            self.assertEqual(1, pool.created)
+            self.assertEqual(2, pool.reused)
+        finally:
+            httpd.shutdown()
+
+    def test_async_connection_pool(self):
+        if not has_asyncio():
+            return
+        import asyncio
+        from pylinkvalidator.asynccrawler import (
+            AsyncConnectionPool, async_open_url)
+        (ip, port, httpd, _) = start_http_server(KeepAliveHTTPRequestHandler)
+        try:
+            pool = AsyncConnectionPool(1, 5)
+            url = "http://{0}:{1}/index.html".format(ip, port)
+
+            loop = asyncio.new_event_loop()
+            try:
+                responses = [
+                    loop.run_until_complete(async_open_url(
+                        url.replace("index", page), 5, method=method,
+                        pool=pool))
+                    for (page, method) in [
+                        ("index", "GET"), ("index", "HEAD"),
+                        ("does_not_exist", "GET"), ("index", "GET")]]
+                pool.close()
+            finally:
+                loop.close()
+
+            self.assertEqual(
+                [200, 200, 404, 200],
+                [response.status for response in responses])
+            self.assertTrue(responses[-1].content.read())
+            # The server closes the connection after an error.
+            self.assertEqual(2, pool.created)
+            self.assertEqual(2, pool.reused)
+        finally:
+            httpd.shutdown()
+
+    def test_head_fallback(self):
+        (ip, port, httpd, _) = start_http_server(NoHeadHTTPRequestHandler)
+        try:
+            url_split = get_clean_url_split(
+                "http://{0}:{1}/sub/small_image.gif".format(ip, port))
+            worker_config = WorkerConfig(
+                types=['a'], timeout=5, parser=PARSER_STDLIB,
+                extra_headers=[], pool_size=1, pool_idle_timeout=5,
+                use_head=True)
+            page_crawler = PageCrawler(WorkerInit(
+                worker_config=worker_config, input_queue=None,
+                output_queue=None, logger=get_logger()))
+
+            page_crawl = page_crawler._crawl_page(
+                WorkerInput(url_split, False, 0, url_split.netloc))
+            self.assertEqual(200, page_crawl.status)
+            self.assertEqual(
+                [("HEAD", None), ("GET", "bytes=0-0")],
+                NoHeadHTTPRequestHandler.requests)
+
+            # Pages that will be crawled are always downloaded.
+            del NoHeadHTTPRequestHandler.requests[:]
+            page_crawl = page_crawler._crawl_page(
+                WorkerInput(url_split, True, 0, url_split.netloc))
+            self.assertEqual(200, page_crawl.status)
+            self.assertEqual(
+                [("GET", None)], NoHeadHTTPRequestHandler.requests)
+        finally:
+            httpd.shutdown()
+
+    def test_head_fallback_async(self):
+        if not has_asyncio():
+            return
+        import asyncio
+        from pylinkvalidator.asynccrawler import AsyncPageCrawler
+        (ip, port, httpd, _) = start_http_server(NoHeadHTTPRequestHandler)
+        try:
+            del NoHeadHTTPRequestHandler.requests[:]
+            url_split = get_clean_url_split(
+                "http://{0}:{1}/sub/small_image.gif".format(ip, port))
+            worker_config = WorkerConfig(
+                types=['a'], timeout=5, parser=PARSER_STDLIB,
+                extra_headers=[], use_head=True)
+            page_crawler = AsyncPageCrawler(WorkerInit(
+                worker_config=worker_config, logger=get_logger()))
+
+            loop = asyncio.new_event_loop()
+            try:
+                response = loop.run_until_complete(
+                    page_crawler._open_page_async(
+                        WorkerInput(url_split, False, 0, url_split.netloc)))
+            finally:
+                loop.close()
+            self.assertEqual(200, response.status)
+            self.assertEqual(
+                [("HEAD", None), ("GET", "bytes=0-0")],
+                NoHeadHTTPRequestHandler.requests)
+            # The server ignored the range: the body is not downloaded.
+            self.assertEqual(b"", response.content.read())
+        finally:
+            httpd.shutdown()
+
     def test_crawl_page(self):
         page_crawler, url_split = self.get_page_crawler("/index.html")
         page_crawl = page_crawler._crawl_page(
@@ -254,6 +982,98 @@ class CrawlerTest(unittest.TestCase):
         self.assertEqual(1, len(script_links))
         self.assertEqual(1, len(link_links))
 
+    def test_link_extractor(self):
+        for url in ("/index.html", "/alone.html"):
+            page_crawler, url_split = self.get_page_crawler(
+                url, link_extractor="soup", show_source=True)
+            worker_input = WorkerInput(url_split, True, 0, url_split.netloc)
+            expected_links = [
+                (link.type, link.url_split, get_source_attributes(link))
+                for link in page_crawler._crawl_page(worker_input).links]
+
+            parsers = [PARSER_STDLIB]
+            if has_lxml():
+                parsers.append("lxml")
+            for parser in parsers:
+                page_crawler, url_split = self.get_page_crawler(
+                    url, link_extractor="auto", show_source=True)
+                page_crawler.worker_config =\
+                    page_crawler.worker_config._replace(parser=parser)
+                page_crawl = page_crawler._crawl_page(worker_input)
+                # Sources have the same format with all extractors.
+                self.assertEqual(
+                    expected_links,
+                    [(link.type, link.url_split, get_source_attributes(link))
+                     for link in page_crawl.links])
+
+    def test_link_extractor_attributes(self):
+        page_crawler, url_split = self.get_page_crawler(
+            "/index.html", show_source=True)
+        for html in [
+                '<html><body><a href="a.html"></a>'
+                '<base href="http://www.example.com/sub/"></body></html>',
+                '<html><body><a href>empty</a></body></html>',
+                '<html><body><a href="a.html" href="b.html"></a>'
+                '<img src="c.gif" alt="c" src="d.gif"></body></html>']:
+            expected_links = page_crawler.get_links(
+                BeautifulSoup(html, PARSER_STDLIB), url_split)
+            links = page_crawler.extract_links(html, url_split)
+            self.assertTrue(links)
+            self.assertEqual(
+                [(link.type, link.url_split, link.source_str)
+                 for link in expected_links],
+                [(link.type, link.url_split, link.source_str)
+                 for link in links])
+
+    def test_source_str(self):
+        for link_extractor in ("soup", "auto"):
+            page_crawler, url_split = self.get_page_crawler(
+                "/index.html", link_extractor=link_extractor)
+            worker_input = WorkerInput(url_split, True, 0, url_split.netloc)
+            page_crawl = page_crawler._crawl_page(worker_input)
+            self.assertTrue(page_crawl.links)
+            self.assertTrue(
+                all(link.source_str is None for link in page_crawl.links))
+
+            page_crawler, url_split = self.get_page_crawler(
+                "/index.html", link_extractor=link_extractor,
+                show_source=True)
+            page_crawl = page_crawler._crawl_page(worker_input)
+            sources = [link.source_str for link in page_crawl.links
+                       if link.type == "a"]
+            # Only the start tag is kept.
+            self.assertEqual('<a href="a.html">', sources[0])
+
+    def test_stream_links(self):
+        page_crawler, url_split = self.get_page_crawler("/index.html")
+        page_crawl = page_crawler._crawl_page(
+            WorkerInput(url_split, True, 0, url_split.netloc))
+        expected_urls = sorted(
+            link.url_split.geturl() for link in page_crawl.links)
+
+        page_crawler, url_split = self.get_page_crawler(
+            "/index.html", stream_links=True)
+        chunk_size = crawler_module.STREAM_CHUNK_SIZE
+        crawler_module.STREAM_CHUNK_SIZE = 100
+        try:
+            page_crawl = page_crawler._crawl_page(
+                WorkerInput(url_split, True, 0, url_split.netloc))
+        finally:
+            crawler_module.STREAM_CHUNK_SIZE = chunk_size
+
+        self.assertEqual(200, page_crawl.status)
+        self.assertTrue(page_crawl.is_html)
+        links = []
+        while not page_crawler.output_queue.empty():
+            link_batch = page_crawler.output_queue.get()
+            self.assertEqual(url_split, link_batch.original_url_split)
+            links.extend(link_batch.links)
+        # Links were sent before the end of the page.
+        self.assertTrue(links)
+        links.extend(page_crawl.links)
+        self.assertEqual(
+            expected_urls, sorted(link.url_split.geturl() for link in links))
+
     def test_crawl_resource(self):
         page_crawler, url_split = self.get_page_crawler("/sub/small_image.gif")
         page_crawl = page_crawler._crawl_page(
@@ -276,6 +1096,45 @@ class CrawlerTest(unittest.TestCase):
             'http://www.example.com/test.html',
             page_crawl.links[0].url_split.geturl())
 
+    def test_get_links_order(self):
+        page_crawler, url_split = self.get_page_crawler(
+            "/index.html", link_extractor="soup")
+        page_crawler.worker_config = page_crawler.worker_config._replace(
+            types=['script', 'a', 'img'])
+        page_crawl = page_crawler._crawl_page(
+            WorkerInput(url_split, True, 0, url_split.netloc))
+
+        self.assertEqual(
+            ['script'] + ['a'] * 5 + ['img'],
+            [link.type for link in page_crawl.links])
+
+    def test_url_canonicalization(self):
+        site = self._run_crawler_plain(
+            ThreadSiteCrawler,
+            ["--sort-query", "--ignore-query-params=utm_*"],
+            "/fragments.html")
+        self.assertEqual(
+            sorted([self.get_url("/fragments.html"), self.get_url("/a.html"),
+                    self.get_url("/c.html?a=1&b=2")]),
+            sorted(url_split.geturl() for url_split in site.pages))
+
+        page = site.pages[get_clean_url_split(self.get_url("/a.html"))]
+        self.assertEqual(
+            [get_clean_url_split(self.get_url("/fragments.html"))] * 2,
+            [source.origin for source in page.sources])
+        self.assertEqual(
+            [self.get_url("/a.html#top"), self.get_url("/a.html#bottom")],
+            [source.href for source in page.sources])
+        page = site.pages[
+            get_clean_url_split(self.get_url("/c.html?a=1&b=2"))]
+        self.assertEqual(
+            [self.get_url("/c.html?b=2&a=1&utm_source=test"), None],
+            [source.href for source in page.sources])
+
+        site = self._run_crawler_plain(
+            ThreadSiteCrawler, ["--keep-fragments"], "/fragments.html")
+        self.assertEqual(5, len(site.pages))
+
     def test_crawl_404(self):
         page_crawler, url_split = self.get_page_crawler(
             "/sub/small_image_bad.gif")
@@ -325,6 +1184,97 @@ class CrawlerTest(unittest.TestCase):
         self.assertEqual(11, len(site.pages))
         self.assertEqual(1, len(site.error_pages))
 
+    def test_site_sqlite_storage(self):
+        site = self._run_crawler_plain(ThreadSiteCrawler, ["--storage=sqlite"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(1, len(site.error_pages))
+
+        # The storage is closed and the reported URLs are kept in memory.
+        self.assertTrue(site.storage.connection is None)
+        self.assertTrue(site.storage.temp_dir is None)
+        self.assertTrue(isinstance(site.urls, FrozenURLTable))
+        error_page = list(site.error_pages.values())[0]
+        self.assertTrue(error_page.url_split.path.endswith(".html"))
+        self.assertEqual(
+            ["/f.html"],
+            [source.origin.path for source in error_page.sources])
+
+    def test_site_errors_only(self):
+        expected_site = self._run_crawler_plain(ThreadSiteCrawler)
+        (error_url_split, expected_page) = list(
+            expected_site.error_pages.items())[0]
+
+        for storage in ["memory", "bloom"]:
+            site = self._run_crawler_plain(
+                ThreadSiteCrawler,
+                ["--retention=errors", "--storage=" + storage])
+            self.assertEqual(11, site.page_count)
+            self.assertEqual(1, len(site.pages))
+            self.assertEqual(1, len(site.error_pages))
+            self.assertEqual(
+                [source.origin for source in expected_page.sources],
+                [source.origin for source in
+                 site.error_pages[error_url_split].sources])
+            self.assertAlmostEqual(
+                expected_site.get_average_response_time(),
+                site.get_average_response_time(), 1)
+
+    def test_site_sources(self):
+        expected_site = self._run_crawler_plain(ThreadSiteCrawler)
+        expected_counts = dict(
+            (url_split, len(page.sources))
+            for url_split, page in expected_site.pages.items())
+        self.assertTrue(max(expected_counts.values()) > 1)
+
+        for (mode, max_sources, storage) in [
+                ("first", 1, "memory"), ("unique", None, "memory"),
+                ("count", 0, "memory"), ("first", 1, "sqlite"),
+                ("count", 0, "sqlite")]:
+            site = self._run_crawler_plain(
+                ThreadSiteCrawler,
+                ["--sources=" + mode, "--max-sources=1",
+                 "--storage=" + storage])
+            for url_split, page in site.pages.items():
+                expected_count = expected_counts[url_split]
+                self.assertEqual(expected_count, page.source_count)
+                origins = [source.origin for source in page.sources]
+                if max_sources is None:
+                    self.assertEqual(len(set(origins)), len(origins))
+                else:
+                    self.assertTrue(len(origins) <= max_sources)
+                self.assertEqual(
+                    expected_count - len(origins), page.dropped_source_count)
+
+    def test_site_fingerprint_storage(self):
+        for storage in ["fingerprint", "bloom"]:
+            site = self._run_crawler_plain(
+                ThreadSiteCrawler, ["--storage=" + storage])
+            self.assertEqual(11, len(site.pages))
+            self.assertEqual(1, len(site.error_pages))
+            self.assertTrue(site.get_seen_error_rate() < 0.001)
+
+    def test_site_fingerprint_errors_only(self):
+        # Only the origins of the sources that are kept have a URL.
+        site = self._run_crawler_plain(
+            ThreadSiteCrawler,
+            ["--storage=fingerprint", "--retention=errors",
+             "--sources=unique"])
+        self.assertEqual(11, site.page_count)
+        self.assertEqual(1, len(site.error_pages))
+        self.assertTrue(len(site.urls) < 11)
+        error_page = list(site.error_pages.values())[0]
+        self.assertEqual(
+            ["/f.html"],
+            [source.origin.path for source in error_page.sources])
+
+        # Only the URL of the error page is kept.
+        site = self._run_crawler_plain(
+            ThreadSiteCrawler,
+            ["--storage=fingerprint", "--retention=errors",
+             "--sources=count"])
+        self.assertEqual(1, len(site.error_pages))
+        self.assertEqual(1, len(site.urls))
+
     def test_site_process_crawler_plain(self):
         if not has_multiprocessing():
             return
@@ -332,6 +1282,257 @@ class CrawlerTest(unittest.TestCase):
         self.assertEqual(11, len(site.pages))
         self.assertEqual(1, len(site.error_pages))
 
+    def test_site_process_crawler_batch(self):
+        if not has_multiprocessing():
+            return
+        site = self._run_crawler_plain(
+            ProcessSiteCrawler, ["--workers", "2", "--batch-size", "3"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(1, len(site.error_pages))
+
+    def test_site_hybrid_crawler_plain(self):
+        if not has_multiprocessing():
+            return
+        site = self._run_crawler_plain(
+            HybridSiteCrawler,
+            ["--workers", "2", "--threads-per-process", "3"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(1, len(site.error_pages))
+
+    def test_site_thread_crawler_parse_workers(self):
+        if not has_multiprocessing() or sys.version_info[0] < 3:
+            return
+        site = self._run_crawler_plain(
+            ThreadSiteCrawler,
+            ["--mode", "thread", "--workers", "4", "--parse-workers", "2",
+             "--check-absence-once",
+             "/a.html,<p class=\"test1\">regex:Hello</p>"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(2, len(site.error_pages))
+
+    def test_parse_pool_error(self):
+        if not has_multiprocessing() or sys.version_info[0] < 3:
+            return
+        import multiprocessing
+        page_crawler, url_split = self.get_page_crawler("/index.html")
+        page_crawler.parse_pool = multiprocessing.Pool(1)
+        try:
+            # The site origin cannot be pickled: the page is never parsed.
+            worker_input = WorkerInput(url_split, True, 0, lambda: None)
+            self.assertEqual(
+                None, page_crawler._crawl_or_send_page(worker_input))
+            page_crawl = page_crawler.output_queue.get(timeout=5)
+        finally:
+            page_crawler.parse_pool.terminate()
+
+        self.assertEqual(url_split, page_crawl.original_url_split)
+        self.assertTrue(page_crawl.exception is not None)
+
+    def test_site_async_crawler_parse_workers(self):
+        if not has_asyncio() or not has_multiprocessing():
+            return
+        from pylinkvalidator.asynccrawler import AsyncSiteCrawler
+        site = self._run_crawler_plain(
+            AsyncSiteCrawler,
+            ["--mode", "async", "--workers", "10", "--parse-workers", "2"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(1, len(site.error_pages))
+
+    def test_site_async_crawler_plain(self):
+        if not has_asyncio():
+            return
+        from pylinkvalidator.asynccrawler import AsyncSiteCrawler
+        site = self._run_crawler_plain(AsyncSiteCrawler, ["--workers", "10"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(1, len(site.error_pages))
+
+    def test_frontier_order(self):
+        depths = []
+
+        class OrderSiteCrawler(ThreadSiteCrawler):
+            def progress(self, page_crawl, done_size, queue_size):
+                depths.append(page_crawl.depth)
+
+        site = self._run_crawler_plain(
+            OrderSiteCrawler, ["--mode", "thread", "--workers", "1",
+                               "--frontier-order", "crawl-first"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(1, len(site.error_pages))
+
+        # A single worker crawls the pages in the order of the frontier,
+        # breadth-first.
+        self.assertEqual(len(site.pages), len(depths))
+        self.assertEqual(sorted(depths), depths)
+        self.assertTrue(depths[-1] > 1)
+
+    def test_host_limit(self):
+        crawlers = [(ThreadSiteCrawler, ["--mode", "thread"])]
+        if has_asyncio():
+            from pylinkvalidator.asynccrawler import AsyncSiteCrawler
+            crawlers.append((AsyncSiteCrawler, ["--mode", "async"]))
+
+        for crawler_class, options in crawlers:
+            start = time.time()
+            start_cpu = sum(os.times()[:2])
+            site = self._run_crawler_plain(
+                crawler_class,
+                options + ["--workers", "4", "--host-concurrency", "1",
+                           "--host-rate", "20"])
+            elapsed = time.time() - start
+            elapsed_cpu = sum(os.times()[:2]) - start_cpu
+            self.assertEqual(11, len(site.pages))
+            self.assertEqual(1, len(site.error_pages))
+
+            # 12 requests at 20 requests per second.
+            self.assertTrue(elapsed > 0.5)
+            # The orchestrator sleeps while it waits for a token.
+            self.assertTrue(elapsed_cpu < elapsed / 2)
+
+    def test_wait_delay(self):
+        sys.argv = ['pylinkvalidator', "-m", "thread", "--workers", "1",
+                    "--host-rate", "1000", self.get_url("/index.html")]
+        config = Config()
+        config.parse_cli_config()
+        crawler = ThreadSiteCrawler(config, get_logger())
+        for worker_input in crawler.get_start_worker_inputs():
+            crawler.frontier.put(worker_input)
+        time.sleep(0.01)
+
+        # A token is ready: the orchestrator must not poll its queue.
+        self.assertTrue(crawler.get_wait_delay() > 0)
+
+        # Dispatch is capped: only a worker message can unblock it.
+        crawler.in_flight = crawler.max_in_flight
+        self.assertTrue(crawler.get_wait_delay() is None)
+
+    def test_adaptive_workers(self):
+        (interval, samples) = (
+            autoscale.ADJUST_INTERVAL, autoscale.MIN_SAMPLES)
+        autoscale.ADJUST_INTERVAL = 0
+        autoscale.MIN_SAMPLES = 1
+        worker_counts = []
+
+        class AutoscaleThreadSiteCrawler(ThreadSiteCrawler):
+            def autoscale(self):
+                ThreadSiteCrawler.autoscale(self)
+                worker_counts.append(self.worker_count)
+
+        class AutoscaleHybridSiteCrawler(HybridSiteCrawler):
+            def autoscale(self):
+                HybridSiteCrawler.autoscale(self)
+                worker_counts.append(self.worker_count)
+
+        try:
+            site = self._run_crawler_plain(
+                AutoscaleThreadSiteCrawler,
+                ["--mode", "thread", "--adaptive", "--workers", "1",
+                 "--max-workers", "4"])
+            self.assertEqual(11, len(site.pages))
+            self.assertEqual(1, len(site.error_pages))
+            # URLs are waiting in the frontier after the first page.
+            self.assertEqual(2, worker_counts[0])
+            self.assertTrue(max(worker_counts) <= 4)
+            self.assertTrue(min(worker_counts) >= 1)
+
+            if has_multiprocessing():
+                del worker_counts[:]
+                site = self._run_crawler_plain(
+                    AutoscaleHybridSiteCrawler,
+                    ["--mode", "hybrid", "--adaptive", "--workers", "1",
+                     "--max-workers", "2", "--threads-per-process", "2"])
+                self.assertEqual(11, len(site.pages))
+                self.assertEqual(1, len(site.error_pages))
+                self.assertEqual(2, worker_counts[0])
+                self.assertTrue(max(worker_counts) <= 2)
+        finally:
+            autoscale.ADJUST_INTERVAL = interval
+            autoscale.MIN_SAMPLES = samples
+
+    def test_join_stopped_workers(self):
+        if not has_multiprocessing():
+            return
+        sys.argv = ['pylinkvalidator', '-m', 'process', '--workers', '2',
+                    self.get_url("/index.html")]
+        config = Config()
+        config.parse_cli_config()
+        site_crawler = ProcessSiteCrawler(config, get_logger())
+        site_crawler.workers = site_crawler.get_workers(
+            config, WorkerInit(
+                config.worker_config, site_crawler.input_queue,
+                site_crawler.output_queue, None, None, None))
+        site_crawler.start_workers(
+            site_crawler.workers, site_crawler.input_queue,
+            site_crawler.output_queue)
+        workers = list(site_crawler.workers)
+        try:
+            site_crawler.retire_workers(1)
+            deadline = time.time() + 5
+            while all(worker.is_alive() for worker in workers) and\
+                    time.time() < deadline:
+                time.sleep(0.05)
+            site_crawler.join_stopped_workers()
+            self.assertEqual(1, len(site_crawler.workers))
+            stopped_worker = [
+                worker for worker in workers
+                if worker not in site_crawler.workers][0]
+            self.assertEqual(0, stopped_worker.exitcode)
+        finally:
+            site_crawler.stop_workers(
+                site_crawler.workers, site_crawler.input_queue,
+                site_crawler.output_queue)
+            for worker in site_crawler.workers:
+                worker.join(5)
+
+    def test_site_crawler_stream_links(self):
+        chunk_size = crawler_module.STREAM_CHUNK_SIZE
+        crawler_module.STREAM_CHUNK_SIZE = 100
+        try:
+            site = self._run_crawler_plain(
+                ThreadSiteCrawler,
+                ["--mode", "thread", "--workers", "2", "--stream-links"])
+            self.assertEqual(11, len(site.pages))
+            self.assertEqual(1, len(site.error_pages))
+
+            if has_multiprocessing():
+                site = self._run_crawler_plain(
+                    ProcessSiteCrawler, ["--workers", "2", "--stream-links"])
+                self.assertEqual(11, len(site.pages))
+                self.assertEqual(1, len(site.error_pages))
+        finally:
+            crawler_module.STREAM_CHUNK_SIZE = chunk_size
+
+    def test_parser_auto(self):
+        crawlers = []
+
+        class ParserSiteCrawler(ThreadSiteCrawler):
+            def crawl(self):
+                crawlers.append(self)
+                return ThreadSiteCrawler.crawl(self)
+
+        site = self._run_crawler_plain(
+            ParserSiteCrawler, ["--workers", "2", "--parser", "auto"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(1, len(site.error_pages))
+
+        # The workers use the selected parser.
+        parser = crawlers[0].config.worker_config.parser
+        self.assertTrue(parser in benchmark.get_available_parsers())
+        self.assertEqual(parser, crawlers[0].worker_init.worker_config.parser)
+
+    def test_use_head(self):
+        site = self._run_crawler_plain(
+            ThreadSiteCrawler, ["--run-once", "--use-head"])
+        self.assertEqual(8, len(site.pages))
+        self.assertEqual(0, len(site.error_pages))
+
+        if has_asyncio():
+            from pylinkvalidator.asynccrawler import AsyncSiteCrawler
+            site = self._run_crawler_plain(
+                AsyncSiteCrawler,
+                ["--run-once", "--use-head", "--workers", "10"])
+            self.assertEqual(8, len(site.pages))
+            self.assertEqual(0, len(site.error_pages))
+
     def test_run_once(self):
         site = self._run_crawler_plain(ThreadSiteCrawler, ["--run-once"])
 
@@ -385,6 +1586,32 @@ class CrawlerTest(unittest.TestCase):
         self.assertEqual(11, len(site.pages))
         self.assertEqual(2, len(site.error_pages))
 
+    def test_content_check_link_strainer(self):
+        # Text checks do not read the partial tree built with a strainer.
+        site = self._run_crawler_plain(
+            ThreadSiteCrawler,
+            ["--mode", "thread", "--link-extractor", "soup",
+             "--check-presence-once", "/a.html,Hello World"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(1, len(site.error_pages))
+
+        site = self._run_crawler_plain(
+            ThreadSiteCrawler,
+            ["--mode", "thread", "--link-extractor", "soup",
+             "--check-absence-once", "/a.html,Hello World"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(2, len(site.error_pages))
+
+    def test_content_check_process(self):
+        if not has_multiprocessing():
+            return
+        site = self._run_crawler_plain(
+            ProcessSiteCrawler,
+            ["--workers", "2", "--check-absence-once",
+             "/a.html,<p class=\"test1\">regex:Hello</p>"])
+        self.assertEqual(11, len(site.pages))
+        self.assertEqual(2, len(site.error_pages))
+
     def test_url_file_path(self):
         (_, temp_file_path) = mkstemp()
         url = self.get_url("/index.html")
@@ -4,15 +4,25 @@ Contains the crawling logic.
 """
 from __future__ import unicode_literals, absolute_import
 
+import fnmatch
+import hashlib
 import re
+import struct
 
-from pylinkvalidator.compat import urlparse, quote
+from pylinkvalidator.compat import urlparse, quote, OrderedDict, Mapping
 
 
 SCHEME_HTTP = "http"
 SCHEME_HTTPS = "https"
 SUPPORTED_SCHEMES = (SCHEME_HTTP, SCHEME_HTTPS)
 
+DEFAULT_URL_CACHE_SIZE = 10000
+
+IDNA_CACHE_SIZE = 1000
+
+_idna_cache = {}
+"""Map of netloc:idna encoded netloc"""
+
 
 NOT_LINK = [
     'data',
@@ -53,19 +63,44 @@ def get_clean_url_split(url):
 def convert_iri_to_uri(url_split):
     """Attempts to convert potential IRI to URI.
 
-    IRI may contain non-ascii characters.
+    IRI may contain non-ascii characters. URLs that only contain ascii
+    characters are returned as is.
     """
+    if all(is_ascii(part) for part in url_split):
+        return url_split
+
     new_parts = []
     for i, part in enumerate(url_split):
         if i == 1:
             # domain name
-            new_parts.append(part.encode('idna').decode('ascii'))
+            new_parts.append(encode_idna(part))
         else:
             # other parts such as path or query string.
             new_parts.append(url_encode_non_ascii(part))
     return urlparse.SplitResult(*new_parts)
 
 
+def is_ascii(value):
+    """Returns True if the string only contains ascii characters."""
+    try:
+        value.encode("ascii")
+    except UnicodeError:
+        return False
+    return True
+
+
+def encode_idna(netloc):
+    """Returns the ascii version of an internationalized domain name. Results
+    are cached because the same domains are found in most links."""
+    encoded_netloc = _idna_cache.get(netloc)
+    if encoded_netloc is None:
+        encoded_netloc = netloc.encode('idna').decode('ascii')
+        if len(_idna_cache) >= IDNA_CACHE_SIZE:
+            _idna_cache.clear()
+        _idna_cache[netloc] = encoded_netloc
+    return encoded_netloc
+
+
 def url_encode_non_ascii(url_part):
     """For each byte in url_part, if the byte is outside ascii range, quote the
     byte. UTF characters that take two bytes will be correctly converted using
@@ -95,6 +130,325 @@ def get_absolute_url_split(url, base_url_split):
     return get_clean_url_split(new_url)
 
 
+class URLCache(object):
+    """Bounded LRU cache of the SplitResults returned by get_clean_url_split
+    and get_absolute_url_split.
+
+    Navigation links are found on most pages of a site so their URLs are only
+    normalized once. The cache is disabled if size is 0 or on Python 2.6.
+
+    This class is NOT thread-safe: each worker must have its own cache.
+    """
+
+    def __init__(self, size=DEFAULT_URL_CACHE_SIZE):
+        self.size = size
+        self.cache = None
+        if size > 0 and OrderedDict is not None:
+            self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_clean_url_split(self, url):
+        """Cached version of get_clean_url_split."""
+        return self._get(url, get_clean_url_split, url)
+
+    def get_absolute_url_split(self, url, base_url_split):
+        """Cached version of get_absolute_url_split."""
+        return self._get(
+            (base_url_split, url), get_absolute_url_split, url,
+            base_url_split)
+
+    def _get(self, key, function, *args):
+        if self.cache is None:
+            self.misses += 1
+            return function(*args)
+
+        try:
+            # Reinserted below to become the most recently used key.
+            value = self.cache.pop(key)
+            self.hits += 1
+        except KeyError:
+            value = function(*args)
+            self.misses += 1
+            if len(self.cache) >= self.size:
+                self.cache.popitem(last=False)
+        self.cache[key] = value
+        return value
+
+
+def get_url_fingerprint(url):
+    """Returns a 64-bit fingerprint of a URL. The fingerprint is never 0."""
+    digest = hashlib.md5(url.encode("utf-8")).digest()
+    return struct.unpack(str("<Q"), digest[:8])[0] or 1
+
+
+class URLTable(object):
+    """Assigns a dense integer ID to each URL.
+
+    Each URL is stored once as a string instead of a SplitResult (a tuple of
+    five strings) and SplitResults are only rebuilt when they are requested,
+    e.g., for reporting.
+
+    This class is NOT thread-safe and should only be accessed by the
+    orchestrator.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        """Map of url:ID"""
+
+        self.urls = []
+        """URL of each ID"""
+
+    def __len__(self):
+        return len(self.urls)
+
+    def get_id(self, url_split):
+        """Returns the ID of the url split. A new ID is assigned if the URL
+        was never seen before."""
+        url = url_split.geturl()
+        url_id = self.ids.get(url)
+        if url_id is None:
+            url_id = len(self.urls)
+            self.urls.append(url)
+            self.ids[url] = url_id
+        return url_id
+
+    def find_id(self, url_split):
+        """Returns the ID of the url split or None if it was never seen
+        before."""
+        return self.ids.get(url_split.geturl())
+
+    def add(self, url_split):
+        """Returns the ID of the url split and keeps the URL so
+        get_url_split can rebuild it. All URLs are kept by this table."""
+        return self.get_id(url_split)
+
+    def get_url_split(self, url_id):
+        """Returns a SplitResult of the URL with this ID."""
+        return urlparse.urlsplit(self.urls[url_id])
+
+
+class FingerprintURLTable(object):
+    """URL table whose IDs are the 64-bit fingerprints of the URLs.
+
+    URLs are only kept when they are added with add (e.g., the URLs of the
+    pages that can be reported) and find_id returns the fingerprint of any
+    URL. Two URLs with the same fingerprint share the same ID.
+    """
+
+    def __init__(self):
+        self.urls = {}
+        """Map of fingerprint:url"""
+
+    def __len__(self):
+        return len(self.urls)
+
+    def get_id(self, url_split):
+        return get_url_fingerprint(url_split.geturl())
+
+    def find_id(self, url_split):
+        return self.get_id(url_split)
+
+    def add(self, url_split):
+        url = url_split.geturl()
+        url_id = get_url_fingerprint(url)
+        self.urls[url_id] = url
+        return url_id
+
+    def get_url_split(self, url_id):
+        return urlparse.urlsplit(self.urls[url_id])
+
+
+class FrozenURLTable(object):
+    """Read-only URL table holding some of the URLs of another table with
+    the same IDs, e.g., the URLs needed for reporting once the storage of a
+    crawl is closed."""
+
+    def __init__(self, urls):
+        self.urls = urls
+        """Map of url ID:url"""
+
+        self.ids = dict((url, url_id) for url_id, url in urls.items())
+
+    def __len__(self):
+        return len(self.urls)
+
+    def find_id(self, url_split):
+        return self.ids.get(url_split.geturl())
+
+    def get_url_split(self, url_id):
+        return urlparse.urlsplit(self.urls[url_id])
+
+
+class URLMapping(Mapping):
+    """Read-only view of a map of URL ID:value with SplitResult keys."""
+
+    def __init__(self, url_table, values):
+        self.url_table = url_table
+        self.values_by_id = values
+
+    def __getitem__(self, url_split):
+        url_id = self.url_table.find_id(url_split)
+        if url_id is None:
+            raise KeyError(url_split)
+        return self.values_by_id[url_id]
+
+    def __iter__(self):
+        for url_id in self.values_by_id:
+            yield self.url_table.get_url_split(url_id)
+
+    def __len__(self):
+        return len(self.values_by_id)
+
+
+_END = None
+"""Key marking the end of a prefix or of a host in a trie node. It cannot
+collide with characters or labels."""
+
+
+class PrefixMatcher(object):
+    """Matches URLs starting with one of the prefixes.
+
+    The prefixes are stored in a character trie so a lookup only walks the
+    characters of the URL once, whatever the number of prefixes.
+    """
+
+    def __init__(self, prefixes=()):
+        self.root = {}
+        self.prefixes = []
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def add(self, prefix):
+        self.prefixes.append(prefix)
+        node = self.root
+        for char in prefix:
+            node = node.setdefault(char, {})
+        node[_END] = True
+
+    def __len__(self):
+        return len(self.prefixes)
+
+    def __iter__(self):
+        return iter(self.prefixes)
+
+    def match(self, url):
+        """Returns True if the url starts with one of the prefixes."""
+        node = self.root
+        if _END in node:
+            # Empty prefix
+            return True
+        for char in url:
+            node = node.get(char)
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+
+class HostMatcher(object):
+    """Set of netlocs that also accepts wildcard patterns.
+
+    A pattern such as *.example.com matches all the subdomains of example.com
+    (but not example.com itself) on any port, regardless of case. Patterns
+    are stored in a trie of reversed labels so a lookup only walks the labels
+    of the netloc once.
+    """
+
+    def __init__(self, hosts=()):
+        self.hosts = set()
+        self.patterns = []
+        self.root = {}
+        for host in hosts:
+            self.add(host)
+
+    def add(self, host):
+        if not host.startswith("*."):
+            self.hosts.add(host)
+            return
+
+        self.patterns.append(host)
+        node = self.root
+        for label in reversed(host[2:].lower().split(".")):
+            node = node.setdefault(label, {})
+        node[_END] = True
+
+    def __len__(self):
+        return len(self.hosts) + len(self.patterns)
+
+    def __iter__(self):
+        for host in self.hosts:
+            yield host
+        for pattern in self.patterns:
+            yield pattern
+
+    def __contains__(self, netloc):
+        if netloc in self.hosts:
+            return True
+        if not self.patterns:
+            return False
+
+        node = self.root
+        host = netloc.rsplit("@", 1)[-1].lower()
+        if not host.endswith("]"):
+            # Strips the port unless the host is an IPv6 address without one.
+            host = host.rsplit(":", 1)[0]
+        labels = host.split(".")
+        # The first label is matched by the wildcard.
+        for index in range(len(labels) - 1, 0, -1):
+            node = node.get(labels[index])
+            if node is None:
+                return False
+            if _END in node:
+                return True
+        return False
+
+
+class URLCanonicalizer(object):
+    """Returns a canonical SplitResult so URLs that lead to the same resource
+    are only fetched once.
+
+    Fragments are removed unless keep_fragments is True, query parameters
+    matching one of the ignored_params patterns (e.g., utm_*) are removed, and
+    query parameters are sorted by name if sort_query is True. Parameters with
+    the same name keep their order: servers may read them as a list.
+    """
+
+    def __init__(self, keep_fragments=False, sort_query=False,
+                 ignored_params=None):
+        self.keep_fragments = keep_fragments
+        self.sort_query = sort_query
+        self.ignored_params_re = None
+        if ignored_params:
+            self.ignored_params_re = re.compile("|".join(
+                "(?:{0})".format(fnmatch.translate(pattern))
+                for pattern in ignored_params))
+
+    def canonicalize(self, url_split):
+        """Returns the canonical url split or url_split itself if it is
+        already canonical."""
+        fragment = url_split.fragment
+        if not self.keep_fragments:
+            fragment = ""
+
+        query = url_split.query
+        if query and (self.sort_query or self.ignored_params_re):
+            params = query.split("&")
+            if self.ignored_params_re:
+                params = [
+                    param for param in params if not
+                    self.ignored_params_re.match(param.split("=", 1)[0])]
+            if self.sort_query:
+                params.sort(key=lambda param: param.split("=", 1)[0])
+            query = "&".join(params)
+
+        if fragment == url_split.fragment and query == url_split.query:
+            return url_split
+        return url_split._replace(query=query, fragment=fragment)
+
+
 def is_similar_url_split(url_split_1, url_split_2):
     """Returns True if the two url split shares
     the same path and netloc.